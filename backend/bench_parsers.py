@@ -0,0 +1,94 @@
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from html_parser import available_backends, parse_html
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PAGES = [
+    os.path.join(ROOT, "html_lego_star_wars", "*.html"),
+    os.path.join(ROOT, "server", "google_shopping_debug.html"),
+]
+
+
+def load_pages(patterns: list[str]) -> list[str]:
+    pages = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                pages.append(f.read())
+    return pages
+
+
+def workload(root):
+    """What the pipeline does with a page: SERP cards plus typical product-page lookups."""
+    root.select('.rwVHAc, .ropLT')
+    title = root.select_one('title')
+    if title:
+        title.get_text(strip=True)
+    for meta in root.select('meta[property^="og:"]'):
+        meta.get("content")
+    for link in root.select('a[href]')[:200]:
+        link.get("href")
+    h1 = root.select_one('h1')
+    if h1:
+        h1.get_text(strip=True)
+
+
+def run_worker(backend: str, patterns: list[str], rounds: int) -> dict:
+    """Benchmark one backend in this process (run in a fresh subprocess per backend)."""
+    pages = load_pages(patterns)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for html in pages:
+            workload(parse_html(html, backend))
+    elapsed = time.perf_counter() - started
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    parsed = len(pages) * rounds
+    return {
+        "backend": backend,
+        "pages": parsed,
+        "megabytes": round(sum(len(p) for p in pages) * rounds / 1e6, 1),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(parsed / elapsed, 1) if elapsed else 0.0,
+        # ru_maxrss is in KB on Linux; growth over the loaded corpus is the parser's peak
+        "peak_rss_mb": round(rss_after / 1024, 1),
+        "parse_peak_mb": round((rss_after - rss_before) / 1024, 1),
+    }
+
+
+def main():
+    args = sys.argv[1:]
+    rounds = 3
+    if "--rounds" in args:
+        i = args.index("--rounds")
+        rounds = int(args[i + 1])
+        del args[i:i + 2]
+
+    if args and args[0] == "--worker":
+        print(json.dumps(run_worker(args[1], args[2:] or DEFAULT_PAGES, rounds)))
+        return
+
+    patterns = args or DEFAULT_PAGES
+    print(f"Benchmarking {', '.join(available_backends())} over {len(load_pages(patterns))} pages x {rounds} rounds\n")
+    print(f"{'backend':<12}{'pages/sec':>12}{'MB/sec':>10}{'peak RSS MB':>14}{'parse peak MB':>16}")
+
+    for backend in available_backends():
+        # Fresh process per backend so peak memory isn't shared between them
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", backend, "--rounds", str(rounds), *patterns],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{r['backend']:<12}{r['pages_per_sec']:>12}{r['megabytes'] / r['seconds']:>10.1f}{r['peak_rss_mb']:>14}{r['parse_peak_mb']:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+End-to-end pipeline benchmark on recorded traffic.
+
+    python bench_pipeline.py record "rochie lunga rosie" ["casti wireless" ...] [--country RO] [--cassette PATH]
+        Runs each search live (Google, merchants, OpenAI) and records everything it fetched.
+
+    python bench_pipeline.py replay [--cassette PATH] [--runs 5] [--scale 1.0] [--warm] [--json OUT]
+        Reruns the recorded searches through run_search_task with no network, sleeping
+        for the recorded latencies, and reports per-stage and end-to-end percentiles.
+"""
+import inspect
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import config
+import recorder
+from deadlines import percentile
+from llm_metrics import llm_metrics
+
+
+class StageTimer:
+    """Wraps pipeline functions in place and collects how long each call took, per stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._patches = []
+        self.samples: dict[str, list[float]] = {}
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, module, name: str, stage: str, on_done=None):
+        original = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+                if on_done:
+                    on_done()
+
+        if inspect.iscoroutinefunction(original):
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    self.add(stage, time.perf_counter() - started)
+                    if on_done:
+                        on_done()
+
+        setattr(module, name, timed)
+        self._patches.append((module, name, original))
+
+    def restore(self):
+        for module, name, original in reversed(self._patches):
+            setattr(module, name, original)
+        self._patches = []
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                stage: {
+                    "count": len(samples),
+                    "mean": round(sum(samples) / len(samples), 3),
+                    "p50": round(percentile(ordered := sorted(samples), 50), 3),
+                    "p90": round(percentile(ordered, 90), 3),
+                    "p99": round(percentile(ordered, 99), 3),
+                    "max": round(max(samples), 3),
+                }
+                for stage, samples in self.samples.items()
+            }
+
+
+def run_search(query: str, country: str, timer: StageTimer = None) -> str:
+    """Runs one search through the real task pipeline. Returns the final task status."""
+    import main
+    import ranker
+    import scraper
+
+    task = main.task_manager.create_task(query)
+    started = time.perf_counter()
+    first_score = []
+
+    if timer:
+        def on_scored():
+            if not first_score:
+                first_score.append(time.perf_counter() - started)
+
+        timer.wrap(main, "transform_user_query", "transform")
+        timer.wrap(main, "scrape_google_products_streaming", "scrape")
+        timer.wrap(ranker, "ascore_batch", "score", on_done=on_scored)
+        timer.wrap(scraper, "get_products", "serp")
+        timer.wrap(scraper, "fetch_product_details_http", "fetch_http")
+        timer.wrap(scraper, "fetch_single_product_details", "fetch_browser")
+    try:
+        main.run_search_task(task.id, query, country)
+    finally:
+        if timer:
+            timer.restore()
+            timer.add("end_to_end", time.perf_counter() - started)
+            if first_score:
+                timer.add("time_to_first_score", first_score[0])
+    return main.task_manager.get_task(task.id).status.value
+
+
+def _reset_caches(cache_dir: str):
+    """Point the persistent caches at an empty directory so each run starts cold."""
+    import context_gatherer
+    import llm_client
+    import redirect_cache
+    import scraper
+
+    config.CACHE_DIR = cache_dir
+    scraper.get_serp_cache.cache_clear()
+    redirect_cache.get_redirect_cache.cache_clear()
+    llm_client.get_llm_cache.cache_clear()
+    context_gatherer.get_firm_context_cache.cache_clear()
+
+
+def record(queries: list[str], country: str, path: str):
+    cassette = recorder.use_cassette(path, "record")
+    # The SERP, redirect and LLM caches skip themselves while recording; cold caches
+    # make sure nothing an earlier run cached can keep a response off the cassette
+    with tempfile.TemporaryDirectory() as cache_dir:
+        _reset_caches(cache_dir)
+        for query in queries:
+            cassette.add_search(query, country)
+            print(f"Recording '{query}' ({country})...")
+            print(f"  -> {run_search(query, country)}")
+            cassette.save()
+    print(f"\nSaved {cassette.summary()} to {path}")
+
+
+def replay(path: str, runs: int, scale: float, warm: bool) -> dict:
+    cassette = recorder.use_cassette(path, "replay")
+    searches = cassette.data["searches"]
+    if not searches:
+        raise SystemExit(f"{path} has no recorded searches")
+
+    config.REPLAY_LATENCY_SCALE = scale
+    config.HTML_ARCHIVE_ENABLED = False
+    timer = StageTimer()
+    statuses = {}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # The pipeline writes its products_*.json / ranked_*.json into the working directory
+        os.chdir(workdir)
+        for run in range(runs):
+            if run == 0 or not warm:
+                _reset_caches(os.path.join(workdir, f"cache{run}"))
+            for query, country in searches:
+                status = run_search(query, country, timer)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    return {
+        "cassette": cassette.summary(),
+        "runs": runs,
+        "latency_scale": scale,
+        "warm_caches": warm,
+        "task_statuses": statuses,
+        "stages": timer.report(),
+        "llm_calls": llm_metrics.snapshot(),
+    }
+
+
+def print_report(report: dict):
+    print(f"\n{report['runs']} runs over {report['cassette']['searches']} searches "
+          f"(latency x{report['latency_scale']}, {'warm' if report['warm_caches'] else 'cold'} caches), "
+          f"tasks: {report['task_statuses']}, replay misses: {report['cassette']['misses']}\n")
+    print(f"{'stage':<22}{'count':>7}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for stage, r in report["stages"].items():
+        print(f"{stage:<22}{r['count']:>7}{r['mean']:>9}{r['p50']:>9}{r['p90']:>9}{r['p99']:>9}{r['max']:>9}")
+
+
+def _pop_option(args: list[str], name: str, default=None):
+    if name in args:
+        i = args.index(name)
+        value = args[i + 1]
+        del args[i:i + 2]
+        return value
+    return default
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] not in ("record", "replay"):
+        print(__doc__)
+        sys.exit(1)
+    command = args.pop(0)
+    path = os.path.abspath(_pop_option(args, "--cassette", config.RECORDING_PATH))
+
+    if command == "record":
+        country = _pop_option(args, "--country", "US")
+        if not args:
+            raise SystemExit("record needs at least one query")
+        record(args, country, path)
+        return
+
+    runs = int(_pop_option(args, "--runs", "5"))
+    scale = float(_pop_option(args, "--scale", "1.0"))
+    json_path = _pop_option(args, "--json")
+    json_path = os.path.abspath(json_path) if json_path else None
+    report = replay(path, runs, scale, warm="--warm" in args)
+    print_report(report)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
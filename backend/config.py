@@ -0,0 +1,162 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment, falling back to default."""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"[Config] Invalid integer for {name}={value!r}, using {default}")
+        return default
+
+
+# Chrome / undetected_chromedriver
+CHROME_VERSION_MAIN = _env_int("CHROME_VERSION_MAIN", 142)
+CHROME_USER_AGENT = os.getenv(
+    "CHROME_USER_AGENT",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+)
+
+# Driver pool
+DRIVER_POOL_SIZE = _env_int("DRIVER_POOL_SIZE", 6)          # browsers kept warm per process
+DRIVER_MAX_USES = _env_int("DRIVER_MAX_USES", 50)           # recycle a browser after this many leases
+DRIVER_LEASE_TIMEOUT = _env_int("DRIVER_LEASE_TIMEOUT", 60) # seconds to wait for a free browser
+
+# Product detail fetching
+DETAIL_FETCH_MODE = os.getenv("DETAIL_FETCH_MODE", "tabs")          # "tabs" (one browser, many tabs) or "browsers"
+DETAIL_TABS_PER_BROWSER = _env_int("DETAIL_TABS_PER_BROWSER", 6)
+DETAIL_PAGE_TIMEOUT = _env_int("DETAIL_PAGE_TIMEOUT", 10)           # seconds before a slow page is taken as-is
+
+# Page readiness (see page_readiness.py)
+READY_QUIET_MS = _env_int("READY_QUIET_MS", 300)            # no DOM mutations for this long
+READY_NET_IDLE_MS = _env_int("READY_NET_IDLE_MS", 500)      # no resource finished loading for this long
+READY_POLL_SECONDS = float(os.getenv("READY_POLL_SECONDS", "0.1"))
+READY_MIN_BUDGET = float(os.getenv("READY_MIN_BUDGET", "2"))  # lower bound on a learned per-domain budget
+SERP_SCROLL_WAIT = float(os.getenv("SERP_SCROLL_WAIT", "2"))  # max wait for new results after a scroll
+
+# HTTP-first detail fetching (browser is the fallback)
+HTTP_FIRST_FETCH = os.getenv("HTTP_FIRST_FETCH", "1") not in ("0", "false", "False")
+HTTP_FETCH_TIMEOUT = _env_int("HTTP_FETCH_TIMEOUT", 8)
+HTTP_MAX_CONNECTIONS = _env_int("HTTP_MAX_CONNECTIONS", 16)
+HTTP_MIN_VISIBLE_TEXT = _env_int("HTTP_MIN_VISIBLE_TEXT", 400)     # chars of visible text below which a page is a JS shell
+
+# HTML parsing backend: "auto", "bs4", "lxml" or "selectolax" (see html_parser.py)
+HTML_PARSER = os.getenv("HTML_PARSER", "auto")
+
+# Product page distillation (see product_distiller.py)
+DISTILL_MAX_CHARS = _env_int("DISTILL_MAX_CHARS", 1500)     # cap on the distilled description
+
+# Fetched-page archive (see html_archive.py)
+HTML_ARCHIVE_ENABLED = os.getenv("HTML_ARCHIVE_ENABLED", "1") not in ("0", "false", "False")
+HTML_ARCHIVE_DIR = os.getenv("HTML_ARCHIVE_DIR", "html_archive")
+HTML_ARCHIVE_MAX_PENDING = _env_int("HTML_ARCHIVE_MAX_PENDING", 256)   # queued pages before new ones are dropped
+HTML_ARCHIVE_ZSTD_LEVEL = _env_int("HTML_ARCHIVE_ZSTD_LEVEL", 10)
+
+# Persistent caches (see disk_cache.py)
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+REDIRECT_CACHE_TTL = _env_int("REDIRECT_CACHE_TTL", 7 * 24 * 3600)          # Google link -> merchant URL
+REDIRECT_CACHE_MAX_ENTRIES = _env_int("REDIRECT_CACHE_MAX_ENTRIES", 100000)
+SERP_CACHE_TTL = _env_int("SERP_CACHE_TTL", 6 * 3600)                     # parsed Google Shopping results
+SERP_CACHE_MAX_ENTRIES = _env_int("SERP_CACHE_MAX_ENTRIES", 5000)
+
+# Offline record/replay (see recorder.py and bench_pipeline.py)
+RECORD_MODE = os.getenv("RECORD_MODE", "")                      # "", "record" or "replay"
+RECORDING_PATH = os.getenv("RECORDING_PATH", "recordings/session.json.gz")
+REPLAY_LATENCY_SCALE = float(os.getenv("REPLAY_LATENCY_SCALE", "1.0"))  # 0 replays as fast as possible
+
+# Lean page loads: block heavy resources while a browser loads pages (see lean_profile.py)
+LEAN_PAGE_LOAD = os.getenv("LEAN_PAGE_LOAD", "1") not in ("0", "false", "False")
+LEAN_BLOCKED_TYPES = os.getenv("LEAN_BLOCKED_TYPES", "image,font,stylesheet,media,tracker")
+# Per-domain exceptions, "domain=type,type;domain=*". Google keeps what the SERP scraping
+# relies on (card images, layout for visibility checks on buttons).
+LEAN_ALLOWLIST = os.getenv("LEAN_ALLOWLIST", "google.com=image,stylesheet,font")
+
+# Per-host scheduling of detail fetches (see fetch_scheduler.py)
+FETCH_PER_HOST_LIMIT = _env_int("FETCH_PER_HOST_LIMIT", 2)      # concurrent fetches per merchant host
+FETCH_SLOW_SECONDS = float(os.getenv("FETCH_SLOW_SECONDS", "5"))  # slower than this lowers a host's limit
+FETCH_BACKOFF_BASE = float(os.getenv("FETCH_BACKOFF_BASE", "0.5"))
+FETCH_BACKOFF_MAX = float(os.getenv("FETCH_BACKOFF_MAX", "15"))
+
+# Search latency budget (see deadlines.py)
+SEARCH_BUDGET_SECONDS = float(os.getenv("SEARCH_BUDGET_SECONDS", "60"))  # the task finishes with what it has by then
+SEARCH_ENOUGH_PRODUCTS = _env_int("SEARCH_ENOUGH_PRODUCTS", 12)         # stop early once this many good products are scored
+SEARCH_GOOD_SCORE = _env_int("SEARCH_GOOD_SCORE", 60)                   # final_score that counts as a good product
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))           # fetches slower than this get a duplicate
+HEDGE_MIN_SAMPLES = _env_int("HEDGE_MIN_SAMPLES", 10)                   # no hedging until latencies are known
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1"))
+
+# Process pool for CPU-heavy HTML work (see html_workers.py)
+# Worker processes; 0 parses in the calling thread. The default leaves one core to the
+# process driving the browsers, so single-core machines don't pay for the hand-off.
+HTML_WORKERS = _env_int("HTML_WORKERS", (os.cpu_count() or 1) - 1)
+HTML_OFFLOAD_MIN_BYTES = _env_int("HTML_OFFLOAD_MIN_BYTES", 64 * 1024)  # smaller pages aren't worth the hand-off
+
+# Firm reputation context (see context_gatherer.py)
+FIRM_CONTEXT_TTL = _env_int("FIRM_CONTEXT_TTL", 14 * 24 * 3600)          # a firm's turnover and reviews change slowly
+FIRM_CONTEXT_MAX_ENTRIES = _env_int("FIRM_CONTEXT_MAX_ENTRIES", 20000)
+FIRM_CONTEXT_WORKERS = _env_int("FIRM_CONTEXT_WORKERS", 4)               # concurrent searches, one browser each
+
+# Known-firm index: sellers whose size class is fixed (see firm_index.py)
+FIRM_INDEX_ENABLED = os.getenv("FIRM_INDEX_ENABLED", "1") not in ("0", "false", "False")
+FIRM_INDEX_PATH = os.getenv("FIRM_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "known_firms.json"))
+FIRM_INDEX_RELOAD_SECONDS = float(os.getenv("FIRM_INDEX_RELOAD_SECONDS", "60"))  # how often the file is checked for edits
+FIRM_INDEX_FUZZY_CUTOFF = float(os.getenv("FIRM_INDEX_FUZZY_CUTOFF", "0.9"))     # difflib ratio for spelling variants of long names
+
+# Batched product scoring (see ranker.score_batch)
+RANK_BATCH_SIZE = _env_int("RANK_BATCH_SIZE", 8)                        # products per LLM request; 1 scores one at a time
+RANK_BATCH_TOKEN_BUDGET = _env_int("RANK_BATCH_TOKEN_BUDGET", 6000)     # estimated prompt + response tokens per request
+RANK_BATCH_OUTPUT_TOKENS_PER_PRODUCT = _env_int("RANK_BATCH_OUTPUT_TOKENS_PER_PRODUCT", 150)
+RANK_BATCH_WAIT_SECONDS = float(os.getenv("RANK_BATCH_WAIT_SECONDS", "1.0"))  # how long a streamed product waits for company
+
+# Persistent cache of structured LLM responses (see llm_client.get_llm_cache)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") not in ("0", "false", "False")
+LLM_CACHE_TTL = _env_int("LLM_CACHE_TTL", 24 * 3600)                    # scores and query transforms
+LLM_CACHE_MAX_ENTRIES = _env_int("LLM_CACHE_MAX_ENTRIES", 50000)
+
+# Async LLM client: every request runs on one event loop (see llm_client.get_llm_loop)
+LLM_MAX_CONNECTIONS = _env_int("LLM_MAX_CONNECTIONS", 100)              # pooled connections to the OpenAI API
+
+# Shared OpenAI rate limiting (see llm_limiter.py). The per-minute budgets are starting
+# points: they follow the x-ratelimit-* headers once responses come back.
+LLM_REQUESTS_PER_MINUTE = _env_int("LLM_REQUESTS_PER_MINUTE", 500)
+LLM_TOKENS_PER_MINUTE = _env_int("LLM_TOKENS_PER_MINUTE", 200000)
+LLM_EXPECTED_OUTPUT_TOKENS = _env_int("LLM_EXPECTED_OUTPUT_TOKENS", 400)  # budgeted per request until usage is known
+LLM_MAX_RETRIES = _env_int("LLM_MAX_RETRIES", 5)
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+LLM_RATE_MIN_SCALE = float(os.getenv("LLM_RATE_MIN_SCALE", "0.1"))    # lowest fraction of the limit we throttle down to
+LLM_RATE_RECOVERY = float(os.getenv("LLM_RATE_RECOVERY", "0.02"))     # fraction regained per successful request
+
+# LLM call metrics (see llm_metrics.py)
+LLM_METRICS_WINDOW = _env_int("LLM_METRICS_WINDOW", 1000)          # recent calls per stage/model for latency percentiles
+LLM_METRICS_MAX_TASKS = _env_int("LLM_METRICS_MAX_TASKS", 1000)    # tasks whose LLM usage is kept for their status
+# USD per million (prompt, completion) tokens; models missing here are counted at 0
+LLM_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+
+# Near-duplicate SERP cards (see product_dedup.py): one fetch and one score per cluster
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") not in ("0", "false", "False")
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.8"))        # estimated Jaccard of the names' shingles
+DEDUP_SHINGLE_SIZE = _env_int("DEDUP_SHINGLE_SIZE", 3)                 # characters per shingle
+DEDUP_NUM_PERM = _env_int("DEDUP_NUM_PERM", 64)                        # MinHash signature length
+DEDUP_MAX_PRICE_DIFF = float(os.getenv("DEDUP_MAX_PRICE_DIFF", "0.05"))  # relative; bigger gaps are different offers
+
+# Local lexical pre-ranking of scraped products (see prerank.py)
+PRERANK_ENABLED = os.getenv("PRERANK_ENABLED", "1") not in ("0", "false", "False")
+PRERANK_DROP_MISMATCHES = os.getenv("PRERANK_DROP_MISMATCHES", "1") not in ("0", "false", "False")
+PRERANK_MIN_MATCHED_TERMS = _env_int("PRERANK_MIN_MATCHED_TERMS", 1)   # fewer of the search's terms = not sent to the LLM
+PRERANK_STEM_LENGTH = _env_int("PRERANK_STEM_LENGTH", 4)               # words are cut to this many characters
+PRERANK_NAME_WEIGHT = _env_int("PRERANK_NAME_WEIGHT", 2)               # the name counts this many times over the description
+PRERANK_DESCRIPTION_CHARS = _env_int("PRERANK_DESCRIPTION_CHARS", 2000)
+PRERANK_BM25_K1 = float(os.getenv("PRERANK_BM25_K1", "1.2"))
+PRERANK_BM25_B = float(os.getenv("PRERANK_BM25_B", "0.75"))
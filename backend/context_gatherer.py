@@ -1,32 +1,27 @@
-import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+import concurrent.futures
 import threading
-import time
-import random
+from functools import lru_cache
 
-# Lock to prevent race conditions during driver initialization if strict thread safety is needed for uc
-driver_lock = threading.Lock()
+import config
+from disk_cache import PersistentCache, MISSING
+from driver_pool import get_driver_pool
+from firm_index import normalize_firm
+from lean_profile import apply_lean_profile
 
 def search_google_snippet(query: str, driver=None) -> str:
     """
     Performs a Google search and extracts the snippets from the first page.
-    If driver is provided, uses it. Otherwise creates a one-off driver (slower).
+    If driver is provided, uses it. Otherwise leases one from the shared pool.
     """
-    should_quit = False
     if not driver:
-        should_quit = True
-        options = uc.ChromeOptions()
-        options.add_argument("--headless")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-gpu")
-        
-        with driver_lock:
-             driver = uc.Chrome(options=options, version_main=142)
+        with get_driver_pool().lease() as leased_driver:
+            return search_google_snippet(query, leased_driver)
 
     try:
+        apply_lean_profile(driver, "https://www.google.com/search")
         driver.get("https://www.google.com/search?q=" + query)
         
         # Simple consent handling (reused logic)
@@ -60,53 +55,116 @@ def search_google_snippet(query: str, driver=None) -> str:
     except Exception as e:
         print(f"Error searching for '{query}': {e}")
         return ""
-    finally:
-        if should_quit and driver:
-            driver.quit()
 
-def get_firm_context(firm_name: str) -> str:
+# The searches run per firm: (section key, query template, heading in the context text)
+FIRM_SEARCHES = (
+    # "cifra de afaceri" (turnover) finds the firm's size on Listafirme
+    ("business", "{firm} cifra de afaceri listafirme", "--- Business Data (Source: Google/Listafirme) ---"),
+    ("reputation", "{firm} pareri reddit trustpilot teapa", "--- Reputation Data (Source: Google/Reddit/Trustpilot) ---"),
+)
+
+
+@lru_cache()
+def get_firm_context_cache() -> PersistentCache:
+    """Process-wide cache of firm search snippets, keyed by normalize_firm()."""
+    return PersistentCache("firm_context", ttl=config.FIRM_CONTEXT_TTL, max_entries=config.FIRM_CONTEXT_MAX_ENTRIES, memory_entries=512)
+
+
+@lru_cache()
+def _search_executor() -> concurrent.futures.ThreadPoolExecutor:
+    # Each search leases its own browser, so this also caps the browsers firm context takes
+    return concurrent.futures.ThreadPoolExecutor(max_workers=config.FIRM_CONTEXT_WORKERS, thread_name_prefix="firm-context")
+
+
+_inflight: dict[str, dict] = {}  # firm key -> {section: Future}, while its searches run
+_inflight_lock = threading.Lock()
+
+
+def _start_searches(key: str, firm_name: str) -> dict:
     """
-    Orchestrates gathering context for a firm.
-    Runs 2 searches: one for business info (Listafirme), one for trust/reviews.
-    Returns a combined string.
+    Starts the firm's searches concurrently, or joins the ones already running for it.
+    Results are cached once every search has come back with text.
     """
-    if not firm_name or firm_name == "N/A":
-        return "No firm name provided."
-
-    # We use a single driver for both searches to save startup time
-    options = uc.ChromeOptions()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")
+    with _inflight_lock:
+        searches = _inflight.get(key)
+        if searches is not None:
+            return searches
+        searches = _inflight[key] = {
+            section: _search_executor().submit(search_google_snippet, query.format(firm=firm_name))
+            for section, query, _ in FIRM_SEARCHES
+        }
+    
+    remaining = [len(searches)]
     
+    def on_done(_):
+        with _inflight_lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+            _inflight.pop(key, None)
+        texts = {section: future.result() if not future.exception() else "" for section, future in searches.items()}
+        # An empty snippet is a failed search (consent wall, captcha); don't pin it
+        if all(texts.values()):
+            get_firm_context_cache().set(key, {"firm": firm_name, **texts})
+    
+    for future in searches.values():
+        future.add_done_callback(on_done)
+    return searches
+
+
+def format_firm_context(firm_name: str, texts: dict) -> str:
     context = f"Context for firm '{firm_name}':\n\n"
+    for section, _, heading in FIRM_SEARCHES:
+        context += f"{heading}\n{texts.get(section, '')}\n\n"
+    return context.rstrip("\n") + "\n"
+
+
+def get_firm_contexts(firm_names: list[str]) -> dict[str, str]:
+    """
+    Firm context for many firms at once: {firm_name: context text}.
     
-    driver = None
-    try:
-        with driver_lock:
-             driver = uc.Chrome(options=options, version_main=142)
-        
-        # Search 1: Business Info
-        # Using "cifra de afaceri" (turnover) to find size
-        biz_query = f"{firm_name} cifra de afaceri listafirme"
-        biz_text = search_google_snippet(biz_query, driver)
-        context += f"--- Business Data (Source: Google/Listafirme) ---\n{biz_text}\n\n"
-        
-        time.sleep(random.uniform(1, 2))
-        
-        # Search 2: Trust/Reviews
-        trust_query = f"{firm_name} pareri reddit trustpilot teapa"
-        trust_text = search_google_snippet(trust_query, driver)
-        context += f"--- Reputation Data (Source: Google/Reddit/Trustpilot) ---\n{trust_text}\n"
-        
-    except Exception as e:
-        context += f"\nError gathering context: {str(e)}"
-    finally:
-        if driver:
-            driver.quit()
-            
-    return context
+    Names are deduplicated by normalize_firm(), cached entries are answered straight
+    from the firm-context cache, and only the misses are searched, all of them
+    concurrently. Stale entries are returned as-is while a refresh runs in the background.
+    """
+    cache = get_firm_context_cache()
+    contexts = {}
+    pending = {}  # firm name -> {section: Future}
+    
+    for firm_name in firm_names:
+        if firm_name in contexts or firm_name in pending:
+            continue
+        if not firm_name or firm_name == "N/A":
+            contexts[firm_name] = "No firm name provided."
+            continue
+        key = normalize_firm(firm_name)
+        entry, is_stale = cache.get_entry(key)
+        if entry is MISSING:
+            pending[firm_name] = _start_searches(key, firm_name)
+            continue
+        if is_stale:
+            _start_searches(key, firm_name)
+        contexts[firm_name] = format_firm_context(firm_name, entry)
+    
+    for firm_name, searches in pending.items():
+        texts = {}
+        try:
+            for section, future in searches.items():
+                texts[section] = future.result()
+            contexts[firm_name] = format_firm_context(firm_name, texts)
+        except Exception as e:
+            contexts[firm_name] = format_firm_context(firm_name, texts) + f"\nError gathering context: {str(e)}"
+    
+    return contexts
+
+
+def get_firm_context(firm_name: str) -> str:
+    """
+    Orchestrates gathering context for a firm.
+    Runs 2 searches concurrently: one for business info (Listafirme), one for trust/reviews.
+    Returns a combined string; repeat firms are answered from the firm-context cache.
+    """
+    return get_firm_contexts([firm_name])[firm_name]
 
 if __name__ == "__main__":
     # Test
@@ -0,0 +1,139 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import config
+
+
+def percentile(ordered: list, pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list, or None for an empty one."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(pct * len(ordered) / 100) - 1)]
+
+
+class Deadline:
+    """A latency budget for one search, shared by every stage that can give up early."""
+
+    def __init__(self, seconds: float = None):
+        self.seconds = seconds if seconds is not None else config.SEARCH_BUDGET_SECONDS
+        self.started_at = time.time()
+
+    def remaining(self) -> float:
+        return max(0.0, self.started_at + self.seconds - time.time())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class LatencyTracker:
+    """Rolling window of recent durations, for "this is taking longer than usual" decisions."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Nearest-rank percentile, or None until there are enough samples to trust it."""
+        with self._lock:
+            if len(self._samples) < config.HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return percentile(ordered, pct)
+
+    def hedge_after(self) -> Optional[float]:
+        """How long an attempt may run before it gets a hedged duplicate."""
+        threshold = self.percentile(config.HEDGE_PERCENTILE)
+        return None if threshold is None else max(config.HEDGE_MIN_DELAY, threshold)
+
+
+# Per detail-fetch tier, shared across searches
+fetch_latency = {"http": LatencyTracker(), "browser": LatencyTracker()}
+
+
+class HedgeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"calls": 0, "hedged": 0, "hedge_won": 0}
+
+    def add(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counts)
+
+
+hedge_stats = HedgeStats()
+
+
+class Hedge:
+    """
+    Runs fn through submit(fn) and, if it hasn't finished after `after` seconds,
+    submits a duplicate. The first attempt to finish wins: on_result(result) is called
+    once with its result and the other attempt's result is discarded.
+    fn must not raise. `done` resolves once a result has been delivered.
+    """
+
+    def __init__(self, submit, fn, after: Optional[float], on_result, tracker: LatencyTracker = None):
+        self._submit = submit
+        self._fn = fn
+        self._on_result = on_result
+        self._tracker = tracker
+        self._lock = threading.Lock()
+        self._finished = False
+        self._timer = None
+        self.attempts = []
+        self.done = threading.Event()
+        hedge_stats.add("calls")
+
+        self.attempts.append(submit(self._attempt, False))
+        if after is not None:
+            self._timer = threading.Timer(after, self._hedge)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _hedge(self):
+        with self._lock:
+            if self._finished:
+                return
+        hedge_stats.add("hedged")
+        try:
+            self.attempts.append(self._submit(self._attempt, True))
+        except RuntimeError:
+            pass  # scheduler already shut down
+
+    def _attempt(self, is_hedge: bool):
+        started = time.time()
+        result = self._fn()
+        if self._tracker:
+            self._tracker.record(time.time() - started)
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        if self._timer:
+            self._timer.cancel()
+        if is_hedge:
+            hedge_stats.add("hedge_won")
+        try:
+            self._on_result(result)
+        finally:
+            self.done.set()
+
+    def cancel(self):
+        """Give up: drop attempts that haven't started and ignore any result still to come."""
+        with self._lock:
+            self._finished = True
+        if self._timer:
+            self._timer.cancel()
+        for attempt in self.attempts:
+            attempt.cancel()
+        self.done.set()
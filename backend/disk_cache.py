@@ -0,0 +1,174 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import config
+
+MISSING = object()
+
+
+class PersistentCache:
+    """
+    Small persistent key/value cache with TTL and LRU eviction.
+
+    Entries live in a SQLite file so they survive restarts and are shared by every
+    worker on the box; the most recently used ones are also kept in an in-process
+    LRU dict so a hot hit costs a dict lookup rather than a query.
+    Values must be JSON-serializable.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        max_entries: int,
+        memory_entries: int = 1024,
+        path: str = None,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.path = path or os.path.join(config.CACHE_DIR, f"{name}.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._memory: OrderedDict = OrderedDict()  # key -> (value, stored_at)
+        self._writes_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+        conn = self._connect()
+        with conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    # ---- memory layer ----------------------------------------------------
+
+    def _remember(self, key: str, value: Any, stored_at: float):
+        with self._lock:
+            self._memory[key] = (value, stored_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key: str):
+        """Returns (value, stored_at) or None, checking memory before disk."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+
+        row = self._connect().execute(
+            "SELECT value, stored_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, stored_at = json.loads(row[0]), row[1]
+        # Only disk reads refresh last_access; memory hits keep the entry hot in-process anyway
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._remember(key, value, stored_at)
+        return value, stored_at
+
+    # ---- public API ------------------------------------------------------
+
+    def get(self, key: str, default=None, allow_stale: bool = False):
+        """
+        Cached value for key, or default on a miss.
+        With allow_stale=True, expired entries are returned too; use get_entry()
+        to find out whether what came back is stale.
+        """
+        value, is_stale = self.get_entry(key)
+        if value is MISSING or (is_stale and not allow_stale):
+            return default
+        return value
+
+    def get_entry(self, key: str) -> tuple[Any, bool]:
+        """(value, is_stale), or (MISSING, False) on a miss. Counts hits/misses."""
+        entry = self._lookup(key)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return MISSING, False
+        value, stored_at = entry
+        is_stale = time.time() - stored_at > self.ttl
+        with self._lock:
+            if is_stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+        return value, is_stale
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, stored_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+        self._remember(key, value, now)
+
+        with self._lock:
+            self._writes_since_evict += 1
+            should_evict = self._writes_since_evict >= max(1, self.max_entries // 20)
+            if should_evict:
+                self._writes_since_evict = 0
+        if should_evict:
+            self.evict()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def evict(self):
+        """Drop entries far past their TTL, then least recently used ones beyond max_entries."""
+        conn = self._connect()
+        with conn:
+            # Keep expired entries for a while: stale-while-revalidate callers can still use them
+            conn.execute("DELETE FROM entries WHERE stored_at < ?", (time.time() - self.ttl * 10,))
+            count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale_hits
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
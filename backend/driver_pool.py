@@ -0,0 +1,213 @@
+import atexit
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import urlparse
+
+import undetected_chromedriver as uc
+
+import config
+from lean_profile import reset_lean_profile
+
+# uc patches the chromedriver binary on startup, which is not safe to do concurrently
+_launch_lock = threading.Lock()
+
+
+def build_chrome_options() -> uc.ChromeOptions:
+    """Chrome options shared by every pooled browser."""
+    options = uc.ChromeOptions()
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--start-maximized")
+    options.add_argument(f"--user-agent={config.CHROME_USER_AGENT}")
+    options.add_argument("--disable-gpu")
+    # Eager returns as soon as the DOM is interactive; callers wait for what they need
+    options.page_load_strategy = 'eager'
+    return options
+
+
+def launch_driver():
+    """Start a new Chrome instance with the pooled options."""
+    with _launch_lock:
+        return uc.Chrome(options=build_chrome_options(), version_main=config.CHROME_VERSION_MAIN)
+
+
+class _PooledDriver:
+    """A browser plus the bookkeeping the pool needs to decide when to recycle it."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.time()
+
+
+class DriverPool:
+    """
+    Process-wide pool of warm Chrome instances.
+    Browsers are launched in the background ahead of time and leased to callers,
+    so browser startup is not on the per-product critical path.
+    """
+
+    def __init__(self, size: int = None, max_uses: int = None):
+        self.size = size or config.DRIVER_POOL_SIZE
+        self.max_uses = max_uses or config.DRIVER_MAX_USES
+        self._idle: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._alive = 0          # browsers that exist or are being launched
+        self._closed = False
+        self._fill()
+
+    # ---- lifecycle -------------------------------------------------------
+
+    def _fill(self):
+        """Launch browsers in the background until the pool is at full size."""
+        with self._lock:
+            missing = self.size - self._alive if not self._closed else 0
+            self._alive += max(missing, 0)
+        for _ in range(max(missing, 0)):
+            threading.Thread(target=self._launch_one, daemon=True).start()
+
+    def _launch_one(self):
+        try:
+            entry = _PooledDriver(launch_driver())
+        except Exception as e:
+            print(f"[DriverPool] Failed to launch browser: {e}")
+            with self._lock:
+                self._alive -= 1
+            return
+        if self._closed:
+            self._discard(entry)
+            return
+        self._idle.put(entry)
+
+    def _discard(self, entry: _PooledDriver):
+        try:
+            entry.driver.quit()
+        except:
+            pass
+        with self._lock:
+            self._alive -= 1
+
+    def shutdown(self):
+        """Quit every idle browser. Leased browsers are quit when they are returned."""
+        self._closed = True
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(entry)
+
+    # ---- health / reset --------------------------------------------------
+
+    @staticmethod
+    def _is_healthy(entry: _PooledDriver) -> bool:
+        try:
+            return entry.driver.execute_script("return 1") == 1
+        except:
+            return False
+
+    @staticmethod
+    def _visited_origins(driver) -> set[str]:
+        """Origins of every page in the current tab's history."""
+        history = driver.execute_cdp_cmd("Page.getNavigationHistory", {})
+        origins = set()
+        for item in history.get("entries", []):
+            parsed = urlparse(item.get("url") or "")
+            if parsed.scheme in ("http", "https") and parsed.netloc:
+                origins.add(f"{parsed.scheme}://{parsed.netloc}")
+        return origins
+
+    @classmethod
+    def _reset(cls, entry: _PooledDriver) -> bool:
+        """
+        Bring a browser back to a clean single blank tab, with nothing left from the
+        previous lease: no cookies, cache or site storage (any origin) and no blocked
+        URLs. Returns False if it is unusable.
+        """
+        driver = entry.driver
+        try:
+            handles = driver.window_handles
+            origins = set()
+            for handle in reversed(handles):
+                driver.switch_to.window(handle)
+                origins |= cls._visited_origins(driver)
+                if handle != handles[0]:
+                    driver.close()
+            driver.switch_to.window(handles[0])
+            # delete_all_cookies() would only clear the current page's cookies
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+            for origin in origins:
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            reset_lean_profile(driver)
+            driver.get("about:blank")
+            driver.execute_cdp_cmd("Page.resetNavigationHistory", {})
+            return True
+        except:
+            return False
+
+    # ---- leasing ---------------------------------------------------------
+
+    def acquire(self, timeout: float = None):
+        """Take a healthy browser out of the pool. Prefer the lease() context manager."""
+        if self._closed:
+            raise RuntimeError("Driver pool is shut down")
+        timeout = timeout if timeout is not None else config.DRIVER_LEASE_TIMEOUT
+        deadline = time.time() + timeout
+        while True:
+            # Top up in case earlier launches failed or browsers were discarded
+            self._fill()
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError(f"No browser available after {timeout}s")
+            try:
+                entry = self._idle.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError(f"No browser available after {timeout}s")
+            if self._is_healthy(entry):
+                entry.uses += 1
+                return entry
+            print("[DriverPool] Discarding unhealthy browser")
+            self._discard(entry)
+
+    def release(self, entry: _PooledDriver, broken: bool = False):
+        """Return a leased browser. Broken or worn-out browsers are replaced in the background."""
+        if broken or self._closed or entry.uses >= self.max_uses or not self._reset(entry):
+            self._discard(entry)
+            self._fill()
+            return
+        self._idle.put(entry)
+
+    @contextmanager
+    def lease(self, timeout: float = None):
+        """
+        Lease a warm driver for the duration of the with-block.
+        The browser is reset (extra tabs closed, cookies cleared) before it goes back.
+        """
+        entry = self.acquire(timeout)
+        broken = False
+        try:
+            yield entry.driver
+        except Exception:
+            # The caller's failure may have left the browser in a bad state; let the
+            # health check on the way back in decide instead of trusting it blindly.
+            broken = not self._is_healthy(entry)
+            raise
+        finally:
+            self.release(entry, broken=broken)
+
+    def stats(self) -> dict:
+        return {"size": self.size, "alive": self._alive, "idle": self._idle.qsize()}
+
+
+@lru_cache()
+def get_driver_pool() -> DriverPool:
+    """Get the process-wide driver pool, starting its browsers on first use."""
+    pool = DriverPool()
+    atexit.register(pool.shutdown)
+    return pool
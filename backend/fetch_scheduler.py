@@ -0,0 +1,194 @@
+import atexit
+import concurrent.futures
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+import config
+
+
+class _HostState:
+    """Concurrency limit and backoff for one host, adapted from how its fetches go."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.backoff = 0.0
+        self.not_before = 0.0
+        self.done = 0
+        self.failures = 0
+        self.slow = 0
+        self.last_failure = 0.0
+
+    def on_failure(self, now: float):
+        # Multiplicative decrease: halve concurrency and double the pause before the next request
+        self.failures += 1
+        self.last_failure = now
+        self.limit = max(1, self.limit // 2)
+        self.backoff = min(config.FETCH_BACKOFF_MAX, max(config.FETCH_BACKOFF_BASE, self.backoff * 2))
+        self.not_before = max(self.not_before, now + self.backoff)
+
+    def on_slow(self):
+        self.slow += 1
+        self.limit = max(1, self.limit - 1)
+
+    def on_success(self, max_limit: int):
+        # Additive increase back towards the configured limit
+        self.backoff = self.backoff / 2 if self.backoff >= config.FETCH_BACKOFF_BASE else 0.0
+        self.limit = min(max_limit, self.limit + 1)
+
+
+class HostScheduler:
+    """
+    Runs fetches on a fixed set of workers with a concurrency limit per host.
+
+    Work is queued per host and dispatched round-robin across hosts, so three
+    listings from one merchant don't occupy three workers while other hosts wait.
+    A host that errors, throttles (see penalize) or answers slowly gets a lower
+    limit and a growing pause between requests; fast successes undo that gradually.
+    """
+
+    def __init__(self, max_workers: int, per_host: int = None, name: str = "fetch"):
+        self.max_workers = max_workers
+        self.per_host = per_host or config.FETCH_PER_HOST_LIMIT
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._cond = threading.Condition()
+        self._hosts: dict[str, _HostState] = {}
+        self._pending: dict[str, deque] = {}
+        self._rotation: deque = deque()  # hosts with pending work, in dispatch order
+        self._running = 0
+        self._closed = False
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name=f"{name}-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def _host(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.per_host)
+        return state
+
+    # ---- public API ------------------------------------------------------
+
+    def submit(self, host: str, fn, *args, **kwargs) -> concurrent.futures.Future:
+        """Queue fn(*args, **kwargs) under host. Returns a Future for its result."""
+        future = concurrent.futures.Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler is shut down")
+            if host not in self._pending or not self._pending[host]:
+                self._pending.setdefault(host, deque())
+                self._rotation.append(host)
+            self._pending[host].append((future, fn, args, kwargs))
+            self._cond.notify()
+        return future
+
+    def penalize(self, host: str):
+        """Report that a host throttled or blocked us (429, bot wall, ...)."""
+        with self._cond:
+            self._host(host).on_failure(time.time())
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = False):
+        """
+        Stop accepting work; with wait=True, block until everything queued has run.
+        cancel_pending=True cancels work that hasn't started instead of running it.
+        """
+        with self._cond:
+            self._closed = True
+            if cancel_pending:
+                for pending in self._pending.values():
+                    for future, *_ in pending:
+                        future.cancel()
+                    pending.clear()
+                self._rotation.clear()
+            self._cond.notify()
+        if wait:
+            self._dispatcher.join()
+        self._executor.shutdown(wait=wait)
+
+    def stats(self) -> dict:
+        with self._cond:
+            throttled = {
+                host: {"limit": s.limit, "backoff": round(s.backoff, 2), "failures": s.failures, "slow": s.slow}
+                for host, s in self._hosts.items() if s.failures or s.slow
+            }
+            return {
+                "running": self._running,
+                "queued": sum(len(q) for q in self._pending.values()),
+                "hosts": len(self._hosts),
+                "throttled_hosts": throttled,
+            }
+
+    # ---- dispatching -----------------------------------------------------
+
+    def _next_ready(self, now: float):
+        """Pop the next runnable item, rotating over hosts. Returns (host, item) or (None, wake_at)."""
+        wake_at = None
+        for _ in range(len(self._rotation)):
+            host = self._rotation[0]
+            self._rotation.rotate(-1)
+            state = self._host(host)
+            if state.active >= state.limit:
+                continue
+            if state.not_before > now:
+                wake_at = state.not_before if wake_at is None else min(wake_at, state.not_before)
+                continue
+            item = self._pending[host].popleft()
+            if not self._pending[host]:
+                self._rotation.remove(host)
+            return host, item
+        return None, wake_at
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while True:
+                if self._closed and not self._rotation:
+                    return
+                host, item = (None, None)
+                if self._running < self.max_workers:
+                    host, item = self._next_ready(time.time())
+                if host is None:
+                    self._cond.wait(timeout=max(0.0, item - time.time()) if item else None)
+                    continue
+                self._host(host).active += 1
+                self._running += 1
+                self._executor.submit(self._run, host, *item)
+
+    def _run(self, host: str, future, fn, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            self._finish(host, None, None, failed=False)
+            return
+        started = time.time()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(host, started, time.time(), failed=True)
+            future.set_exception(e)
+            return
+        self._finish(host, started, time.time(), failed=False)
+        future.set_result(result)
+
+    def _finish(self, host: str, started, finished, failed: bool):
+        with self._cond:
+            state = self._host(host)
+            state.active -= 1
+            self._running -= 1
+            if started is not None:
+                state.done += 1
+                if failed:
+                    state.on_failure(finished)
+                elif state.last_failure >= started:
+                    pass  # penalized while running; don't count it as a success
+                elif finished - started > config.FETCH_SLOW_SECONDS:
+                    state.on_slow()
+                else:
+                    state.on_success(self.per_host)
+            self._cond.notify()
+
+
+@lru_cache()
+def get_fetch_scheduler() -> HostScheduler:
+    """Process-wide scheduler for HTTP detail fetches; host limits are shared by all searches."""
+    scheduler = HostScheduler(max_workers=config.HTTP_MAX_CONNECTIONS, name="http-fetch")
+    atexit.register(scheduler.shutdown, wait=False)
+    return scheduler
@@ -0,0 +1,152 @@
+import difflib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Optional
+from urllib.parse import urlparse
+
+import config
+
+# Legal-form suffixes and web decorations that don't tell firms apart
+_FIRM_NOISE_RE = re.compile(r"\b(s ?r ?l|s ?a|srl ?d|pfa|ii|ltd|gmbh|inc|llc|romania|www|ro|com|eu|shop|online)\b")
+
+# Below this many characters a fuzzy match is more likely a different firm than a typo:
+# one letter off a short name ("Mangox", "Altexx") is usually another shop
+_FUZZY_MIN_LENGTH = 8
+
+# Words a chain's store names add after the chain's name ("Leroy Merlin Pipera",
+# "Dedeman Cluj Napoca 2"): cities, districts and malls. Anything else after an indexed
+# name ("Mango Boutique Cluj", "Noriel Toys") may well be an unrelated small shop.
+_LOCATION_WORDS = {
+    "bucuresti", "sector", "pipera", "baneasa", "militari", "berceni", "colentina", "titan", "pantelimon", "otopeni",
+    "cluj", "napoca", "iasi", "timisoara", "constanta", "craiova", "brasov", "galati", "ploiesti", "oradea",
+    "braila", "arad", "pitesti", "sibiu", "bacau", "targu", "mures", "baia", "mare", "buzau", "botosani",
+    "satu", "suceava", "piatra", "neamt", "drobeta", "turnu", "severin", "focsani", "deva", "ramnicu", "valcea",
+    "alba", "iulia", "bistrita", "tulcea", "resita", "slatina", "calarasi", "giurgiu", "vaslui", "zalau",
+    "sfantu", "gheorghe", "alexandria", "slobozia", "miercurea", "ciuc", "targoviste", "hunedoara", "medias",
+    "mall", "park", "plaza", "city", "center", "centre", "shopping", "retail", "nord", "sud", "est", "vest",
+}
+
+
+def normalize_firm(firm_name: str) -> str:
+    """Cache key form of a firm name: "eMAG.ro" and "EMAG S.R.L." both become "emag"."""
+    text = unicodedata.normalize("NFKD", (firm_name or "").casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    normalized = " ".join(_FIRM_NOISE_RE.sub(" ", text).split())
+    # A name made only of noise words ("Online Shop") is its own key
+    return normalized or " ".join(text.split())
+
+
+def _host_domains(link: str) -> list[str]:
+    """"https://m.emag.ro/x" -> ["m.emag.ro", "emag.ro"]."""
+    host = (urlparse(link or "").hostname or "").lower()
+    labels = host.split(".")
+    return [".".join(labels[i:]) for i in range(len(labels) - 1)]
+
+
+class FirmIndex:
+    """
+    Sellers whose size never needs an LLM to judge: normalized names, aliases and
+    domains mapped to a size class from the data file (config.FIRM_INDEX_PATH).
+
+    lookup() tries, in order: the exact normalized seller name (or an alias), the name
+    followed only by a location ("Leroy Merlin Pipera"), a close spelling of a long
+    name, and only for a card without a seller name, the product link's domain. A
+    third-party seller on a marketplace's domain (emag.ro, amazon.*) is not the
+    marketplace.
+    """
+
+    def __init__(self, firms: list[dict], size_classes: dict):
+        self.size_classes = size_classes
+        self.firms = []
+        self._by_domain: dict[str, dict] = {}
+        self._by_name: dict[str, dict] = {}  # compact normalized name (no spaces) -> firm
+        for firm in firms:
+            size = size_classes.get(firm.get("size"))
+            if size is None:
+                print(f"[FirmIndex] Unknown size class for {firm.get('name')}: {firm.get('size')}")
+                continue
+            entry = {**size, **firm}
+            self.firms.append(entry)
+            for domain in firm.get("domains") or []:
+                self._by_domain[domain.lower()] = entry
+                self._by_name.setdefault(normalize_firm(domain).replace(" ", ""), entry)
+            for name in [firm["name"], *(firm.get("aliases") or [])]:
+                self._by_name[normalize_firm(name).replace(" ", "")] = entry
+        self._fuzzy_keys = [key for key in self._by_name if len(key) >= _FUZZY_MIN_LENGTH]
+
+    @classmethod
+    def from_file(cls, path: str) -> "FirmIndex":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("firms") or [], data.get("size_classes") or {})
+
+    def lookup(self, firm: str = None, link: str = None) -> Optional[dict]:
+        """
+        The indexed firm behind a seller name and/or product link, or None.
+        Returns the firm's entry merged with its size class, plus "matched_by".
+        """
+        words = normalize_firm(firm).split() if firm and firm != "N/A" else []
+        if not words:
+            for domain in _host_domains(link):
+                if domain in self._by_domain:
+                    return {**self._by_domain[domain], "matched_by": "domain"}
+            return None
+        compact = "".join(words)
+        if compact in self._by_name:
+            return {**self._by_name[compact], "matched_by": "name"}
+        for i in range(len(words) - 1, 0, -1):
+            prefix = "".join(words[:i])
+            if prefix in self._by_name and all(word in _LOCATION_WORDS or word.isdigit() for word in words[i:]):
+                return {**self._by_name[prefix], "matched_by": "name_prefix"}
+        if len(compact) >= _FUZZY_MIN_LENGTH:
+            close = difflib.get_close_matches(compact, self._fuzzy_keys, n=1, cutoff=config.FIRM_INDEX_FUZZY_CUTOFF)
+            if close:
+                return {**self._by_name[close[0]], "matched_by": "fuzzy"}
+        return None
+
+
+_index: Optional[FirmIndex] = None
+_index_mtime = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_firm_index() -> FirmIndex:
+    """
+    Process-wide firm index. The data file is re-read when it changes (checked at
+    most every config.FIRM_INDEX_RELOAD_SECONDS), so the list can be edited live.
+    A file that fails to load keeps the previous index.
+    """
+    global _index, _index_mtime, _index_checked_at
+    now = time.time()
+    if _index is not None and now - _index_checked_at < config.FIRM_INDEX_RELOAD_SECONDS:
+        return _index
+    with _index_lock:
+        if _index is not None and now - _index_checked_at < config.FIRM_INDEX_RELOAD_SECONDS:
+            return _index
+        _index_checked_at = now
+        try:
+            mtime = os.path.getmtime(config.FIRM_INDEX_PATH)
+            if _index is None or mtime != _index_mtime:
+                _index = FirmIndex.from_file(config.FIRM_INDEX_PATH)
+                _index_mtime = mtime
+                print(f"[FirmIndex] Loaded {len(_index.firms)} firms from {config.FIRM_INDEX_PATH}")
+        except Exception as e:
+            print(f"[FirmIndex] Could not load {config.FIRM_INDEX_PATH}: {e}")
+            if _index is None:
+                _index = FirmIndex([], {})
+        return _index
+
+
+def reload_firm_index() -> FirmIndex:
+    """Re-read the data file now."""
+    global _index_checked_at, _index_mtime
+    with _index_lock:
+        _index_checked_at = 0.0
+        _index_mtime = None
+    return get_firm_index()
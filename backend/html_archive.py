@@ -0,0 +1,190 @@
+import atexit
+import gzip
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Optional
+
+import config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class HtmlArchive:
+    """
+    Content-addressed, compressed store for fetched pages.
+
+    Pages are keyed by the SHA-256 of their HTML, so the same page fetched twice
+    (or by two different queries) is stored once. Blobs live under
+    objects/<2 hex>/<hash>.html.zst (or .html.gz without zstandard) and a small
+    SQLite index maps URL -> hash -> fetch time.
+
+    Writes go through a background thread: submit() only enqueues, so hashing,
+    compression and disk I/O never block a browser worker.
+    """
+
+    def __init__(self, root: str = None, max_pending: int = None):
+        self.root = root or config.HTML_ARCHIVE_DIR
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.index_path = os.path.join(self.root, "index.sqlite")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending or config.HTML_ARCHIVE_MAX_PENDING)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {"submitted": 0, "stored": 0, "deduplicated": 0, "dropped": 0, "bytes_raw": 0, "bytes_stored": 0}
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    query TEXT,
+                    name TEXT
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_url ON pages (url, fetched_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_sha ON pages (sha256)")
+
+        self._writer = threading.Thread(target=self._run_writer, name="html-archive-writer", daemon=True)
+        self._writer.start()
+
+    # ---- storage helpers -------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def _blob_path(self, sha256: str, ext: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], f"{sha256}.html{ext}")
+
+    def _existing_blob(self, sha256: str) -> Optional[str]:
+        for ext in (".zst", ".gz"):
+            path = self._blob_path(sha256, ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    @staticmethod
+    def _compress(data: bytes) -> tuple[bytes, str]:
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=config.HTML_ARCHIVE_ZSTD_LEVEL).compress(data), ".zst"
+        return gzip.compress(data, compresslevel=6), ".gz"
+
+    # ---- writer thread ---------------------------------------------------
+
+    def _run_writer(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._store(*item)
+            except Exception as e:
+                print(f"[HtmlArchive] Failed to archive {item[0]}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _store(self, url: str, html: str, fetched_at: float, query: Optional[str], name: Optional[str]):
+        data = html.encode("utf-8")
+        sha256 = hashlib.sha256(data).hexdigest()
+
+        if self._existing_blob(sha256):
+            with self._stats_lock:
+                self.stats["deduplicated"] += 1
+        else:
+            blob, ext = self._compress(data)
+            path = self._blob_path(sha256, ext)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp{threading.get_ident()}"
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, path)  # atomic: readers never see a partial blob
+            with self._stats_lock:
+                self.stats["stored"] += 1
+                self.stats["bytes_raw"] += len(data)
+                self.stats["bytes_stored"] += len(blob)
+
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO pages (url, sha256, fetched_at, query, name) VALUES (?, ?, ?, ?, ?)",
+                (url, sha256, fetched_at, query, name),
+            )
+
+    # ---- public API ------------------------------------------------------
+
+    def submit(self, url: str, html: str, query: str = None, name: str = None) -> bool:
+        """
+        Queue a page for archiving. Never blocks: if the writer is too far behind,
+        the page is dropped (and counted) rather than stalling the caller.
+        """
+        if not html:
+            return False
+        try:
+            self._queue.put_nowait((url, html, time.time(), query, name))
+        except queue.Full:
+            with self._stats_lock:
+                self.stats["dropped"] += 1
+            return False
+        with self._stats_lock:
+            self.stats["submitted"] += 1
+        return True
+
+    def flush(self):
+        """Block until every queued page has been written."""
+        self._queue.join()
+
+    def lookup(self, url: str) -> Optional[dict]:
+        """Latest archived entry for a URL: {"sha256", "fetched_at", "query", "name"}."""
+        row = self._connect().execute(
+            "SELECT sha256, fetched_at, query, name FROM pages WHERE url = ? ORDER BY fetched_at DESC LIMIT 1",
+            (url,),
+        ).fetchone()
+        if not row:
+            return None
+        return {"sha256": row[0], "fetched_at": row[1], "query": row[2], "name": row[3]}
+
+    def read(self, sha256: str) -> Optional[str]:
+        """Decompressed HTML for a content hash."""
+        path = self._existing_blob(sha256)
+        if not path:
+            return None
+        with open(path, "rb") as f:
+            blob = f.read()
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read .zst archive entries")
+            data = zstandard.ZstdDecompressor().decompress(blob)
+        else:
+            data = gzip.decompress(blob)
+        return data.decode("utf-8")
+
+    def read_url(self, url: str) -> Optional[str]:
+        entry = self.lookup(url)
+        return self.read(entry["sha256"]) if entry else None
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+
+@lru_cache()
+def get_html_archive() -> HtmlArchive:
+    """Get the process-wide HTML archive (starts its writer thread on first use)."""
+    archive = HtmlArchive()
+    atexit.register(archive.flush)
+    return archive
@@ -0,0 +1,192 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from bs4 import BeautifulSoup
+
+import config
+
+try:
+    import lxml.html
+    from lxml.cssselect import CSSSelector
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+
+class Node(ABC):
+    """
+    Backend-neutral element with only what the scraper needs.
+    BeautifulSoup ('bs4') is the reference; 'lxml' (lxml + cssselect) and 'selectolax'
+    are optional, much faster on large pages, and answer the same CSS selectors.
+    """
+
+    name: str = ""
+
+    @abstractmethod
+    def select(self, css: str) -> list["Node"]:
+        ...
+
+    @abstractmethod
+    def select_one(self, css: str) -> Optional["Node"]:
+        ...
+
+    @abstractmethod
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        ...
+
+    @abstractmethod
+    def remove(self, css: str):
+        """Drop every matching descendant (e.g. scripts before reading page text)."""
+
+    @abstractmethod
+    def get(self, attr: str, default=None):
+        ...
+
+    @property
+    def classes(self) -> list[str]:
+        return (self.get("class") or "").split()
+
+    @property
+    @abstractmethod
+    def parent(self) -> Optional["Node"]:
+        ...
+
+
+# ---- BeautifulSoup (reference) ------------------------------------------
+
+class _SoupNode(Node):
+    def __init__(self, tag):
+        self._tag = tag
+        self.name = tag.name or ""
+
+    def select(self, css):
+        return [_SoupNode(t) for t in self._tag.select(css)]
+
+    def select_one(self, css):
+        tag = self._tag.select_one(css)
+        return _SoupNode(tag) if tag is not None else None
+
+    def get_text(self, separator="", strip=False):
+        return self._tag.get_text(separator, strip=strip)
+
+    def remove(self, css):
+        for tag in self._tag.select(css):
+            tag.decompose()
+
+    def get(self, attr, default=None):
+        value = self._tag.get(attr, default)
+        # bs4 returns multi-valued attributes (class, rel) as lists
+        return " ".join(value) if isinstance(value, list) else value
+
+    @property
+    def parent(self):
+        parent = self._tag.parent
+        return _SoupNode(parent) if parent is not None else None
+
+
+# ---- lxml ---------------------------------------------------------------
+
+_lxml_selectors = {}
+
+
+def _lxml_selector(css):
+    selector = _lxml_selectors.get(css)
+    if selector is None:
+        selector = _lxml_selectors[css] = CSSSelector(css)
+    return selector
+
+
+class _LxmlNode(Node):
+    def __init__(self, element):
+        self._el = element
+        self.name = element.tag if isinstance(element.tag, str) else ""
+
+    def select(self, css):
+        return [_LxmlNode(e) for e in _lxml_selector(css)(self._el)]
+
+    def select_one(self, css):
+        matches = _lxml_selector(css)(self._el)
+        return _LxmlNode(matches[0]) if matches else None
+
+    def get_text(self, separator="", strip=False):
+        texts = self._el.itertext()
+        if strip:
+            return separator.join(t.strip() for t in texts if t.strip())
+        return separator.join(texts)
+
+    def remove(self, css):
+        for element in _lxml_selector(css)(self._el):
+            element.drop_tree()
+
+    def get(self, attr, default=None):
+        return self._el.get(attr, default)
+
+    @property
+    def parent(self):
+        parent = self._el.getparent()
+        return _LxmlNode(parent) if parent is not None else None
+
+
+# ---- selectolax (lexbor) -------------------------------------------------
+
+class _SelectolaxNode(Node):
+    def __init__(self, node):
+        self._node = node
+        self.name = node.tag or ""
+
+    def select(self, css):
+        return [_SelectolaxNode(n) for n in self._node.css(css)]
+
+    def select_one(self, css):
+        node = self._node.css_first(css)
+        return _SelectolaxNode(node) if node is not None else None
+
+    def get_text(self, separator="", strip=False):
+        return self._node.text(deep=True, separator=separator, strip=strip)
+
+    def remove(self, css):
+        for node in self._node.css(css):
+            node.decompose()
+
+    def get(self, attr, default=None):
+        value = self._node.attributes.get(attr, default)
+        return default if value is None else value
+
+    @property
+    def parent(self):
+        parent = self._node.parent
+        return _SelectolaxNode(parent) if parent is not None else None
+
+
+def available_backends() -> list[str]:
+    backends = ["bs4"]
+    if lxml is not None:
+        backends.append("lxml")
+    if LexborHTMLParser is not None:
+        backends.append("selectolax")
+    return backends
+
+
+def resolve_backend(backend: str = None) -> str:
+    """Pick a backend; 'auto' means the fastest one that is installed."""
+    backend = backend or config.HTML_PARSER
+    if backend == "auto":
+        return available_backends()[-1]
+    if backend not in available_backends():
+        print(f"[HtmlParser] Backend '{backend}' is not installed, using bs4")
+        return "bs4"
+    return backend
+
+
+def parse_html(html: str, backend: str = None) -> Node:
+    """Parse a document and return its root node using the chosen backend."""
+    backend = resolve_backend(backend)
+    if backend == "selectolax":
+        return _SelectolaxNode(LexborHTMLParser(html).root)
+    if backend == "lxml":
+        return _LxmlNode(lxml.html.document_fromstring(html))
+    return _SoupNode(BeautifulSoup(html, 'html.parser'))
@@ -0,0 +1,148 @@
+import concurrent.futures
+import multiprocessing
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+import config
+
+
+# ---- worker side -----------------------------------------------------------
+
+def _task_function(task: str):
+    # Imported in the worker on first use, so workers only load what they run
+    if task == "distill":
+        from product_distiller import distill_product_page
+        return distill_product_page
+    if task == "parse_serp":
+        from scraper import parse_products
+        return parse_products
+    raise ValueError(f"Unknown HTML task: {task}")
+
+
+def _read_shared(name: str, size: int) -> str:
+    # Workers share the parent's resource tracker, which already knows the block;
+    # the parent unlinks it once the result is back.
+    shm = SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size]).decode("utf-8")
+    finally:
+        shm.close()
+
+
+def _run_task(task: str, shm_name: str, size: int, args: tuple):
+    return _task_function(task)(_read_shared(shm_name, size), *args)
+
+
+# ---- parent side -----------------------------------------------------------
+
+class HtmlWorkerStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"offloaded": 0, "inline": 0, "shared_bytes": 0, "pool_failures": 0}
+
+    def add(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.counts, "workers": worker_count()}
+
+
+html_worker_stats = HtmlWorkerStats()
+
+
+def worker_count() -> int:
+    """config.HTML_WORKERS; 0 disables the pool."""
+    return max(0, config.HTML_WORKERS)
+
+
+@lru_cache()
+def get_html_pool() -> Optional[concurrent.futures.ProcessPoolExecutor]:
+    """
+    Process pool for CPU-heavy HTML work (parsing, distilling), or None when disabled.
+    Workers come from a forkserver rather than fork(): the parent is full of threads
+    (browsers, HTTP workers), and forking a threaded process can deadlock the child.
+    """
+    workers = worker_count()
+    if workers == 0:
+        return None
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+def _run_inline(task: str, html: str, args: tuple) -> concurrent.futures.Future:
+    future = concurrent.futures.Future()
+    html_worker_stats.add("inline")
+    try:
+        future.set_result(_task_function(task)(html, *args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _release(shm: SharedMemory):
+    try:
+        shm.close()
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _task_done(future: concurrent.futures.Future, shm: SharedMemory, pool):
+    _release(shm)
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        _reset_pool(pool)
+
+
+def submit_html_task(task: str, html: str, *args) -> concurrent.futures.Future:
+    """
+    Run an HTML task ("distill", "parse_serp") in the process pool.
+
+    The page goes to the worker through a shared memory block rather than being
+    pickled, and the block is freed once the result is back. Small pages, and every
+    page when the pool is disabled, run inline in this thread instead: for them the
+    hand-off would cost more than the parse. Returns a Future either way.
+    """
+    pool = get_html_pool()
+    if pool is None or not html or len(html) < config.HTML_OFFLOAD_MIN_BYTES:
+        return _run_inline(task, html, args)
+
+    data = html.encode("utf-8")
+    shm = SharedMemory(create=True, size=len(data))
+    shm.buf[:len(data)] = data
+    try:
+        future = pool.submit(_run_task, task, shm.name, len(data), args)
+    except (BrokenProcessPool, RuntimeError):
+        _release(shm)
+        _reset_pool(pool)
+        return _run_inline(task, html, args)
+    future.add_done_callback(lambda f: _task_done(f, shm, pool))
+    html_worker_stats.add("offloaded")
+    html_worker_stats.add("shared_bytes", len(data))
+    return future
+
+
+def run_html_task(task: str, html: str, *args):
+    """Blocking submit_html_task(); falls back to running inline if the pool breaks."""
+    try:
+        return submit_html_task(task, html, *args).result()
+    except BrokenProcessPool:
+        return _run_inline(task, html, args).result()
+
+
+_reset_lock = threading.Lock()
+
+
+def _reset_pool(pool):
+    """A worker died (OOM, segfault in a parser): start a fresh pool on next use."""
+    with _reset_lock:
+        if get_html_pool.cache_info().currsize == 0 or get_html_pool() is not pool:
+            return  # another task already replaced it
+        html_worker_stats.add("pool_failures")
+        get_html_pool.cache_clear()
+    pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,193 @@
+import re
+import threading
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import urljoin, urlparse
+
+import httpx
+
+import config
+
+# Markers only found on a bot-wall challenge itself (Cloudflare, PerimeterX), never on a
+# normal page. Cloudflare's "challenge-platform" script alone is not one: it is injected
+# into ordinary pages of protected sites too.
+_CHALLENGE_MARKERS = (
+    "_cf_chl_opt",
+    "cf-chl-",
+    "cf-browser-verification",
+    "px-captcha",
+)
+
+# <title>s of challenge and block pages
+_BLOCKED_TITLES = (
+    "just a moment",
+    "attention required",
+    "access denied",
+    "are you a robot",
+    "pardon our interruption",
+)
+
+# Captcha widgets and bot-protection tags. Plenty of shops embed these on normal pages
+# (reCAPTCHA for their forms, DataDome's tag), so they only mean a wall on a page that
+# has next to no text and no product markup
+_CAPTCHA_MARKERS = (
+    "g-recaptcha",
+    "h-captcha",
+    "captcha",
+    "datadome",
+)
+
+_TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title", re.IGNORECASE | re.DOTALL)
+_PRODUCT_MARKUP_RE = re.compile(
+    r"""["']@type["']\s*:\s*["']product["']|schema\.org/product|og:type["']\s+content=["']product""",
+    re.IGNORECASE,
+)
+
+# Markers of client-rendered shells that need a JS engine to produce content
+_JS_SHELL_MARKERS = (
+    "enable javascript",
+    "activeaza javascript",
+    "activați javascript",
+    "you need to enable javascript",
+)
+
+_SCRIPT_STYLE_RE = re.compile(r"<(script|style|noscript|template)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]+>")
+_META_REFRESH_RE = re.compile(
+    r"""<meta[^>]+http-equiv=["']?refresh["']?[^>]*content=["']?\s*\d+\s*;\s*url=([^"'>]+)""",
+    re.IGNORECASE,
+)
+_JS_REDIRECT_RE = re.compile(r"""(?:window\.|document\.)?location(?:\.href)?\s*=\s*["']([^"']+)["']""")
+
+
+def visible_text_length(html: str) -> int:
+    """Rough amount of visible text in a page, without building a DOM."""
+    text = _SCRIPT_STYLE_RE.sub(" ", html)
+    text = _TAG_RE.sub(" ", text)
+    return len(" ".join(text.split()))
+
+
+def needs_browser(status_code: int, final_url: str, html: str) -> Optional[str]:
+    """
+    Decide whether an HTTP response is good enough or the page needs a browser.
+    Returns the reason a browser is needed, or None if the response is usable.
+    """
+    if status_code in (401, 403, 429, 503):
+        return f"blocked ({status_code})"
+    if status_code >= 400:
+        return f"http error ({status_code})"
+
+    host = urlparse(final_url).hostname or ""
+    if ".google." in f".{host}":
+        # Still on a Google interstitial: the merchant URL is only known after JS runs
+        return "unresolved google redirect"
+
+    lowered = html[:20000].lower()
+    for marker in _CHALLENGE_MARKERS:
+        if marker in lowered:
+            return f"bot wall ({marker})"
+    title = _TITLE_RE.search(lowered)
+    title = " ".join(title.group(1).split()) if title else ""
+    for blocked in _BLOCKED_TITLES:
+        if blocked in title:
+            return f"bot wall (title: {blocked})"
+
+    text_length = visible_text_length(html)
+    if text_length < config.HTTP_MIN_VISIBLE_TEXT:
+        return "js shell (no visible text)"
+    if text_length < config.HTTP_MIN_VISIBLE_TEXT * 4:
+        if not _PRODUCT_MARKUP_RE.search(html):
+            # Not "bot wall": a captcha widget alone doesn't show the host is throttling us
+            for marker in _CAPTCHA_MARKERS:
+                if marker in lowered:
+                    return f"captcha page ({marker})"
+        for marker in _JS_SHELL_MARKERS:
+            if marker in lowered:
+                return "js shell (asks for javascript)"
+
+    return None
+
+
+class HttpPageFetcher:
+    """
+    Fetches product pages over plain HTTP with a pooled keep-alive client.
+    Follows HTTP, meta-refresh and trivial JS redirects so the final merchant URL
+    is known without a browser.
+    """
+
+    def __init__(self, client: Optional[httpx.Client] = None, max_redirect_hops: int = 3):
+        self.client = client or httpx.Client(
+            follow_redirects=True,
+            timeout=httpx.Timeout(config.HTTP_FETCH_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(max_connections=config.HTTP_MAX_CONNECTIONS, max_keepalive_connections=config.HTTP_MAX_CONNECTIONS),
+            headers={
+                "User-Agent": config.CHROME_USER_AGENT,
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "ro-RO,ro;q=0.9,en-US;q=0.8,en;q=0.7",
+            },
+        )
+        self.max_redirect_hops = max_redirect_hops
+
+    def fetch(self, url: str) -> tuple[str, str, Optional[str]]:
+        """
+        Fetch a page.
+        Returns (final_url, html, reason) where reason is None when the page is usable
+        and otherwise explains why a browser is needed.
+        """
+        for _ in range(self.max_redirect_hops + 1):
+            response = self.client.get(url)
+            final_url = str(response.url)
+            content_type = response.headers.get("content-type", "")
+            if "html" not in content_type and response.status_code < 400:
+                return final_url, "", f"not html ({content_type or 'no content-type'})"
+            html = response.text
+
+            # Client-side redirect pages (Google /url, merchant trackers) are tiny; follow them
+            next_url = None
+            if len(html) < 5000:
+                match = _META_REFRESH_RE.search(html) or _JS_REDIRECT_RE.search(html)
+                if match:
+                    next_url = urljoin(final_url, match.group(1).strip())
+            if not next_url or next_url == final_url:
+                return final_url, html, needs_browser(response.status_code, final_url, html)
+            url = next_url
+
+        return final_url, html, "too many client-side redirects"
+
+    def close(self):
+        self.client.close()
+
+
+class FetchTierStats:
+    """Thread-safe counters of how often each detail-fetch tier was used."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"http": 0, "browser": 0}
+        self._fallback_reasons = {}
+
+    def record(self, tier: str, reason: Optional[str] = None):
+        with self._lock:
+            self._counts[tier] = self._counts.get(tier, 0) + 1
+            if reason:
+                # Group "blocked (403)" and "blocked (429)" etc. under their kind
+                kind = reason.split(" (")[0]
+                self._fallback_reasons[kind] = self._fallback_reasons.get(kind, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = sum(self._counts.values())
+            return {
+                "counts": dict(self._counts),
+                "http_ratio": round(self._counts["http"] / total, 3) if total else 0.0,
+                "fallback_reasons": dict(self._fallback_reasons),
+            }
+
+
+fetch_tier_stats = FetchTierStats()
+
+
+@lru_cache()
+def get_http_fetcher() -> HttpPageFetcher:
+    """Get the shared HTTP fetcher (one connection pool per process)."""
+    return HttpPageFetcher()
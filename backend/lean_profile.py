@@ -0,0 +1,174 @@
+import threading
+from functools import lru_cache
+from urllib.parse import urlparse
+
+import config
+
+# URL patterns per blockable resource type, in Network.setBlockedURLs syntax ('*' wildcards).
+# Each extension is listed bare and with a query string so versioned assets match too.
+_EXTENSIONS = {
+    "image": ["jpg", "jpeg", "png", "gif", "webp", "avif", "svg", "ico", "bmp"],
+    "font": ["woff", "woff2", "ttf", "otf", "eot"],
+    "stylesheet": ["css"],
+    "media": ["mp4", "webm", "m4v", "mov", "m3u8", "ts", "mp3", "ogg", "wav"],
+}
+
+# Ad, analytics and session-recording hosts common on Romanian shops
+TRACKER_PATTERNS = [
+    "*google-analytics.com/*",
+    "*googletagmanager.com/*",
+    "*googleadservices.com/*",
+    "*googlesyndication.com/*",
+    "*doubleclick.net/*",
+    "*adservice.google.*",
+    "*connect.facebook.net/*",
+    "*facebook.com/tr*",
+    "*hotjar.com/*",
+    "*clarity.ms/*",
+    "*analytics.tiktok.com/*",
+    "*criteo.com/*",
+    "*criteo.net/*",
+    "*taboola.com/*",
+    "*outbrain.com/*",
+    "*2performant.com/*",
+    "*retargeting.biz/*",
+    "*smartlook.com/*",
+    "*mouseflow.com/*",
+    "*onesignal.com/*",
+    "*tawk.to/*",
+    "*livechatinc.com/*",
+    "*youtube.com/embed/*",
+]
+
+RESOURCE_PATTERNS = {
+    kind: [pattern for ext in extensions for pattern in (f"*.{ext}", f"*.{ext}?*")]
+    for kind, extensions in _EXTENSIONS.items()
+}
+RESOURCE_PATTERNS["tracker"] = TRACKER_PATTERNS
+
+# Collects what the page downloaded, from the Resource Timing API. Blocked requests
+# never complete, so they don't count. Cross-origin entries without Timing-Allow-Origin
+# report transferSize 0, which makes this a lower bound.
+_PAGE_WEIGHT_SCRIPT = """
+var nav = performance.getEntriesByType('navigation')[0];
+var resources = performance.getEntriesByType('resource');
+var bytes = nav ? (nav.transferSize || nav.encodedBodySize || 0) : 0;
+resources.forEach(function (r) { bytes += r.transferSize || r.encodedBodySize || 0; });
+return {bytes: bytes, requests: resources.length + 1};
+"""
+
+
+def parse_allowlist(spec: str) -> dict[str, set[str]]:
+    """
+    "google.com=image,stylesheet,font;example.ro=*" -> {"google.com": {...}, "example.ro": {"*"}}.
+    A domain entry also covers its subdomains.
+    """
+    allowlist = {}
+    for entry in (spec or "").split(";"):
+        domain, _, kinds = entry.partition("=")
+        domain = domain.strip().lower()
+        if domain:
+            allowlist[domain] = {k.strip() for k in kinds.split(",") if k.strip()} or {"*"}
+    return allowlist
+
+
+@lru_cache()
+def _allowlist() -> dict[str, set[str]]:
+    return parse_allowlist(config.LEAN_ALLOWLIST)
+
+
+def _is_google_redirect(parsed) -> bool:
+    # /aclk and /url links only bounce to a merchant page, so they get the merchant profile
+    return ".google." in f".{parsed.hostname or ''}" and parsed.path in ("/aclk", "/url")
+
+
+@lru_cache(maxsize=4096)
+def blocked_patterns(url: str) -> tuple[str, ...]:
+    """URL patterns to block while loading url: the lean profile minus the domain's allowlist."""
+    if not config.LEAN_PAGE_LOAD:
+        return ()
+    parsed = urlparse(url or "")
+    host = (parsed.hostname or "").lower()
+
+    allowed = set()
+    if not _is_google_redirect(parsed):
+        for domain, kinds in _allowlist().items():
+            if host == domain or host.endswith("." + domain):
+                allowed |= kinds
+    if "*" in allowed:
+        return ()
+
+    blocked_types = [k.strip() for k in config.LEAN_BLOCKED_TYPES.split(",") if k.strip()]
+    return tuple(p for kind in blocked_types if kind not in allowed for p in RESOURCE_PATTERNS.get(kind, ()))
+
+
+def apply_lean_profile(driver, url: str, handle: str = None) -> str:
+    """
+    Set the current tab's blocked URL patterns for a page about to be loaded.
+    Call right before navigating; the patterns stick to the tab across navigations,
+    so the CDP calls are skipped when the tab already has the right ones.
+    Returns the profile name ("lean" or "full") for page-load stats.
+    """
+    patterns = blocked_patterns(url)
+    profile = "lean" if patterns else "full"
+    state = driver.__dict__.setdefault("_lean_profile_state", {})
+    handle = handle or driver.current_window_handle
+    if state.get(handle, ((), "full"))[0] != patterns:
+        try:
+            if handle not in state:
+                driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(patterns)})
+        except Exception as e:
+            print(f"[LeanProfile] Could not set blocked URLs: {e}")
+            profile = "full"
+    state[handle] = (patterns, profile)
+    return profile
+
+
+def reset_lean_profile(driver):
+    """
+    Unblock everything again in the driver's remaining tab and forget every tab's
+    patterns, e.g. before a pooled browser is leased to the next caller.
+    """
+    state = driver.__dict__.get("_lean_profile_state", {})
+    if state.get(driver.current_window_handle, ((), "full"))[0]:
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": []})
+    state.clear()
+
+
+class PageLoadStats:
+    """Bytes transferred and load time per browser-loaded product page, per profile."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals: dict[str, dict] = {}
+
+    def record(self, driver, seconds: float, handle: str = None):
+        """Measure the page now showing in the current tab and add it to its profile's totals."""
+        try:
+            state = driver.__dict__.get("_lean_profile_state", {})
+            profile = state.get(handle or driver.current_window_handle, ((), "full"))[1]
+            weight = driver.execute_script(_PAGE_WEIGHT_SCRIPT) or {}
+        except Exception:
+            return
+        with self._lock:
+            totals = self.totals.setdefault(profile, {"pages": 0, "bytes": 0, "requests": 0, "seconds": 0.0})
+            totals["pages"] += 1
+            totals["bytes"] += int(weight.get("bytes") or 0)
+            totals["requests"] += int(weight.get("requests") or 0)
+            totals["seconds"] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                profile: {
+                    "pages": t["pages"],
+                    "avg_kb": round(t["bytes"] / t["pages"] / 1024, 1),
+                    "avg_requests": round(t["requests"] / t["pages"], 1),
+                    "avg_load_seconds": round(t["seconds"] / t["pages"], 2),
+                }
+                for profile, t in self.totals.items() if t["pages"]
+            }
+
+
+page_load_stats = PageLoadStats()
@@ -1,24 +1,163 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
 import os
+import threading
+import time
 from functools import lru_cache
 from typing import Optional
-from openai import OpenAI
+import httpx
+import openai
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
+import config
+from disk_cache import PersistentCache
+from llm_limiter import get_llm_limiter, llm_tags, estimate_request_tokens
+from llm_metrics import llm_metrics, LLMCall
+from recorder import get_cassette, Cassette
+
 load_dotenv()
 
 
+@lru_cache()
+def get_llm_cache() -> PersistentCache:
+    """Process-wide cache of structured LLM responses (JSON strings), see LLMClient.structured_output."""
+    return PersistentCache("llm", ttl=config.LLM_CACHE_TTL, max_entries=config.LLM_CACHE_MAX_ENTRIES, memory_entries=2048)
+
+
+@lru_cache(maxsize=64)
+def _schema_fingerprint(response_format: type) -> str:
+    # A changed response model (fields, descriptions) must not be answered from old entries
+    schema = json.dumps(response_format.model_json_schema(), sort_keys=True)
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()[:16]
+
+
+@lru_cache()
+def get_llm_loop() -> asyncio.AbstractEventLoop:
+    """
+    The event loop every LLM request runs on, in its own daemon thread.
+    Callers in worker threads go through run_on_llm_loop(); async code submits
+    coroutines with asyncio.run_coroutine_threadsafe(coro, get_llm_loop()).
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+    return loop
+
+
+def submit_on_llm_loop(coro) -> concurrent.futures.Future:
+    """Schedule a coroutine on the LLM loop, carrying the caller's llm_tags along."""
+    tags = llm_tags.get()
+
+    async def tagged():
+        llm_tags.set(tags)
+        return await coro
+
+    return asyncio.run_coroutine_threadsafe(tagged(), get_llm_loop())
+
+
+def run_on_llm_loop(coro):
+    """Run a coroutine on the LLM loop and block the calling thread for its result."""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is get_llm_loop():
+        coro.close()
+        raise RuntimeError("Blocking LLM call made from the LLM loop; await the async method instead")
+    return submit_on_llm_loop(coro).result()
+
+
 class LLMClient:
-    """Reusable OpenAI client wrapper for various LLM queries."""
+    """
+    Reusable OpenAI client wrapper for various LLM queries.
+    
+    Requests go through one AsyncOpenAI client with a pooled HTTP connection set
+    (config.LLM_MAX_CONNECTIONS), on the shared LLM event loop. The a-prefixed
+    methods are the implementation; the sync ones block on them for thread callers.
+    Every API request waits for the shared rate limiter (see llm_limiter.py) and is
+    retried here on 429s and transient errors, instead of by the SDK.
+    Every call, cached or not, is recorded in llm_metrics (latency, tokens, retries).
+    """
 
     def __init__(self, api_key: Optional[str] = None, model: str = "gpt-4o-mini"):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        if not self.api_key:
+        cassette = get_cassette()
+        if not self.api_key and not (cassette and cassette.replaying):
             raise ValueError("OpenAI API key is required. Set OPENAI_API_KEY environment variable or pass it directly.")
         
-        self.client = OpenAI(api_key=self.api_key)
+        # A replay never reaches OpenAI, so it runs without a key
+        self.client = AsyncOpenAI(
+            api_key=self.api_key or "replay",
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=config.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.LLM_MAX_CONNECTIONS,
+                ),
+                event_hooks={"response": [self._on_http_response]},
+            ),
+        )
         self.default_model = model
 
-    def chat_completion(
+    async def _on_http_response(self, response):
+        get_llm_limiter().on_response(response.headers)
+
+    async def _request(self, send, estimated_tokens: int, call: LLMCall):
+        """
+        Send one API request through the shared rate limiter: wait for budget, then
+        retry 429s (after their retry-after) and transient failures with jittered
+        backoff, up to config.LLM_MAX_RETRIES times. Retries, queueing and token
+        usage go on call.
+        """
+        limiter = get_llm_limiter()
+        for attempt in range(config.LLM_MAX_RETRIES + 1):
+            call.retries = attempt
+            queued_at = time.monotonic()
+            await limiter.acquire(estimated_tokens)
+            call.queued_seconds += time.monotonic() - queued_at
+            try:
+                response = await send()
+            except openai.RateLimitError as e:
+                # A failed attempt used none of the tokens it reserved: give them back
+                limiter.settle(estimated_tokens, 0)
+                if getattr(e, "code", None) == "insufficient_quota" or attempt == config.LLM_MAX_RETRIES:
+                    raise
+                delay = limiter.on_rate_limited(e.response.headers, attempt)
+            except (openai.APIConnectionError, openai.InternalServerError):
+                limiter.settle(estimated_tokens, 0)
+                if attempt == config.LLM_MAX_RETRIES:
+                    raise
+                delay = limiter.on_transient_error(attempt)
+            except openai.APIStatusError:
+                limiter.settle(estimated_tokens, 0)
+                raise
+            else:
+                limiter.on_success()
+                usage = getattr(response, "usage", None)
+                limiter.settle(estimated_tokens, getattr(usage, "total_tokens", None))
+                call.add_usage(usage)
+                return response
+            await asyncio.sleep(delay)
+
+    # ---- sync API (thin wrappers) ------------------------------------------
+
+    def chat_completion(self, *args, **kwargs) -> str:
+        """Send a chat completion request and return the response content."""
+        return run_on_llm_loop(self.achat_completion(*args, **kwargs))
+
+    def structured_output(self, *args, **kwargs):
+        """Blocking astructured_output(); see there for the arguments."""
+        return run_on_llm_loop(self.astructured_output(*args, **kwargs))
+
+    def create_response(self, *args, **kwargs) -> str:
+        """Blocking acreate_response(); see there for the arguments."""
+        return run_on_llm_loop(self.acreate_response(*args, **kwargs))
+
+    # ---- async API ---------------------------------------------------------
+
+    async def achat_completion(
         self,
         messages: list[dict],
         model: Optional[str] = None,
@@ -27,32 +166,47 @@ class LLMClient:
         tools: Optional[list[dict]] = None,
     ) -> str:
         """Send a chat completion request and return the response content."""
-        response = self.client.chat.completions.create(
-            model=model or self.default_model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            tools=tools,
-        )
+        model = model or self.default_model
+        with llm_metrics.measure(model, "chat_completion") as call:
+            response = await self._request(
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    tools=tools,
+                ),
+                estimate_request_tokens(messages, max_tokens),
+                call,
+            )
         return response.choices[0].message.content
 
-    def structured_output(
+    async def astructured_output(
         self,
         messages: list[dict],
         response_format: type,
         model: Optional[str] = None,
         temperature: float = 0.3,
         tools: Optional[list[dict]] = None,
+        cache_key: Optional[dict] = None,
+        prompt_version: str = "",
     ):
         """
         Send a chat completion request with structured output.
         
+        Responses are cached persistently (see get_llm_cache). By default the cache
+        key is the exact request; callers whose prompt is built from a few inputs pass
+        those, normalized, as cache_key together with a prompt_version they bump
+        whenever the prompt's wording changes.
+        
         Args:
             messages: List of chat messages
             response_format: A Pydantic model class for the structured response
             model: Model to use (defaults to instance default)
             temperature: Lower temperature for more consistent structured outputs
             tools: List of tools to enable for the model (e.g. web_search)
+            cache_key: Normalized inputs the prompt was built from (JSON-serializable)
+            prompt_version: Version of the prompt template, part of the cache key
             
         Returns:
             Parsed Pydantic model instance
@@ -69,11 +223,49 @@ class LLMClient:
         }
         if tools is not None:
             kwargs["tools"] = tools
-            
-        response = self.client.beta.chat.completions.parse(**kwargs)
-        return response.choices[0].message.parsed
+        
+        if cache_key is None:
+            cache_key = {"messages": messages, "temperature": temperature, "tools": tools}
+        cached = await self.acached_output(response_format, cache_key, prompt_version, model=kwargs["model"])
+        if cached is not None:
+            return cached
+        
+        # Record/replay (see recorder.py): responses are keyed by the full request
+        cassette = get_cassette()
+        if cassette:
+            key = Cassette.llm_key(
+                model=kwargs["model"],
+                messages=messages,
+                response_format=response_format.__name__,
+                temperature=temperature,
+                tools=tools,
+            )
+        
+        with llm_metrics.measure(kwargs["model"], response_format.__name__) as call:
+            if cassette and cassette.replaying:
+                call.cache = "replay"
+                started = time.time()
+                recording = cassette.llm(key)
+                if recording is None:
+                    raise LookupError(f"No recorded {response_format.__name__} response for this request")
+                await asyncio.sleep(cassette.delay(recording["seconds"], since=started))
+                parsed = response_format.model_validate_json(recording["response"])
+            else:
+                started = time.time()
+                response = await self._request(
+                    lambda: self.client.beta.chat.completions.parse(**kwargs),
+                    estimate_request_tokens(messages),
+                    call,
+                )
+                parsed = response.choices[0].message.parsed
+                if cassette and cassette.recording and parsed is not None:
+                    cassette.record_llm(key, parsed.model_dump_json(), time.time() - started)
+        
+        if parsed is not None:
+            await self.acache_output(response_format, cache_key, prompt_version, parsed, model=kwargs["model"])
+        return parsed
 
-    def create_response(
+    async def acreate_response(
         self,
         input_text: str,
         model: Optional[str] = None,
@@ -89,15 +281,62 @@ class LLMClient:
         # or rely on default. The user prompt suggests o4-mini, gpt-5 etc. 
         # But we will use the class default or passed model.
         
-        response = self.client.responses.create(
-            model=model or self.default_model,
-            input=input_text,
-            tools=tools,
-            reasoning=reasoning,
-            tool_choice=tool_choice,
-        )
+        model = model or self.default_model
+        with llm_metrics.measure(model, "response") as call:
+            response = await self._request(
+                lambda: self.client.responses.create(
+                    model=model,
+                    input=input_text,
+                    tools=tools,
+                    reasoning=reasoning,
+                    tool_choice=tool_choice,
+                ),
+                estimate_request_tokens([{"content": input_text}]),
+                call,
+            )
         return response.output_text
 
+    # ---- response cache ----------------------------------------------------
+
+    def _cache_entry_key(self, response_format: type, cache_key: dict, prompt_version: str, model: Optional[str]) -> str:
+        payload = json.dumps(
+            [model or self.default_model, response_format.__name__, _schema_fingerprint(response_format), prompt_version, cache_key],
+            sort_keys=True, ensure_ascii=False, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _cache_enabled(self) -> bool:
+        # While recording, every response has to reach the cassette
+        cassette = get_cassette()
+        return config.LLM_CACHE_ENABLED and not (cassette and cassette.recording)
+
+    def cached_output(self, response_format: type, cache_key: dict, prompt_version: str = "", model: Optional[str] = None):
+        """The cached response for these inputs as a response_format instance, or None. A hit counts as a call in llm_metrics."""
+        if not self._cache_enabled():
+            return None
+        cached = get_llm_cache().get(self._cache_entry_key(response_format, cache_key, prompt_version, model))
+        if cached is None:
+            return None
+        with llm_metrics.measure(model or self.default_model, response_format.__name__) as call:
+            call.cache = "hit"
+            return response_format.model_validate_json(cached)
+
+    def cache_output(self, response_format: type, cache_key: dict, prompt_version: str, value, model: Optional[str] = None):
+        """Store a response for these inputs, e.g. one product's share of a batched response."""
+        if self._cache_enabled():
+            get_llm_cache().set(self._cache_entry_key(response_format, cache_key, prompt_version, model), value.model_dump_json())
+
+    # The cache reads and writes SQLite, which would stall every request in flight on
+    # the LLM loop; from the loop, go through these. asyncio.to_thread carries the
+    # llm_tags of the caller over to the hit's llm_metrics call.
+
+    async def acached_output(self, *args, **kwargs):
+        """cached_output() in a worker thread."""
+        return await asyncio.to_thread(self.cached_output, *args, **kwargs)
+
+    async def acache_output(self, *args, **kwargs):
+        """cache_output() in a worker thread."""
+        return await asyncio.to_thread(self.cache_output, *args, **kwargs)
 
 @lru_cache()
 def get_llm_client() -> LLMClient:
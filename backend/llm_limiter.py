@@ -0,0 +1,239 @@
+import asyncio
+import contextvars
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Optional
+
+import config
+
+# Tags for the LLM calls made in this context (task_id, ...). run_on_llm_loop carries
+# them from the calling thread onto the LLM loop.
+llm_tags: contextvars.ContextVar[dict] = contextvars.ContextVar("llm_tags", default={})
+
+
+@contextmanager
+def tag_llm_calls(**tags):
+    """Tag LLM calls made inside the block, e.g. with tag_llm_calls(task_id=task_id): ..."""
+    token = llm_tags.set({**llm_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        llm_tags.reset(token)
+
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value: str) -> Optional[float]:
+    """OpenAI reset durations ("1s", "6m0s", "120ms") in seconds."""
+    parts = _DURATION_RE.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def retry_after(headers) -> Optional[float]:
+    """Seconds to wait from retry-after-ms / retry-after headers, if the server sent them."""
+    if headers is None:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1)):
+        try:
+            return float(headers.get(name)) * scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def estimate_request_tokens(messages: list[dict], max_output_tokens: int = None) -> int:
+    """Rough token cost of a chat request (about 4 characters per token) plus its expected output."""
+    chars = sum(len(str(message.get("content") or "")) for message in messages)
+    return chars // 4 + (max_output_tokens or config.LLM_EXPECTED_OUTPUT_TOKENS)
+
+
+class AdaptiveRateLimiter:
+    """
+    Process-wide budget for OpenAI requests, shared by every search.
+
+    Two token buckets (requests and tokens per minute) start from config and follow
+    the x-ratelimit-* headers OpenAI sends back. Callers wait in one queue per task,
+    served round-robin, so a search scoring 40 products can't starve one scoring 4.
+
+    A 429 pauses everyone until its retry-after and halves the rate we allow
+    ourselves; successes raise it back gradually (AIMD), so under load we settle just
+    below the real limit instead of bouncing off it.
+    """
+
+    def __init__(self, requests_per_minute: int = None, tokens_per_minute: int = None):
+        self.request_limit = requests_per_minute or config.LLM_REQUESTS_PER_MINUTE
+        self.token_limit = tokens_per_minute or config.LLM_TOKENS_PER_MINUTE
+        self.rate_scale = 1.0
+        self._requests = float(self.request_limit)
+        self._tokens = float(self.token_limit)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._queues: dict[str, deque] = {}
+        self._rotation: deque = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._dispatcher = None
+        self._lock = threading.Lock()  # guards stats read from other threads
+        self.counts = {"requests": 0, "rate_limited": 0, "retries": 0, "waited_seconds": 0.0}
+
+    # ---- budget ------------------------------------------------------------
+
+    def _refill(self, now: float):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._requests = min(self.request_limit, self._requests + elapsed * self.request_limit * self.rate_scale / 60)
+        self._tokens = min(self.token_limit, self._tokens + elapsed * self.token_limit * self.rate_scale / 60)
+
+    def _wait_for(self, tokens: int) -> float:
+        """Seconds until one request of this many tokens fits the budget."""
+        request_wait = (1 - self._requests) * 60 / (self.request_limit * self.rate_scale) if self._requests < 1 else 0.0
+        token_wait = (tokens - self._tokens) * 60 / (self.token_limit * self.rate_scale) if self._tokens < tokens else 0.0
+        return max(request_wait, token_wait)
+
+    # ---- queueing ----------------------------------------------------------
+
+    async def acquire(self, tokens: int):
+        """Wait for this task's turn and for budget for one request of ~tokens tokens."""
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+        key = str(llm_tags.get().get("task_id") or "")
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.setdefault(key, deque())
+        if not queue:
+            self._rotation.append(key)
+        # A request bigger than the whole bucket would never fit; let it through on a full one
+        queue.append((future, min(tokens, self.token_limit)))
+        self._wake.set()
+        started = time.monotonic()
+        await future
+        with self._lock:
+            self.counts["requests"] += 1
+            self.counts["waited_seconds"] += time.monotonic() - started
+
+    async def _dispatch(self):
+        # Runs while anyone is waiting; acquire() starts it again when needed
+        while True:
+            if not self._rotation:
+                self._dispatcher = None
+                return
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            key = self._rotation[0]
+            queue = self._queues[key]
+            future, tokens = queue[0]
+            if future.cancelled():
+                queue.popleft()
+            else:
+                self._refill(now)
+                wait = self._wait_for(tokens)
+                if wait > 0:
+                    # Re-check at least every half second: headers may have changed the budget
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=min(wait, 0.5))
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                self._requests -= 1
+                self._tokens -= tokens
+                queue.popleft()
+                future.set_result(None)
+            # Round-robin: this task goes to the back of the line
+            self._rotation.popleft()
+            if queue:
+                self._rotation.append(key)
+            else:
+                del self._queues[key]
+
+    # ---- feedback ----------------------------------------------------------
+
+    def on_response(self, headers):
+        """Follow the server's view of our limits (x-ratelimit-* response headers)."""
+        try:
+            limit_requests = headers.get("x-ratelimit-limit-requests")
+            limit_tokens = headers.get("x-ratelimit-limit-tokens")
+            remaining_requests = headers.get("x-ratelimit-remaining-requests")
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            if limit_requests:
+                self.request_limit = max(1, int(limit_requests))
+            if limit_tokens:
+                self.token_limit = max(1, int(limit_tokens))
+            now = time.monotonic()
+            self._refill(now)
+            if remaining_requests is not None:
+                self._requests = min(self._requests, float(remaining_requests))
+                if float(remaining_requests) <= 0:
+                    self._pause(parse_reset(headers.get("x-ratelimit-reset-requests")))
+            if remaining_tokens is not None:
+                self._tokens = min(self._tokens, float(remaining_tokens))
+                if float(remaining_tokens) <= 0:
+                    self._pause(parse_reset(headers.get("x-ratelimit-reset-tokens")))
+        except (TypeError, ValueError):
+            pass
+        if self._wake is not None:
+            self._wake.set()
+
+    def on_success(self):
+        self.rate_scale = min(1.0, self.rate_scale + config.LLM_RATE_RECOVERY)
+
+    def on_rate_limited(self, headers, attempt: int) -> float:
+        """A 429: pause every caller and slow down. Returns how long this caller should back off."""
+        with self._lock:
+            self.counts["rate_limited"] += 1
+            self.counts["retries"] += 1
+        self.rate_scale = max(config.LLM_RATE_MIN_SCALE, self.rate_scale / 2)
+        delay = retry_after(headers)
+        if delay is None:
+            delay = self.backoff(attempt)
+        self._pause(delay)
+        return delay
+
+    def on_transient_error(self, attempt: int) -> float:
+        """A connection error or 5xx. Returns how long this caller should back off."""
+        with self._lock:
+            self.counts["retries"] += 1
+        return self.backoff(attempt)
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(config.LLM_BACKOFF_MAX, config.LLM_BACKOFF_BASE * 2 ** attempt))
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """Give back (or take) the difference between a request's estimated and real token count."""
+        if actual is not None:
+            self._tokens = min(self.token_limit, self._tokens + estimated - actual)
+
+    def _pause(self, seconds: Optional[float]):
+        if seconds:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        counts["waited_seconds"] = round(counts["waited_seconds"], 2)
+        return {
+            **counts,
+            "requests_per_minute": self.request_limit,
+            "tokens_per_minute": self.token_limit,
+            "rate_scale": round(self.rate_scale, 2),
+            "queued": {key or "untagged": len(queue) for key, queue in list(self._queues.items())},
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2),
+        }
+
+
+@lru_cache()
+def get_llm_limiter() -> AdaptiveRateLimiter:
+    """The process-wide limiter. Used from the LLM event loop only (see llm_client.get_llm_loop)."""
+    return AdaptiveRateLimiter()
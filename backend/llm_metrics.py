@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Optional
+
+import config
+from deadlines import percentile
+from llm_limiter import llm_tags
+
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """USD cost of one call at config.LLM_PRICES (per million tokens); 0 for unpriced models."""
+    prices = config.LLM_PRICES.get(model)
+    if prices is None:
+        # Dated snapshots ("gpt-4o-mini-2024-07-18") bill like their base model
+        bases = [name for name in config.LLM_PRICES if model.startswith(name + "-")]
+        prices = config.LLM_PRICES[max(bases, key=len)] if bases else (0.0, 0.0)
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class LLMCall:
+    """One LLMClient call as it happens; filled in by the client, recorded by LLMMetrics.measure()."""
+
+    def __init__(self, model: str, stage: str, task_id: Optional[str]):
+        self.model = model
+        self.stage = stage
+        self.task_id = task_id
+        self.cache = "miss"          # "hit" (LLM cache), "replay" (cassette) or "miss" (sent to OpenAI)
+        self.retries = 0
+        self.queued_seconds = 0.0    # waiting on the rate limiter
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0       # prompt tokens OpenAI served from its prompt cache
+        self.ok = True
+        self.started = time.monotonic()
+        self.seconds = 0.0
+
+    def add_usage(self, usage):
+        """Count a response's usage block (chat completions and Responses API name it differently)."""
+        if usage is None:
+            return
+        self.prompt_tokens += getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None) or 0
+        self.completion_tokens += getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", None) or 0
+        details = getattr(usage, "prompt_tokens_details", None) or getattr(usage, "input_tokens_details", None)
+        self.cached_tokens += getattr(details, "cached_tokens", None) or 0
+
+    @property
+    def cost(self) -> float:
+        return call_cost(self.model, self.prompt_tokens, self.completion_tokens)
+
+
+class _Totals:
+    """Counters summed over a set of calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cost = 0.0
+        self.seconds = 0.0
+        self.queued_seconds = 0.0
+
+    def add(self, call: LLMCall):
+        self.calls += 1
+        self.errors += not call.ok
+        self.cache_hits += call.cache == "hit"
+        self.retries += call.retries
+        self.prompt_tokens += call.prompt_tokens
+        self.completion_tokens += call.completion_tokens
+        self.cached_tokens += call.cached_tokens
+        self.cost += call.cost
+        self.seconds += call.seconds
+        self.queued_seconds += call.queued_seconds
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "cache_hits": self.cache_hits,
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_prompt_tokens": self.cached_tokens,
+            "cost_usd": round(self.cost, 6),
+            "llm_seconds": round(self.seconds, 3),
+            "queued_seconds": round(self.queued_seconds, 3),
+        }
+
+
+class _TaskUsage(_Totals):
+    """A task's totals, plus the wall time during which at least one of its calls was in flight."""
+
+    def __init__(self):
+        super().__init__()
+        self.by_stage: dict[str, _Totals] = {}
+        self.in_flight = 0
+        self.busy_since = 0.0
+        self.busy_seconds = 0.0
+
+    def snapshot(self) -> dict:
+        busy = self.busy_seconds + (time.monotonic() - self.busy_since if self.in_flight else 0.0)
+        return {
+            **super().snapshot(),
+            # Calls overlap, so llm_seconds can exceed the task's wall time; this can't
+            "llm_wall_seconds": round(busy, 3),
+            "by_stage": {stage: totals.snapshot() for stage, totals in self.by_stage.items()},
+        }
+
+
+class LLMMetrics:
+    """
+    Latency, tokens, cost, retries and cache status of every LLMClient call, tagged
+    with the stage and task_id from tag_llm_calls(). Keeps process totals, rolling
+    latency percentiles per stage and model (last config.LLM_METRICS_WINDOW calls),
+    and per-task totals for the most recent config.LLM_METRICS_MAX_TASKS tasks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = _Totals()
+        self._by_stage: dict[str, _Totals] = {}
+        self._by_model: dict[str, _Totals] = {}
+        self._latency: dict[tuple, deque] = {}
+        self._tasks: OrderedDict[str, _TaskUsage] = OrderedDict()
+
+    @contextmanager
+    def measure(self, model: str, stage: str):
+        """
+        Time the call made inside the block; yields its LLMCall for the client to fill
+        in. stage is the fallback when the caller didn't tag one.
+        """
+        tags = llm_tags.get()
+        call = LLMCall(model, tags.get("stage") or stage, tags.get("task_id"))
+        self._started(call)
+        try:
+            yield call
+        except BaseException:
+            call.ok = False
+            raise
+        finally:
+            call.seconds = time.monotonic() - call.started
+            self._record(call)
+
+    def _task(self, task_id: str) -> _TaskUsage:
+        usage = self._tasks.get(task_id)
+        if usage is None:
+            usage = self._tasks[task_id] = _TaskUsage()
+            while len(self._tasks) > config.LLM_METRICS_MAX_TASKS:
+                self._tasks.popitem(last=False)
+        return usage
+
+    def _started(self, call: LLMCall):
+        if not call.task_id:
+            return
+        with self._lock:
+            usage = self._task(call.task_id)
+            if usage.in_flight == 0:
+                usage.busy_since = call.started
+            usage.in_flight += 1
+
+    def _record(self, call: LLMCall):
+        with self._lock:
+            self._totals.add(call)
+            self._by_stage.setdefault(call.stage, _Totals()).add(call)
+            self._by_model.setdefault(call.model, _Totals()).add(call)
+            # Cache hits take microseconds; they'd drown the latencies worth sizing for
+            if call.cache != "hit":
+                self._latency.setdefault((call.stage, call.model), deque(maxlen=config.LLM_METRICS_WINDOW)).append(call.seconds)
+            if call.task_id:
+                usage = self._task(call.task_id)
+                usage.add(call)
+                usage.by_stage.setdefault(call.stage, _Totals()).add(call)
+                if usage.in_flight > 0:
+                    usage.in_flight -= 1
+                    if usage.in_flight == 0:
+                        usage.busy_seconds += time.monotonic() - usage.busy_since
+
+    def task_summary(self, task_id: str) -> Optional[dict]:
+        """LLM usage of one task, or None if it made no calls (or has been evicted)."""
+        with self._lock:
+            usage = self._tasks.get(task_id)
+            return usage.snapshot() if usage is not None else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latency = {
+                f"{stage}/{model}": {
+                    "samples": len(samples),
+                    "p50": round(percentile(ordered := sorted(samples), 50), 3),
+                    "p90": round(percentile(ordered, 90), 3),
+                    "p99": round(percentile(ordered, 99), 3),
+                    "max": round(ordered[-1], 3),
+                }
+                for (stage, model), samples in self._latency.items() if samples
+            }
+            return {
+                "totals": self._totals.snapshot(),
+                "by_stage": {stage: totals.snapshot() for stage, totals in self._by_stage.items()},
+                "by_model": {model: totals.snapshot() for model, totals in self._by_model.items()},
+                "latency_seconds": latency,
+            }
+
+
+llm_metrics = LLMMetrics()
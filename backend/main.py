@@ -1,12 +1,25 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
-import concurrent.futures
 import threading
+import time
 
 from models import SearchRequest, TaskCreatedResponse, TaskStatusResponse, TaskStatus
 from tasks import task_manager
 from query_transformer import transform_user_query
-from scraper import scrape_google_products_streaming
-from ranker import score_product
+from scraper import scrape_google_products_streaming, get_serp_cache
+from ranker import BatchScorer
+from llm_client import get_llm_cache
+from llm_limiter import get_llm_limiter, tag_llm_calls
+from llm_metrics import llm_metrics
+from driver_pool import get_driver_pool
+from redirect_cache import get_redirect_cache
+from http_fetcher import fetch_tier_stats
+from lean_profile import page_load_stats
+from html_workers import html_worker_stats
+from fetch_scheduler import get_fetch_scheduler
+from deadlines import Deadline, hedge_stats
+from product_dedup import dedup_stats, expand_duplicates
+from prerank import LexicalPreRanker, prerank_stats
+import config
 
 tags_metadata = [
     {
@@ -54,6 +67,12 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+def warm_driver_pool():
+    """Launch the pooled browsers before the first search arrives."""
+    get_driver_pool()
+
+
 def run_search_task(task_id: str, query: str, country: str = "US"):
     """
     Background task that performs the actual product search pipeline.
@@ -61,7 +80,12 @@ def run_search_task(task_id: str, query: str, country: str = "US"):
     Pipeline (Streaming):
     1. Transform user query → Google search query + features
     2. Scrape products and rank them IN PARALLEL as they arrive
+    
+    The whole search runs against a latency budget (config.SEARCH_BUDGET_SECONDS):
+    once it runs out, or once enough good products are scored, the task finishes
+    with what it has instead of waiting for stragglers.
     """
+    deadline = Deadline()
     try:
         # Update task status to running
         task_manager.update_task_status(task_id, TaskStatus.RUNNING)
@@ -74,7 +98,8 @@ def run_search_task(task_id: str, query: str, country: str = "US"):
 
         # Step 1: Transform user query into structured search data
         print(f"[Task {task_id}] Step 1: Transforming user query...")
-        search_data = transform_user_query(query)
+        with tag_llm_calls(task_id=task_id, stage="transform"):
+            search_data = transform_user_query(query)
         print(f"[Task {task_id}] ✓ Google Query: {search_data.google_search_query}")
         print(f"[Task {task_id}] ✓ Features: {search_data.product_features}")
         print(f"[Task {task_id}] ✓ Category: {search_data.product_category}")
@@ -94,20 +119,40 @@ def run_search_task(task_id: str, query: str, country: str = "US"):
         rank_futures = []
         products_scraped = 0
         products_scored = 0
+        products_failed = 0  # scoring futures that raised; done all the same
         total_products = 20  # Will be updated when we know actual count
         lock = threading.Lock()
         
-        # Create ranking executor that stays open during scraping
-        rank_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+        # Products are grouped into batched scoring requests as they stream in;
+        # the requests run on the shared LLM event loop
+        batch_scorer = BatchScorer(query, tags={"task_id": task_id})
+        # Local BM25 against the transformed query: clear mismatches never reach the LLM,
+        # and the batch scorer sends the best candidates first
+        preranker = LexicalPreRanker.for_search(search_data) if config.PRERANK_ENABLED else None
         
         # Queue for completed ranking futures - allows streaming during scraping
         from queue import Queue
         done_queue = Queue()
         scraping_done = threading.Event()
+        # Set once enough good products are scored: stops fetching and ranking early
+        enough_products = threading.Event()
+        # Set once results are final: late rankings are ignored from then on
+        finished = threading.Event()
+        good_products = 0
         
         def on_product_scraped(product):
             """Called immediately when a product is scraped - submits it for ranking."""
             nonlocal products_scraped
+            if enough_products.is_set() or deadline.expired():
+                return
+            if preranker is not None:
+                rank = preranker.add(product)
+                prerank_stats.add("scored")
+                if preranker.is_mismatch(rank):
+                    prerank_stats.add("dropped")
+                    print(f"[Task {task_id}] Skipping unrelated product: {product.get('name', 'Unknown')[:40]}")
+                    return
+                product = {**product, "prerank_score": rank.score}
             with lock:
                 products_scraped += 1
                 current_scraped = products_scraped
@@ -124,45 +169,57 @@ def run_search_task(task_id: str, query: str, country: str = "US"):
                 progress_percent=progress
             )
             
-            # Submit to ranking immediately and add callback for when done
-            future = rank_executor.submit(score_product, product, query)
+            # Submit to ranking and add callback for when done
+            future = batch_scorer.submit(product)
             future.add_done_callback(lambda f: done_queue.put(f))
             with lock:
                 rank_futures.append(future)
         
         def ranking_monitor():
             """Monitor thread: streams ranked products to UI as they complete."""
-            nonlocal products_scored
-            while True:
+            nonlocal products_scored, products_failed, good_products
+            while not (finished.is_set() or enough_products.is_set() or deadline.expired()):
                 try:
                     # Wait for a completed future (with timeout to check if done)
-                    future = done_queue.get(timeout=0.5)
+                    future = done_queue.get(timeout=0.1)
                     try:
                         scored_product = future.result()
                         with lock:
+                            if finished.is_set():
+                                break
                             scored_products.append(scored_product)
                             products_scored += 1
                             current_scored = products_scored
                             total_to_rank = len(rank_futures)
+                            if scored_product.get("scores", {}).get("final_score", 0) >= config.SEARCH_GOOD_SCORE:
+                                good_products += 1
+                                if good_products >= config.SEARCH_ENOUGH_PRODUCTS:
+                                    enough_products.set()
                         
-                        # Update progress - ranking phase is 40-95%
-                        progress = 40 + int((current_scored / max(total_to_rank, 1)) * 55)
-                        task_manager.update_task_progress(
-                            task_id,
-                            current_step="ranking",
-                            step_message=f"✨ Analyzed {current_scored} of {total_to_rank} products",
-                            scored_product=scored_product,
-                            progress_percent=progress
-                        )
+                            # Update progress - ranking phase is 40-95%
+                            progress = 40 + int((current_scored / max(total_to_rank, 1)) * 55)
+                            # Near-duplicate offers collapsed by the scraper share this score
+                            expanded = expand_duplicates(scored_product)
+                            task_manager.update_task_progress(
+                                task_id,
+                                current_step="ranking",
+                                step_message=f"✨ Analyzed {current_scored} of {total_to_rank} products",
+                                scored_product=expanded[0],
+                                progress_percent=progress
+                            )
+                            for duplicate in expanded[1:]:
+                                task_manager.update_task_progress(task_id, scored_product=duplicate)
                         print(f"[Task {task_id}] Scored {current_scored}: {scored_product.get('name', 'Unknown')[:30]}")
                         
                     except Exception as e:
                         print(f"[Task {task_id}] Ranking error: {e}")
+                        with lock:
+                            products_failed += 1
                         
                 except:
                     # Timeout - check if we're done
                     with lock:
-                        all_done = scraping_done.is_set() and products_scored >= len(rank_futures)
+                        all_done = scraping_done.is_set() and products_scored + products_failed >= len(rank_futures)
                     if all_done and done_queue.empty():
                         break
         
@@ -174,21 +231,38 @@ def run_search_task(task_id: str, query: str, country: str = "US"):
         scrape_google_products_streaming(
             search_data.google_search_query,
             max_products=20,
-            on_product_ready=on_product_scraped
+            on_product_ready=on_product_scraped,
+            country=country,
+            deadline=deadline,
+            stop_event=enough_products
         )
         
-        # Signal that scraping is done
+        # Signal that scraping is done and score the last partial batch now, unless
+        # the search is already over: nobody would wait for that paid request
         scraping_done.set()
+        if enough_products.is_set() or deadline.expired():
+            batch_scorer.close()
+        else:
+            batch_scorer.flush()
         print(f"[Task {task_id}] Scraping complete. Waiting for remaining rankings...")
         
-        # Wait for monitor thread to finish processing all rankings
-        monitor_thread.join(timeout=120)  # 2 min max wait
+        # Wait for the remaining rankings, but only as long as the budget allows
+        monitor_thread.join(timeout=deadline.remaining())
+        with lock:
+            finished.set()
+            scored_products = list(scored_products)
+            if len(scored_products) < len(rank_futures):
+                print(f"[Task {task_id}] Finishing with {len(scored_products)} of {len(rank_futures)} products ranked "
+                      f"({'enough good products' if enough_products.is_set() else 'latency budget used up'})")
         
-        # Shutdown executor
-        rank_executor.shutdown(wait=False)
+        # Drop rankings that are still queued or in flight
+        batch_scorer.close()
         
-        # Sort by final score
-        scored_products.sort(key=lambda x: x.get("scores", {}).get("final_score", 0), reverse=True)
+        # Spread each cluster's score to its near-duplicates (including ones that came in after it was scored)
+        scored_products = [p for scored_product in scored_products for p in expand_duplicates(scored_product)]
+        
+        # Sort by final score (equal scores: the better lexical match first)
+        scored_products.sort(key=lambda x: (x.get("scores", {}).get("final_score", 0), x.get("prerank_score", 0)), reverse=True)
         
         # Save ranked results to file
         safe_query = "".join([c if c.isalnum() else "_" for c in query])
@@ -209,6 +283,11 @@ def run_search_task(task_id: str, query: str, country: str = "US"):
         # Mark task as completed with results
         task_manager.complete_task(task_id, scored_products)
         print(f"[Task {task_id}] ✓ Task completed successfully!")
+        usage = llm_metrics.task_summary(task_id)
+        if usage:
+            print(f"[Task {task_id}] LLM: {usage['calls']} calls ({usage['cache_hits']} cached), "
+                  f"{usage['prompt_tokens']}+{usage['completion_tokens']} tokens, ${usage['cost_usd']:.4f}, "
+                  f"{usage['llm_wall_seconds']:.1f}s of {time.time() - deadline.started_at:.1f}s wall time")
         
     except Exception as e:
         print(f"[Task {task_id}] ✗ Error: {str(e)}")
@@ -297,6 +376,7 @@ async def get_task_status(task_id: str):
         scored_count=len(task.scored_products),
         progress_percent=task.progress_percent,
         partial_results=partial_results,
+        llm_usage=llm_metrics.task_summary(task.id),
     )
 
 
@@ -313,3 +393,33 @@ async def health_check():
     Returns a simple status indicating the API is running.
     """
     return {"status": "healthy"}
+
+
+@app.get(
+    "/stats",
+    tags=["Health"],
+    summary="Pipeline statistics",
+    response_description="Cache and fetch counters for this process",
+)
+async def pipeline_stats():
+    """
+    Pipeline statistics.
+
+    Returns in-process counters useful for capacity planning: cache hit rates,
+    browser pool usage and so on.
+    """
+    return {
+        "driver_pool": get_driver_pool().stats(),
+        "redirect_cache": get_redirect_cache().stats(),
+        "serp_cache": get_serp_cache().stats(),
+        "llm_cache": get_llm_cache().stats(),
+        "llm_rate_limiter": get_llm_limiter().stats(),
+        "llm_calls": llm_metrics.snapshot(),
+        "fetch_tiers": fetch_tier_stats.snapshot(),
+        "page_loads": page_load_stats.snapshot(),
+        "html_workers": html_worker_stats.snapshot(),
+        "fetch_scheduler": get_fetch_scheduler().stats(),
+        "hedged_fetches": hedge_stats.snapshot(),
+        "near_duplicates": dedup_stats.snapshot(),
+        "prerank": prerank_stats.snapshot(),
+    }
@@ -119,6 +119,11 @@ class TaskStatusResponse(BaseModel):
         default=None,
         description="Products that have been scored so far (streaming results)"
     )
+    llm_usage: Optional[dict] = Field(
+        default=None,
+        description="LLM calls made for this task so far: latency, tokens, cost, retries and cache hits, "
+                    "in total and per stage. llm_wall_seconds is the time at least one call was in flight"
+    )
 
     model_config = {
         "json_schema_extra": {
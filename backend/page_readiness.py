@@ -0,0 +1,199 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+import config
+
+# One round-trip per check. Installs a MutationObserver on first call in each document,
+# then reports ready state, time since the last DOM mutation, time since the last
+# resource finished loading and (optionally) how many elements match a selector.
+# Times are page-relative (performance.now() starts at navigation).
+PROBE_SCRIPT = """
+if (!window.__readiness) {
+    window.__readiness = {lastMutation: performance.now()};
+    try {
+        new MutationObserver(function () { window.__readiness.lastMutation = performance.now(); })
+            .observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    } catch (e) {}
+}
+var now = performance.now();
+var lastNet = 0;
+var entries = performance.getEntriesByType('resource');
+for (var i = 0; i < entries.length; i++) {
+    if (entries[i].responseEnd > lastNet) lastNet = entries[i].responseEnd;
+}
+var selector = arguments[0];
+return {
+    pending: !!window.__tabPending,
+    state: document.readyState,
+    quiet_ms: now - window.__readiness.lastMutation,
+    net_idle_ms: now - lastNet,
+    elapsed_ms: now,
+    host: location.hostname,
+    matches: selector ? document.querySelectorAll(selector).length : -1
+};
+"""
+
+
+def probe(driver, selector: str = None) -> dict:
+    """Take one readiness snapshot of the current tab."""
+    return driver.execute_script(PROBE_SCRIPT, selector)
+
+
+def is_ready(snapshot: dict, min_matches: int = 0) -> bool:
+    """
+    A page is ready when its DOM is interactive, the wanted containers (if any) are
+    present, and it has gone quiet: no DOM mutations and no finished network requests
+    for a short window (a fully loaded document only needs the DOM to be quiet).
+    """
+    if not snapshot or snapshot.get("pending"):
+        return False
+    if snapshot["state"] not in ("interactive", "complete"):
+        return False
+    if min_matches and snapshot["matches"] < min_matches:
+        return False
+    if snapshot["quiet_ms"] < config.READY_QUIET_MS:
+        return False
+    return snapshot["state"] == "complete" or snapshot["net_idle_ms"] >= config.READY_NET_IDLE_MS
+
+
+def domain_of(url: str) -> str:
+    host = urlparse(url or "").hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+class DomainTimingProfiles:
+    """
+    Learns how long pages on each domain take to become ready and turns that into a
+    per-domain wait budget, so fast sites don't inherit the timeout of slow ones.
+    """
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._profiles = {}  # domain -> {"mean": s, "dev": s, "samples": n, "timeouts": n}
+
+    def observe(self, domain: str, seconds: float, timed_out: bool = False):
+        if not domain:
+            return
+        with self._lock:
+            profile = self._profiles.get(domain)
+            if profile is None:
+                self._profiles[domain] = {"mean": seconds, "dev": seconds / 2, "samples": 1, "timeouts": int(timed_out)}
+                return
+            # Exponentially weighted mean and mean absolute deviation
+            error = seconds - profile["mean"]
+            profile["mean"] += self.alpha * error
+            profile["dev"] += self.alpha * (abs(error) - profile["dev"])
+            profile["samples"] += 1
+            profile["timeouts"] += int(timed_out)
+
+    def max_wait(self, domain: str) -> float:
+        """Wait budget for a domain: expected ready time plus slack, within configured bounds."""
+        ceiling = config.DETAIL_PAGE_TIMEOUT
+        with self._lock:
+            profile = self._profiles.get(domain)
+            if profile is None or profile["samples"] < 3:
+                return ceiling
+            budget = profile["mean"] + 3 * profile["dev"] + 0.5
+        return max(config.READY_MIN_BUDGET, min(ceiling, budget))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {domain: dict(profile) for domain, profile in self._profiles.items()}
+
+
+timing_profiles = DomainTimingProfiles()
+
+
+class PageWait:
+    """
+    One pending wait on one tab. poll() takes a single probe and says whether the
+    wait is over, so a caller can interleave several tabs of the same browser.
+    The wait budget follows the domain the tab actually lands on, since product
+    links start out on a Google redirect.
+    """
+
+    def __init__(
+        self,
+        url: str = None,
+        selector: str = None,
+        min_matches: int = 0,
+        max_wait: float = None,
+        learn: bool = True,
+    ):
+        self.selector = selector
+        self.min_matches = min_matches
+        self.fixed_budget = max_wait
+        self.learn = learn
+        self.domain = domain_of(url) if url else ""
+        self.budget = max_wait if max_wait is not None else timing_profiles.max_wait(self.domain)
+        self.started_at = time.time()
+
+    def poll(self, driver):
+        """Probe once. Returns the final snapshot (with a "ready" flag) when done, else None."""
+        try:
+            snapshot = probe(driver, self.selector)
+        except Exception:
+            snapshot = {}
+
+        host = domain_of("//" + snapshot["host"]) if snapshot.get("host") and not snapshot.get("pending") else ""
+        if host and host != self.domain:
+            self.domain = host
+            if self.fixed_budget is None:
+                self.budget = timing_profiles.max_wait(host)
+
+        if is_ready(snapshot, self.min_matches):
+            snapshot["ready"] = True
+            if self.learn:
+                timing_profiles.observe(self.domain, snapshot["elapsed_ms"] / 1000)
+            return snapshot
+        if time.time() - self.started_at >= self.budget:
+            snapshot["ready"] = False
+            if self.learn:
+                # Treat a timeout as "slower than the budget" so the budget can grow back
+                timing_profiles.observe(self.domain, min(config.DETAIL_PAGE_TIMEOUT, self.budget * 1.5), timed_out=True)
+            return snapshot
+        return None
+
+
+def wait_for_page(
+    driver,
+    url: str = None,
+    selector: str = None,
+    min_matches: int = 0,
+    max_wait: float = None,
+    learn: bool = True,
+) -> dict:
+    """
+    Block until the current tab is ready (see is_ready) or the wait budget runs out.
+
+    Args:
+        driver: Selenium driver, already navigated
+        url: URL that was requested, used to pick the initial domain profile
+        selector: CSS selector of content that must be present
+        min_matches: How many elements must match the selector
+        max_wait: Override the learned per-domain budget
+        learn: Record the observed ready time in the domain profile
+
+    Returns:
+        The last probe snapshot, with an added "ready" flag.
+    """
+    wait = PageWait(url, selector, min_matches, max_wait, learn)
+    while True:
+        snapshot = wait.poll(driver)
+        if snapshot is not None:
+            return snapshot
+        time.sleep(config.READY_POLL_SECONDS)
+
+
+def wait_for_staleness(driver, element, timeout: float = 2) -> bool:
+    """Wait for an element to leave the DOM (e.g. a dismissed dialog)."""
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=config.READY_POLL_SECONDS).until(EC.staleness_of(element))
+        return True
+    except:
+        return False
@@ -0,0 +1,140 @@
+import math
+import threading
+from collections import Counter
+from typing import NamedTuple
+
+import config
+from product_dedup import normalize_product_name
+
+# Words that say nothing about which product it is (the transformer appends "produs romanesc")
+_STOPWORDS = {
+    "si", "sau", "de", "din", "la", "cu", "pe", "in", "pentru", "un", "o", "a", "al", "ale", "ai", "cel", "cea",
+    "the", "and", "or", "for", "with", "of", "to",
+    "produs", "produse", "romanesc", "pret", "preturi", "lei", "ron", "cumpara", "online", "magazin", "oferta",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Stemmed words: accents and case dropped, cut to config.PRERANK_STEM_LENGTH ("rochii"/"rochie" -> "roch")."""
+    stem = config.PRERANK_STEM_LENGTH
+    return [word[:stem] for word in normalize_product_name(text).split() if len(word) > 1 and word not in _STOPWORDS]
+
+
+class PreRank(NamedTuple):
+    score: float      # BM25 against the search's terms
+    matched: int      # distinct search terms the product mentions
+    tokens: int       # length of the product's text, in words
+
+
+class LexicalPreRanker:
+    """
+    Cheap local relevance of scraped products to one search, before any LLM call:
+    BM25 of the product's name (counted config.PRERANK_NAME_WEIGHT times), description
+    and breadcrumbs against the transformed query, its product_features and category.
+
+    Document frequencies come from the search's own candidates, which arrive one at a
+    time; add() scores a product against the candidates seen so far, score_all() a
+    whole list against itself. A product that mentions fewer than
+    config.PRERANK_MIN_MATCHED_TERMS of the search's terms is a clear mismatch.
+    """
+
+    def __init__(self, search_query: str, product_features: list[str] = None, product_category: str = None):
+        self.query_terms = Counter(tokenize(" ".join([search_query or "", *(product_features or []), product_category or ""])))
+        self._lock = threading.Lock()
+        self._doc_freq = Counter()
+        self._docs = 0
+        self._total_length = 0
+
+    @classmethod
+    def for_search(cls, search_data) -> "LexicalPreRanker":
+        """From transform_user_query()'s ProductSearchQuery."""
+        return cls(search_data.google_search_query, search_data.product_features, search_data.product_category)
+
+    def _document(self, product: dict) -> Counter:
+        details = product.get("details") or {}
+        description = (product.get("description") or "")[:config.PRERANK_DESCRIPTION_CHARS]
+        words = tokenize(product.get("name")) * config.PRERANK_NAME_WEIGHT
+        words += tokenize(description) + tokenize(" ".join(details.get("breadcrumbs") or []))
+        return Counter(words)
+
+    def _count(self, document: Counter):
+        self._docs += 1
+        self._total_length += sum(document.values())
+        self._doc_freq.update(term for term in document if term in self.query_terms)
+
+    def _idf(self) -> dict:
+        # The +1 inside the log keeps a term every candidate mentions from counting against it
+        n = self._docs
+        return {term: math.log(1 + (n - self._doc_freq[term] + 0.5) / (self._doc_freq[term] + 0.5)) for term in self.query_terms}
+
+    def _score(self, document: Counter, idf: dict, average_length: float) -> PreRank:
+        k1, b = config.PRERANK_BM25_K1, config.PRERANK_BM25_B
+        length = sum(document.values())
+        norm = k1 * (1 - b + b * length / average_length) if average_length else k1
+        score = 0.0
+        matched = 0
+        for term, weight in self.query_terms.items():
+            tf = document.get(term, 0)
+            if tf:
+                matched += 1
+                score += weight * idf[term] * tf * (k1 + 1) / (tf + norm)
+        return PreRank(round(score, 4), matched, length)
+
+    def add(self, product: dict) -> PreRank:
+        """Count a streamed candidate into the corpus and score it against everything seen so far."""
+        document = self._document(product)
+        with self._lock:
+            self._count(document)
+            idf = self._idf()
+            average_length = self._total_length / self._docs
+        return self._score(document, idf, average_length)
+
+    def score_all(self, products: list[dict]) -> list[PreRank]:
+        """Score a whole candidate list at once, with frequencies taken over the list."""
+        documents = [self._document(product) for product in products]
+        with self._lock:
+            for document in documents:
+                self._count(document)
+            idf = self._idf()
+            average_length = self._total_length / self._docs if self._docs else 0.0
+        return [self._score(document, idf, average_length) for document in documents]
+
+    def is_mismatch(self, rank: PreRank) -> bool:
+        # Nothing to judge by (no query terms, or a product without text) is never a mismatch
+        if not config.PRERANK_DROP_MISMATCHES or not self.query_terms or not rank.tokens:
+            return False
+        return rank.matched < config.PRERANK_MIN_MATCHED_TERMS
+
+
+class PreRankStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"scored": 0, "dropped": 0}
+
+    def add(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counts)
+
+
+prerank_stats = PreRankStats()
+
+
+def prerank_products(products: list[dict], preranker: LexicalPreRanker) -> list[dict]:
+    """
+    Drops clear mismatches and orders the rest most relevant first, each with its
+    "prerank_score". Used to send the likely winners to the LLM first.
+    """
+    ranks = preranker.score_all(products)
+    kept = [
+        ({**product, "prerank_score": rank.score}, rank.score)
+        for product, rank in zip(products, ranks)
+        if not preranker.is_mismatch(rank)
+    ]
+    prerank_stats.add("scored", len(products))
+    prerank_stats.add("dropped", len(products) - len(kept))
+    kept.sort(key=lambda pair: pair[1], reverse=True)
+    return [product for product, _ in kept]
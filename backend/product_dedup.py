@@ -0,0 +1,168 @@
+import hashlib
+import random
+import re
+import threading
+import unicodedata
+from typing import Optional
+
+import config
+from firm_index import normalize_firm
+from structured_data import normalize_price
+
+# Trademark marks and the like that Google adds to some cards of the same listing
+_MARKS_RE = re.compile(r"[®™©]|\btm\b")
+_NUMBER_RE = re.compile(r"\d+")
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_product_name(name: str) -> str:
+    """Casefolded, accent-free words: "LEGO® Star Wars - AT-AT (75313)" -> "lego star wars at at 75313"."""
+    text = unicodedata.normalize("NFKD", (name or "").casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _MARKS_RE.sub(" ", text)
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def shingles(text: str, size: int = None) -> set[str]:
+    """
+    Character shingles of the text with its spaces removed. SERP cards of one listing
+    often differ only in where words run together ("73 piese" / "73piese"), which
+    word shingles would count as a different word.
+    """
+    size = size or config.DEDUP_SHINGLE_SIZE
+    compact = text.replace(" ", "")
+    if len(compact) <= size:
+        return {compact} if compact else set()
+    return {compact[i:i + size] for i in range(len(compact) - size + 1)}
+
+
+def _price_value(price: str) -> Optional[float]:
+    """"1.299,99 lei", "1 299,99 lei" and "1299.99 RON" -> 1299.99."""
+    normalized = normalize_price(price)
+    return float(normalized) if normalized else None
+
+
+class MinHasher:
+    """MinHash signatures: the share of equal positions estimates the Jaccard similarity of two shingle sets."""
+
+    def __init__(self, num_perm: int = None, seed: int = 1):
+        rng = random.Random(seed)
+        self.params = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm or config.DEDUP_NUM_PERM)
+        ]
+
+    def signature(self, shingle_set: set[str]) -> tuple:
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingle_set]
+        if not hashes:
+            return tuple(_MERSENNE_PRIME for _ in self.params)
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self.params)
+
+    @staticmethod
+    def similarity(a: tuple, b: tuple) -> float:
+        return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class DedupStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"cards": 0, "collapsed": 0}
+
+    def add(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        counts["collapsed_ratio"] = round(counts["collapsed"] / counts["cards"], 3) if counts["cards"] else 0.0
+        return counts
+
+
+dedup_stats = DedupStats()
+
+
+class _Cluster:
+    def __init__(self, product: dict, firm: str, numbers: frozenset, price: Optional[float], signature: tuple):
+        self.product = product
+        self.firm = firm
+        self.numbers = numbers
+        self.price = price
+        self.signature = signature
+
+
+class ProductDeduplicator:
+    """
+    Groups one search's SERP cards into near-duplicate offers, as they stream in.
+
+    A card joins an earlier card's cluster when both come from the same seller, their
+    names' MinHash similarity is at least config.DEDUP_SIMILARITY, they mention the
+    same numbers (set numbers, piece counts, sizes) and their prices are within
+    config.DEDUP_MAX_PRICE_DIFF of each other. Only the first card of a cluster is
+    fetched and scored; the others ride along in its "duplicates" list.
+
+    A search has a few dozen cards, so every new card is compared with every cluster;
+    no LSH banding is needed at this size.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hasher = MinHasher()
+        self._clusters: list[_Cluster] = []
+
+    def add(self, product: dict) -> Optional[dict]:
+        """
+        The card to fetch, or None if the card is a near-duplicate of an earlier one
+        (it is then added to that card's "duplicates"). The returned card is a copy:
+        the caller's dict (e.g. a SERP cache entry) is left as it was.
+        """
+        dedup_stats.add("cards")
+        name = normalize_product_name(product.get("name"))
+        seller = product.get("firm")
+        firm = normalize_firm(seller) if seller and seller != "N/A" else ""
+        numbers = frozenset(_NUMBER_RE.findall(name))
+        price = _price_value(product.get("price"))
+        signature = self._hasher.signature(shingles(name))
+
+        with self._lock:
+            for cluster in self._clusters:
+                if self._same_offer(cluster, firm, numbers, price, signature):
+                    cluster.product["duplicates"].append(product)
+                    dedup_stats.add("collapsed")
+                    return None
+            representative = {**product, "duplicates": []}
+            self._clusters.append(_Cluster(representative, firm, numbers, price, signature))
+            return representative
+
+    @staticmethod
+    def _same_offer(cluster: _Cluster, firm: str, numbers: frozenset, price: Optional[float], signature: tuple) -> bool:
+        # Without a seller on both cards there's no telling two shops' listings apart
+        if not firm or firm != cluster.firm or numbers != cluster.numbers:
+            return False
+        if price is not None and cluster.price is not None:
+            if abs(price - cluster.price) > config.DEDUP_MAX_PRICE_DIFF * max(price, cluster.price):
+                return False
+        return MinHasher.similarity(signature, cluster.signature) >= config.DEDUP_SIMILARITY
+
+    def clusters(self) -> list[dict]:
+        """Representatives, each with its "duplicates"."""
+        with self._lock:
+            return [cluster.product for cluster in self._clusters]
+
+
+def expand_duplicates(product: dict) -> list[dict]:
+    """
+    A scored representative and its duplicates as separate results: each duplicate
+    keeps its own card (name, price, link) and takes the representative's scores.
+    """
+    duplicates = product.get("duplicates")
+    if duplicates is None:
+        return [product]
+    representative = {key: value for key, value in product.items() if key != "duplicates"}
+    expanded = [representative]
+    for duplicate in list(duplicates):
+        member = {**duplicate, "scores": product.get("scores"), "duplicate_of": product.get("link")}
+        if "known_firm" in product:
+            member["known_firm"] = product["known_firm"]
+        expanded.append(member)
+    return expanded
@@ -0,0 +1,212 @@
+import re
+from urllib.parse import urlparse
+
+import config
+from html_parser import parse_html
+from structured_data import extract_structured_data, is_complete
+
+# Main description containers used by common shop platforms (WooCommerce, PrestaShop,
+# Shopify, Gomag, MerchantPro, eMAG/Altex-style custom themes)
+DESCRIPTION_SELECTORS = [
+    '[itemprop="description"]',
+    '#description',
+    '#product-description',
+    '.product-description',
+    '.product_description',
+    '.woocommerce-product-details__short-description',
+    '.woocommerce-Tabs-panel--description',
+    '.product-single__description',
+    '.product__description',
+    '.rte',
+    '.description',
+]
+
+PRICE_SELECTORS = [
+    '[itemprop="price"]',
+    '.product-price',
+    '.product-new-price',
+    '.price ins',
+    '.price',
+    '.current-price',
+]
+
+BREADCRUMB_SELECTORS = [
+    '[itemtype*="BreadcrumbList"] [itemprop="name"]',
+    'nav[aria-label*="readcrumb"] a',
+    '.breadcrumb a',
+    '.breadcrumbs a',
+    '.woocommerce-breadcrumb a',
+]
+
+PRICE_RE = re.compile(r'(\d{1,3}(?:[.\s]\d{3})*(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?)\s*(lei|ron|eur|€|usd|\$)', re.IGNORECASE)
+
+# Footer, cookie and legal text that often wins "longest paragraph" but says nothing about the product
+BOILERPLATE_RE = re.compile(
+    r'cookie|partenerii no|our partners|gdpr|sediul social|acurate[tţț]ea|termeni|politica de|'
+    r'privacy|drepturi rezervate|all rights reserved|newsletter',
+    re.IGNORECASE,
+)
+
+NAVIGATION_CRUMBS = {"inapoi", "înapoi", "back", "home", "acasa", "acasă", "pagina principală", "pagina principala"}
+
+AVAILABILITY_PATTERNS = [
+    ("out_of_stock", re.compile(r'stoc epuizat|indisponibil|out of stock|sold out|nu este in stoc|nu este în stoc', re.IGNORECASE)),
+    ("limited", re.compile(r'stoc limitat|ultimele \d+|ultimul produs|limited stock', re.IGNORECASE)),
+    ("preorder", re.compile(r'precomand|pre-?order', re.IGNORECASE)),
+    ("in_stock", re.compile(r'[iî]n stoc|disponibil|in stock', re.IGNORECASE)),
+]
+
+
+def _meta(root, *names) -> str:
+    """First non-empty <meta> content among property/name/itemprop names."""
+    for name in names:
+        for attr in ("property", "name", "itemprop"):
+            tag = root.select_one(f'meta[{attr}="{name}"]')
+            if tag and (tag.get("content") or "").strip():
+                return tag.get("content").strip()
+    return ""
+
+
+def _clean(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def _text(node) -> str:
+    return _clean(node.get_text(" ")) if node else ""
+
+
+def _first_text(root, selectors: list[str], min_len: int = 1) -> str:
+    for selector in selectors:
+        for node in root.select(selector):
+            text = _text(node)
+            if len(text) >= min_len and not BOILERPLATE_RE.search(text[:300]):
+                return text
+    return ""
+
+
+def _extract_price(root) -> str:
+    amount = _meta(root, "product:price:amount", "og:price:amount", "price")
+    if amount:
+        currency = _meta(root, "product:price:currency", "og:price:currency", "priceCurrency") or "RON"
+        return f"{amount} {currency}"
+    for selector in PRICE_SELECTORS:
+        for node in root.select(selector):
+            content = node.get("content")
+            if content and re.match(r'^\d', content):
+                return f"{content} RON"
+            match = PRICE_RE.search(_text(node))
+            if match:
+                return match.group(0)
+    return ""
+
+
+def _extract_availability(root, page_text: str) -> str:
+    value = _meta(root, "product:availability", "og:availability", "availability")
+    if not value:
+        node = root.select_one('[itemprop="availability"]')
+        if node:
+            value = node.get("href") or node.get("content") or _text(node)
+    haystack = value or page_text[:20000]
+    for label, pattern in AVAILABILITY_PATTERNS:
+        if pattern.search(haystack.replace("InStock", "in stock").replace("OutOfStock", "out of stock")):
+            return label
+    return ""
+
+
+def _extract_breadcrumbs(root) -> list[str]:
+    for selector in BREADCRUMB_SELECTORS:
+        crumbs = [_text(n) for n in root.select(selector)]
+        crumbs = [c for c in crumbs if c and len(c) < 80 and c.lower() not in NAVIGATION_CRUMBS]
+        if crumbs:
+            # Themes often render the trail twice (mobile + desktop)
+            return list(dict.fromkeys(crumbs))[:8]
+    return []
+
+
+def _extract_description(root, max_chars: int) -> str:
+    description = _first_text(root, DESCRIPTION_SELECTORS, min_len=40)
+    if not description:
+        meta_description = _meta(root, "og:description", "description")
+        if len(meta_description) >= 40 and not BOILERPLATE_RE.search(meta_description):
+            description = meta_description
+    if not description:
+        # Fall back to the longest paragraphs on the page
+        paragraphs = sorted((_text(p) for p in root.select('p')), key=len, reverse=True)
+        description = " ".join(p for p in paragraphs[:5] if len(p) >= 40 and not BOILERPLATE_RE.search(p))
+    return description[:max_chars]
+
+
+def _host_seller(url: str) -> str:
+    host = urlparse(url or "").hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+# Fields the structured data states outright; they win over what the DOM heuristics guess
+_STRUCTURED_FIELDS = ("title", "price", "availability", "seller", "brand", "breadcrumbs")
+
+
+def _apply_structured(details: dict, structured: dict) -> dict:
+    taken = []
+    for field in _STRUCTURED_FIELDS:
+        value = structured.get(field)
+        if field == "price" and value:
+            value = f"{value} {structured.get('currency') or 'RON'}"
+        if field == "breadcrumbs" and value:
+            value = list(dict.fromkeys(c for c in value if len(c) < 80 and c.lower() not in NAVIGATION_CRUMBS))
+        if value:
+            details[field] = value
+            taken.append(field)
+    for field in ("gtin", "rating", "review_count"):
+        if structured.get(field):
+            details[field] = structured[field]
+    details["from_structured_data"] = taken
+    return details
+
+
+def distill_product_page(html: str, url: str = "", max_chars: int = None) -> dict:
+    """
+    Shrinks a fetched product page to the facts downstream stages use:
+    title, main description, price, availability, seller and breadcrumbs.
+    The description is capped at max_chars (config.DISTILL_MAX_CHARS by default).
+    
+    Pages carrying schema.org Product data (JSON-LD, OpenGraph, microdata) complete
+    enough to describe the product are distilled from that alone, without parsing
+    the DOM; "structured_data" is True for them. "from_structured_data" lists the
+    fields the page stated explicitly.
+    """
+    max_chars = max_chars or config.DISTILL_MAX_CHARS
+    if not html:
+        return {}
+    
+    structured = extract_structured_data(html)
+    if is_complete(structured):
+        details = {
+            "title": structured["title"][:300],
+            "description": structured["description"][:max_chars],
+            "price": "",
+            "availability": "",
+            "seller": (structured.get("site_name") or _host_seller(url))[:100],
+            "breadcrumbs": [],
+            "structured_data": True,
+        }
+        return _apply_structured(details, structured)
+    
+    root = parse_html(html)
+    root.remove("script, style, noscript, template, svg")
+
+    title = _meta(root, "og:title") or _first_text(root, ["h1"]) or _first_text(root, ["title"])
+    body = root.select_one("body")
+    page_text = _text(body) if body else ""
+
+    seller = _meta(root, "og:site_name") or _host_seller(url)
+
+    details = {
+        "title": title[:300],
+        "description": _extract_description(root, max_chars),
+        "price": _extract_price(root),
+        "availability": _extract_availability(root, page_text),
+        "seller": seller[:100],
+        "breadcrumbs": _extract_breadcrumbs(root),
+        "structured_data": False,
+    }
+    return _apply_structured(details, structured)
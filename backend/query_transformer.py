@@ -1,6 +1,9 @@
 from pydantic import BaseModel, Field
 from llm_client import get_llm_client
 
+# Bump when QUERY_TRANSFORM_SYSTEM_PROMPT changes, so cached transforms of the old one aren't reused
+QUERY_TRANSFORM_PROMPT_VERSION = "transform-v1"
+
 
 class ProductSearchQuery(BaseModel):
     """Structured output for transforming user product descriptions into search-ready formats."""
@@ -61,6 +64,8 @@ def transform_user_query(user_query: str) -> ProductSearchQuery:
     result = client.structured_output(
         messages=messages,
         response_format=ProductSearchQuery,
+        cache_key={"query": " ".join(user_query.split())},
+        prompt_version=QUERY_TRANSFORM_PROMPT_VERSION,
     )
     result.google_search_query = result.google_search_query + " produs romanesc"
     return result
@@ -1,6 +1,16 @@
+import asyncio
 import concurrent.futures
+import threading
+import time
 from pydantic import BaseModel, Field
-from llm_client import get_llm_client
+
+import config
+from firm_index import get_firm_index
+from llm_client import get_llm_client, run_on_llm_loop, submit_on_llm_loop
+from llm_metrics import llm_metrics
+from recorder import get_cassette, Cassette
+from llm_limiter import tag_llm_calls
+from prerank import prerank_products
 
 class ProductScore(BaseModel):
     small_business_score: int = Field(description="0-100. High for small/unknown businesses, Low (0-20) for giants like eMag, Amazon.")
@@ -9,12 +19,108 @@ class ProductScore(BaseModel):
     final_score: int = Field(description="Weighted average: 40% Small Biz, 30% Similarity, 30% Trust.")
     reasoning: str = Field(description="Brief explanation of the scores. Mention any sources found via web search.")
 
+# Bump when a prompt's wording changes, so cached responses to the old one aren't reused
+SCORE_PROMPT_VERSION = "score-v1"
+SIMILARITY_PROMPT_VERSION = "similarity-v1"
+
+
+def _normalize_text(value) -> str:
+    return " ".join(str(value or "").casefold().split())
+
+
+def product_fingerprint(product: dict) -> dict:
+    """The product fields the scoring prompts are built from, normalized for cache keys."""
+    details = product.get("details") or {}
+    # Shopping links carry per-click tracking parameters; the page is the same without them
+    link = (product.get("link") or "").split("?", 1)[0].split("#", 1)[0]
+    return {
+        "name": _normalize_text(product.get("name")),
+        "price": _normalize_text(product.get("price")),
+        "firm": _normalize_text(product.get("firm")),
+        "description": _normalize_text(product.get("description")),
+        "availability": details.get("availability") or "",
+        "breadcrumbs": details.get("breadcrumbs") or [],
+        "link": link.split("://", 1)[-1].lower(),
+    }
+
+
+def _score_cache_key(product: dict, user_query: str) -> dict:
+    return {"product": product_fingerprint(product), "query": _normalize_text(user_query)}
+
+
+class SimilarityScore(BaseModel):
+    similarity_score: int = Field(description="0-100. How well the product matches the user's specific request.")
+
+
+def final_score(small_business_score: int, similarity_score: int, trust_score: int) -> int:
+    """Weighted average: 40% Small Biz, 30% Similarity, 30% Trust."""
+    return round(0.4 * small_business_score + 0.3 * similarity_score + 0.3 * trust_score)
+
+
+def score_known_firm(product: dict, user_query: str, firm: dict) -> dict:
+    """Blocking ascore_known_firm()."""
+    return run_on_llm_loop(ascore_known_firm(product, user_query, firm))
+
+
+async def ascore_known_firm(product: dict, user_query: str, firm: dict) -> dict:
+    """
+    Scores a product sold by an indexed firm (see firm_index.py). Its size and trust
+    come from the index and the reasoning from a template; the LLM is only asked how
+    well the product matches the request, with a prompt a fraction of the full one.
+    """
+    details = product.get("details") or {}
+    prompt = f"""Cât de bine se potrivește acest produs cu ce a cerut utilizatorul: "{user_query}"?
+Nume: {product.get('name')}
+Preț: {product.get('price')}
+Descriere: {(product.get('description') or '')[:500]}
+Categorie: {' > '.join(details.get('breadcrumbs') or []) or 'necunoscută'}
+"""
+    try:
+        with tag_llm_calls(stage="score_known_firm"):
+            similarity = (await get_llm_client().astructured_output(
+                messages=[
+                    {"role": "system", "content": "You are a product scoring expert. Always respond with the exact JSON structure requested."},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format=SimilarityScore,
+                temperature=0.3,
+                cache_key=_score_cache_key(product, user_query),
+                prompt_version=SIMILARITY_PROMPT_VERSION,
+            )).similarity_score
+    except Exception as e:
+        print(f"Error scoring similarity for {product.get('name')}: {e}")
+        similarity = 0
+    
+    return {
+        **product,
+        "known_firm": {"name": firm["name"], "size": firm["size"], "matched_by": firm["matched_by"]},
+        "scores": {
+            "small_business_score": firm["small_business_score"],
+            "trust_score": firm["trust_score"],
+            "similarity_score": similarity,
+            "final_score": final_score(firm["small_business_score"], similarity, firm["trust_score"]),
+            "reasoning": f"Disponibil de la {firm['name']}, {firm['description']}."
+        }
+    }
+
+
 def score_product(product: dict, user_query: str) -> dict:
+    """Blocking ascore_product()."""
+    return run_on_llm_loop(ascore_product(product, user_query))
+
+
+async def ascore_product(product: dict, user_query: str) -> dict:
     """
     Scores a single product using the LLM with structured output.
     Uses OpenAI's Structured Outputs API for guaranteed valid responses.
+    Products from firms in the known-firm index take the cheaper ascore_known_firm().
     """
+    firm = known_firm(product)
+    if firm:
+        return await ascore_known_firm(product, user_query, firm)
+    
     client = get_llm_client()
+    details = product.get("details") or {}
     
     prompt = f"""Ești un expert în shopping și analiză de afaceri locale din România.
 Scopul tău este să analizezi acest produs pentru un utilizator din România care vrea să susțină afacerile locale mici.
@@ -51,19 +157,24 @@ Nume: {product.get('name')}
 Preț: {product.get('price')}
 Vânzător/Companie: {product.get('firm')}
 Descriere: {product.get('description')}
+Disponibilitate: {details.get('availability') or 'necunoscută'}
+Categorie: {' > '.join(details.get('breadcrumbs') or []) or 'necunoscută'}
 Link: {product.get('link')}
 """
 
     try:
         # Use structured output API for guaranteed valid response format
-        score_result = client.structured_output(
-            messages=[
-                {"role": "system", "content": "You are a product scoring expert. Always respond with the exact JSON structure requested."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format=ProductScore,
-            temperature=0.3,
-        )
+        with tag_llm_calls(stage="score"):
+            score_result = await client.astructured_output(
+                messages=[
+                    {"role": "system", "content": "You are a product scoring expert. Always respond with the exact JSON structure requested."},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format=ProductScore,
+                temperature=0.3,
+                cache_key=_score_cache_key(product, user_query),
+                prompt_version=SCORE_PROMPT_VERSION,
+            )
         
         return {
             **product,
@@ -83,7 +194,320 @@ Link: {product.get('link')}
             }
         }
 
-def rank_products(products: list[dict], user_query: str, on_product_scored=None) -> list[dict]:
+# Batched scoring: one request scores several products. The instructions and the user
+# query are sent once per batch instead of once per product.
+BATCH_PROMPT = """Ești un expert în shopping și analiză de afaceri locale din România.
+Scopul tău este să analizezi produsele de mai jos pentru un utilizator din România care vrea să susțină afacerile locale mici.
+Utilizatorul a cerut: "{user_query}"
+
+Pentru FIECARE produs, identificat prin ID, dă:
+
+1. **Scor Afacere Mică** (Small Business Score):
+   - Căutăm producători locali, afaceri românești mici.
+   - Dacă vânzătorul este un gigant (eMag, Amazon, Altex, Zara, H&M, AboutYou, Epantofi, Dedeman etc.), dă un scor FOARTE MIC (0-15).
+   - Dacă este o afacere mică/medie românească sau un brand local, dă un scor MARE (85-100).
+
+2. **Scor Încredere** (Trust Score):
+   - Reputație bună -> 80-100.
+   - Lipsă informații -> 50.
+
+3. **Scor Similitudine** (Similarity Score):
+   - Cât de bine se potrivește produsul cu ce a cerut utilizatorul?
+
+4. **Raționament (Reasoning - FOARTE IMPORTANT)**:
+   - Scrie ÎNTOTDEAUNA în limba ROMÂNĂ.
+   - Concentrează-te EXCLUSIV pe COMPANIE/VÂNZĂTOR, nu pe produs:
+     * Este o afacere locală românească sau un lanț mare?
+     * Ce fel de companie este? (atelier, magazin de familie, producător local, brand românesc)
+     * De cât timp există pe piață (dacă știi)?
+     * Ce o face specială sau diferită?
+   - Scrie 2-3 fraze SCURTE și ATRĂGĂTOARE care să invite la cumpărare.
+   - Exemplu pentru afacere mică: "Furnizat de [Firm], un atelier local care creează produse artizanale din 2015. Susține economia locală alegând această afacere românească!"
+   - Exemplu pentru firmă mare: "Disponibil de la [Firm], un retailer de încredere cu livrare rapidă."
+   - NU menționa scoruri sau numere.
+
+5. **Final Score**: Calculate as weighted average: 40% Small Biz, 30% Similarity, 30% Trust.
+
+Răspunde cu câte un rezultat pentru fiecare ID, cu product_id exact ca mai jos.
+
+Produse:
+{products}"""
+
+
+class BatchProductScore(ProductScore):
+    product_id: str = Field(description="The ID of the product being scored, exactly as given (e.g. p3).")
+
+
+class BatchScores(BaseModel):
+    scores: list[BatchProductScore]
+
+
+def _product_block(product_id: str, product: dict) -> str:
+    details = product.get("details") or {}
+    return f"""[{product_id}]
+Nume: {product.get('name')}
+Preț: {product.get('price')}
+Vânzător/Companie: {product.get('firm')}
+Descriere: {product.get('description')}
+Disponibilitate: {details.get('availability') or 'necunoscută'}
+Categorie: {' > '.join(details.get('breadcrumbs') or []) or 'necunoscută'}
+Link: {product.get('link')}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def product_tokens(product: dict) -> int:
+    # Each product also costs its share of the response (scores plus 2-3 sentences)
+    return estimate_tokens(_product_block("p00", product)) + config.RANK_BATCH_OUTPUT_TOKENS_PER_PRODUCT
+
+
+def plan_batches(products: list[dict]) -> list[list[dict]]:
+    """Splits products into batches within config.RANK_BATCH_SIZE and config.RANK_BATCH_TOKEN_BUDGET."""
+    batches = [[]]
+    tokens = 0
+    for product in products:
+        cost = product_tokens(product)
+        batch = batches[-1]
+        if batch and (len(batch) >= config.RANK_BATCH_SIZE or tokens + cost > config.RANK_BATCH_TOKEN_BUDGET):
+            batches.append([])
+            tokens = 0
+        batches[-1].append(product)
+        tokens += cost
+    return [batch for batch in batches if batch]
+
+
+def known_firm(product: dict):
+    """The known-firm index entry for the product's seller, or None (also when the index is off)."""
+    if not config.FIRM_INDEX_ENABLED:
+        return None
+    return get_firm_index().lookup(product.get("firm"), product.get("link"))
+
+
+def _cassette_key(cache_key: dict) -> str:
+    """
+    Cassette entry for one product's share of a batched response. Batches are formed
+    by streaming arrival order and a timer, so a replay rarely rebuilds the recorded
+    batches; each product's score is recorded on its own instead (see recorder.py).
+    """
+    return Cassette.llm_key(kind="batched_score", model=get_llm_client().default_model,
+                            prompt_version=SCORE_PROMPT_VERSION, cache_key=cache_key)
+
+
+async def _replay_batch(products: list[dict], user_query: str, cache_keys: list[dict], cassette: Cassette) -> list[dict]:
+    """Answers a batch from per-product cassette entries, taking as long as the slowest recorded request."""
+    started = time.time()
+    with llm_metrics.measure(get_llm_client().default_model, BatchScores.__name__) as call:
+        call.cache = "replay"
+        recordings = [cassette.llm(_cassette_key(key), count_miss=False) for key in cache_keys]
+        found = [recording for recording in recordings if recording is not None]
+        if found:
+            await asyncio.sleep(cassette.delay(max(recording["seconds"] for recording in found), since=started))
+    # Products recorded outside a batch (alone, or from a cache) have their own request entries
+    missing = [product for product, recording in zip(products, recordings) if recording is None]
+    rescored = iter(await asyncio.gather(*(ascore_product(product, user_query) for product in missing)))
+    return [
+        {**product, "scores": ProductScore.model_validate_json(recording["response"]).model_dump()}
+        if recording is not None else next(rescored)
+        for product, recording in zip(products, recordings)
+    ]
+
+
+def score_batch(products: list[dict], user_query: str) -> list[dict]:
+    """Blocking ascore_batch()."""
+    return run_on_llm_loop(ascore_batch(products, user_query))
+
+
+async def ascore_batch(products: list[dict], user_query: str) -> list[dict]:
+    """
+    Scores several products in one structured-output request; results are in input order.
+    
+    Products from indexed firms take ascore_known_firm() instead (concurrently), and
+    products with a cached score (shared with score_product) are answered from the
+    LLM cache; both are left out of the request. Products missing from the response are
+    re-scored in a smaller batch; if the whole request fails, the batch is split in
+    half and both halves retried concurrently, down to ascore_product() for a single product.
+    """
+    if len(products) <= 1:
+        return [await ascore_product(product, user_query) for product in products]
+    
+    firms = [known_firm(product) for product in products]
+    if any(firms):
+        unknown = [product for product, firm in zip(products, firms) if not firm]
+        batched, *known = await asyncio.gather(
+            ascore_batch(unknown, user_query),
+            *(ascore_known_firm(product, user_query, firm) for product, firm in zip(products, firms) if firm),
+        )
+        batched, known = iter(batched), iter(known)
+        return [next(known) if firm else next(batched) for firm in firms]
+    
+    client = get_llm_client()
+    cache_keys = [_score_cache_key(product, user_query) for product in products]
+    with tag_llm_calls(stage="score"):
+        cached = await asyncio.gather(*(client.acached_output(ProductScore, key, SCORE_PROMPT_VERSION) for key in cache_keys))
+    if any(score is not None for score in cached):
+        misses = [product for product, score in zip(products, cached) if score is None]
+        rescored = iter(await ascore_batch(misses, user_query) if misses else [])
+        return [
+            {**product, "scores": score.model_dump()} if score is not None else next(rescored)
+            for product, score in zip(products, cached)
+        ]
+    
+    cassette = get_cassette()
+    if cassette and cassette.replaying:
+        return await _replay_batch(products, user_query, cache_keys, cassette)
+    
+    ids = [f"p{i + 1}" for i in range(len(products))]
+    prompt = BATCH_PROMPT.format(
+        user_query=user_query,
+        products="\n".join(_product_block(product_id, product) for product_id, product in zip(ids, products))
+    )
+    try:
+        started = time.time()
+        with tag_llm_calls(stage="score_batch"):
+            result = await client.astructured_output(
+                messages=[
+                    {"role": "system", "content": "You are a product scoring expert. Always respond with the exact JSON structure requested."},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format=BatchScores,
+                temperature=0.3,
+            )
+        by_id = {score.product_id.strip().strip("[]"): score for score in result.scores}
+        # Cache each product's score on its own, so later batches (and score_product) can reuse it
+        # (and in the cassette while recording, so a replay can answer differently formed batches)
+        seconds = time.time() - started
+        scores = [
+            (key, ProductScore(**by_id[product_id].model_dump(exclude={"product_id"})))
+            for product_id, key in zip(ids, cache_keys) if product_id in by_id
+        ]
+        if cassette and cassette.recording:
+            for key, score in scores:
+                cassette.record_llm(_cassette_key(key), score.model_dump_json(), seconds)
+        await asyncio.gather(*(client.acache_output(ProductScore, key, SCORE_PROMPT_VERSION, score) for key, score in scores))
+    except Exception as e:
+        print(f"Error scoring batch of {len(products)} products: {e}")
+        by_id = {}
+    
+    if not any(product_id in by_id for product_id in ids):
+        half = len(products) // 2
+        first, second = await asyncio.gather(ascore_batch(products[:half], user_query), ascore_batch(products[half:], user_query))
+        return first + second
+    
+    missing = [product for product_id, product in zip(ids, products) if product_id not in by_id]
+    rescored = iter(await ascore_batch(missing, user_query) if missing else [])
+    scored = []
+    for product_id, product in zip(ids, products):
+        if product_id in by_id:
+            scored.append({**product, "scores": by_id[product_id].model_dump(exclude={"product_id"})})
+        else:
+            scored.append(next(rescored))
+    return scored
+
+
+class BatchScorer:
+    """
+    Collects products that arrive one at a time (streamed from the scraper) into
+    ascore_batch() requests run on the LLM event loop. A batch goes out once it is
+    full (config.RANK_BATCH_SIZE products or the token budget), or once its first
+    product has waited config.RANK_BATCH_WAIT_SECONDS. Products from indexed firms
+    don't wait for a batch: they go out at once, on the short known-firm prompt.
+
+    Queued products are sent most relevant first by their "prerank_score" (see
+    prerank.py): when what's queued fills more than one request, the batch of the
+    best candidates goes out, and reaches the LLM rate limiter's queue, first.
+    """
+    
+    def __init__(self, user_query: str, tags: dict = None):
+        self.user_query = user_query
+        self.tags = tags or {}  # llm_tags for the scoring requests (e.g. task_id)
+        # Reentrant: a batch that is already done runs _finished() inside _send(), under the lock
+        self._lock = threading.RLock()
+        self._pending = []  # (product, Future)
+        self._tokens = 0
+        self._timer = None
+        self._closed = False
+        self._running = set()  # batches sent and not finished
+    
+    def submit(self, product: dict) -> concurrent.futures.Future:
+        """Queue product for scoring. Returns a Future for the scored product."""
+        future = concurrent.futures.Future()
+        cost = product_tokens(product)
+        with self._lock:
+            if self._closed:
+                future.cancel()
+                return future
+            if known_firm(product):
+                self._send([(product, future)])
+                return future
+            self._pending.append((product, future))
+            self._tokens += cost
+            if len(self._pending) >= config.RANK_BATCH_SIZE or self._tokens > config.RANK_BATCH_TOKEN_BUDGET:
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(config.RANK_BATCH_WAIT_SECONDS, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return future
+    
+    def flush(self):
+        """Send whatever is queued now (e.g. once the scraper is done)."""
+        with self._lock:
+            self._flush_locked()
+    
+    def close(self):
+        """The search is over: drop queued products and cancel batches still in flight."""
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            dropped, self._pending = self._pending, []
+            running = list(self._running)
+        for _, future in dropped:
+            future.cancel()
+        for batch_future in running:
+            batch_future.cancel()
+    
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending, self._tokens = self._pending, [], 0
+        # Stable: without pre-rank scores the products keep their arrival order
+        pending.sort(key=lambda item: item[0].get("prerank_score") or 0, reverse=True)
+        items = iter(pending)
+        for batch in plan_batches([product for product, _ in pending]):
+            self._send([next(items) for _ in batch])
+    
+    def _send(self, batch: list):
+        batch_future = submit_on_llm_loop(self._run(batch))
+        self._running.add(batch_future)
+        batch_future.add_done_callback(lambda f: self._finished(f, batch))
+    
+    def _finished(self, batch_future: concurrent.futures.Future, batch: list):
+        with self._lock:
+            self._running.discard(batch_future)
+        if batch_future.cancelled():
+            for _, future in batch:
+                future.cancel()
+    
+    async def _run(self, batch: list):
+        try:
+            with tag_llm_calls(**self.tags):
+                scored = await ascore_batch([product for product, _ in batch], self.user_query)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), scored_product in zip(batch, scored):
+            future.set_result(scored_product)
+
+
+def rank_products(products: list[dict], user_query: str, on_product_scored=None, preranker=None) -> list[dict]:
     """
     Ranks a list of products using LLM-based scoring with integrated web search.
     
@@ -91,7 +515,11 @@ def rank_products(products: list[dict], user_query: str, on_product_scored=None)
         products: List of product dictionaries to score
         user_query: Original user search query
         on_product_scored: Optional callback(scored_product, index, total) called after each product is scored
+        preranker: Optional prerank.LexicalPreRanker; clear mismatches are dropped and the
+            rest are sent to the LLM most relevant first
     """
+    if preranker is not None:
+        products = prerank_products(products, preranker)
     if not products:
         return []
 
@@ -100,15 +528,10 @@ def rank_products(products: list[dict], user_query: str, on_product_scored=None)
     scored_products = []
     total = len(products)
     
-    # We can probably increase max_workers slightly as we are not doing manual scraping anymore, 
-    # but we are hitting OpenAI API which has rate limits.
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        futures = []
-        for product in products:
-            futures.append(executor.submit(score_product, product, user_query))
-            
-        for future in concurrent.futures.as_completed(futures):
-            scored_product = future.result()
+    # All batches run concurrently on the LLM event loop; results are handled here as they land
+    futures = [submit_on_llm_loop(ascore_batch(batch, user_query)) for batch in plan_batches(products)]
+    for future in concurrent.futures.as_completed(futures):
+        for scored_product in future.result():
             scored_products.append(scored_product)
             
             # Call the callback if provided (for streaming)
@@ -0,0 +1,157 @@
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+import config
+
+
+class Cassette:
+    """
+    Recording of everything a search pulls from the network: Google Shopping SERP
+    HTML, product pages (per fetch tier) and LLM responses, each with how long it took.
+
+    In "record" mode the pipeline writes into it as it runs against live services;
+    in "replay" mode the same hooks read from it instead and sleep for the recorded
+    latency (times config.REPLAY_LATENCY_SCALE), so a whole search can be rerun
+    offline with realistic timings. Stored as one gzipped JSON file.
+    """
+
+    def __init__(self, path: str, mode: str):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode!r}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self.data = {"searches": [], "serp": {}, "pages": {}, "llm": {}}
+        self.misses = 0
+
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                self.data.update(json.load(f))
+        elif mode == "replay":
+            raise FileNotFoundError(f"No recording at {path}")
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def save(self):
+        if not self.recording:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def delay(self, seconds: float, since: float = None) -> float:
+        """How much longer a recorded latency (scaled) lasts, optionally measured from `since`."""
+        deadline = (since or time.time()) + (seconds or 0) * config.REPLAY_LATENCY_SCALE
+        return max(0.0, deadline - time.time())
+
+    def wait(self, seconds: float, since: float = None):
+        """Sleep for a recorded latency (scaled), optionally measured from `since`."""
+        remaining = self.delay(seconds, since)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def _get(self, section: str, key: str, count_miss: bool = True) -> Optional[dict]:
+        with self._lock:
+            entry = self.data[section].get(key)
+            if entry is None and count_miss:
+                self.misses += 1
+        return entry
+
+    def _put(self, section: str, key: str, entry: dict):
+        with self._lock:
+            self.data[section][key] = entry
+
+    # ---- searches --------------------------------------------------------
+
+    def add_search(self, query: str, country: str = "US"):
+        with self._lock:
+            if [query, country] not in self.data["searches"]:
+                self.data["searches"].append([query, country])
+
+    # ---- Google Shopping SERP --------------------------------------------
+
+    def record_serp(self, query: str, html: str, card_offsets: list[float], seconds: float):
+        """Final SERP page source plus when each card was emitted (seconds from start)."""
+        self._put("serp", query, {"html": html, "card_offsets": card_offsets, "seconds": seconds})
+
+    def serp(self, query: str) -> Optional[dict]:
+        return self._get("serp", query)
+
+    # ---- product pages ---------------------------------------------------
+
+    def record_page(self, link: str, tier: str, seconds: float, final_url: str = None, html: str = None):
+        """One fetch of a product link by a tier ("http" or "browser"); html=None means it failed."""
+        with self._lock:
+            self.data["pages"].setdefault(link, {})[tier] = {"final_url": final_url, "html": html, "seconds": seconds}
+
+    def page(self, link: str, tier: str) -> Optional[dict]:
+        entry = self._get("pages", link)
+        return entry.get(tier) if entry else None
+
+    # ---- LLM responses ---------------------------------------------------
+
+    @staticmethod
+    def llm_key(**request) -> str:
+        return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+    def record_llm(self, key: str, response: str, seconds: float):
+        self._put("llm", key, {"response": response, "seconds": seconds})
+
+    def llm(self, key: str, count_miss: bool = True) -> Optional[dict]:
+        """count_miss=False for lookups that have another entry to fall back on."""
+        return self._get("llm", key, count_miss)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "searches": len(self.data["searches"]),
+                "serps": len(self.data["serp"]),
+                "pages": len(self.data["pages"]),
+                "llm_responses": len(self.data["llm"]),
+                "misses": self.misses,
+            }
+
+
+_active: Optional[Cassette] = None
+_active_lock = threading.Lock()
+
+
+def use_cassette(path: Optional[str], mode: str = "replay") -> Optional[Cassette]:
+    """Make a cassette the active one for this process (path=None turns recording/replay off)."""
+    global _active
+    with _active_lock:
+        if _active is not None:
+            _active.save()
+        _active = Cassette(path, mode) if path else None
+        return _active
+
+
+def get_cassette() -> Optional[Cassette]:
+    """The active cassette, or None when talking to live services (the default)."""
+    return _active
+
+
+def _save_active():
+    if _active is not None:
+        _active.save()
+
+
+atexit.register(_save_active)
+
+if config.RECORD_MODE in ("record", "replay"):
+    use_cassette(config.RECORDING_PATH, config.RECORD_MODE)
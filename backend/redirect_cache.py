@@ -0,0 +1,80 @@
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import config
+from disk_cache import PersistentCache
+from recorder import get_cassette
+
+# Per-impression tracking parameters on Google links; they change between searches
+# but don't change where the link goes
+_VOLATILE_PARAMS = {"ved", "ei", "sei", "usg", "sig", "sa", "rct", "cd", "uact", "opi", "source", "bih", "biw", "dpr"}
+
+# Parameters that carry the destination itself (/url?q=..., /aclk?...&adurl=...)
+_DESTINATION_PARAMS = ("adurl", "url", "q")
+
+
+@lru_cache()
+def get_redirect_cache() -> PersistentCache:
+    """Process-wide Google link -> final merchant URL cache."""
+    return PersistentCache(
+        "redirects",
+        ttl=config.REDIRECT_CACHE_TTL,
+        max_entries=config.REDIRECT_CACHE_MAX_ENTRIES,
+        memory_entries=4096,
+    )
+
+
+def _recording() -> bool:
+    # While recording, every redirect has to be followed for real so it reaches the cassette
+    cassette = get_cassette()
+    return cassette is not None and cassette.recording
+
+
+def _is_google(url: str) -> bool:
+    host = urlparse(url).hostname or ""
+    return ".google." in f".{host}"
+
+
+def normalize_link(link: str) -> str:
+    """Cache key for a Google link: host + path + stable query params, sorted."""
+    parsed = urlparse(link)
+    params = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k not in _VOLATILE_PARAMS)
+    return f"{parsed.hostname or ''}{parsed.path}?{urlencode(params)}"
+
+
+def _destination_in_link(link: str) -> Optional[str]:
+    """Some Google links spell out their destination; no lookup or navigation needed."""
+    parsed = urlparse(link)
+    if not _is_google(link):
+        return None
+    params = dict(parse_qsl(parsed.query))
+    for name in _DESTINATION_PARAMS:
+        value = params.get(name, "")
+        if value.startswith(("http://", "https://")) and not _is_google(value):
+            return value
+    return None
+
+
+def resolve_link(link: str) -> str:
+    """
+    Best known final URL for a product link, without navigating.
+    Returns the link itself when nothing is known.
+    """
+    if not link or not _is_google(link):
+        return link
+    destination = _destination_in_link(link)
+    if destination:
+        return destination
+    if _recording():
+        return link
+    return get_redirect_cache().get(normalize_link(link)) or link
+
+
+def remember_redirect(link: str, final_url: str):
+    """Record where a Google link led, once it resolved to a merchant page."""
+    if not link or not final_url or final_url == link:
+        return
+    if not _is_google(link) or _is_google(final_url):
+        return
+    get_redirect_cache().set(normalize_link(link), final_url)
@@ -1,35 +1,135 @@
-import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
 import time
 import json
-import random
 import sys
-import os
 import concurrent.futures
+import re
+import queue
 import threading
+import unicodedata
+from collections import Counter, deque
+from functools import lru_cache
 
-def get_products(query):
+import config
+from disk_cache import PersistentCache, MISSING
+from driver_pool import get_driver_pool
+from http_fetcher import get_http_fetcher, fetch_tier_stats
+from html_parser import parse_html
+from redirect_cache import resolve_link, remember_redirect, get_redirect_cache
+from html_archive import get_html_archive
+from page_readiness import PageWait, wait_for_page, wait_for_staleness, domain_of
+from recorder import get_cassette
+from lean_profile import apply_lean_profile, page_load_stats
+from fetch_scheduler import HostScheduler, get_fetch_scheduler
+from deadlines import Hedge, fetch_latency, hedge_stats
+from html_workers import run_html_task, submit_html_task, html_worker_stats
+from product_dedup import ProductDeduplicator, dedup_stats
+
+# Result containers on the Google Shopping SERP (found from debug_page.html)
+RESULT_SELECTOR = '.rwVHAc, .ropLT'
+
+# Returns the HTML of result cards not returned before, so each scroll round only ships
+# and parses what's new. A card counts once it has a link and a real image (what
+# parse_products requires); cards whose image is still lazy-loading are retried next round.
+# Seen cards are tracked in a WeakSet rather than a DOM attribute so the readiness
+# probe's MutationObserver doesn't see our own bookkeeping as page activity.
+_NEW_CARDS_SCRIPT = """
+var seen = window.__seenCards = window.__seenCards || new WeakSet();
+var out = [];
+document.querySelectorAll(arguments[0]).forEach(function (el) {
+    if (seen.has(el)) return;
+    var host = el.closest('a')
+        || (el.classList.contains('rwVHAc') && el.parentElement && el.parentElement.parentElement)
+        || el;
+    var link = host.matches('a[href]') ? host : host.querySelector('a[href]');
+    var img = host.querySelector('img');
+    var hasImage = img && ((img.getAttribute('src') && img.getAttribute('src').indexOf('data:image/gif') !== 0)
+        || img.getAttribute('data-src') || img.getAttribute('data-lsrc'));
+    if (!link || !hasImage) return;
+    seen.add(el);
+    out.push(host.outerHTML);
+});
+return out;
+"""
+
+
+def get_products(query, on_product=None, max_products: int = None, should_stop=None):
     """
     Scrapes Google Shopping for products matching the query using Selenium.
     Returns a list of dictionaries containing product details.
+    
+    Cards are extracted while scrolling: on_product(product) is called for each new
+    deduplicated card as soon as it renders, and scrolling stops once max_products
+    cards have been found, or as soon as should_stop() returns True.
     """
-    options = uc.ChromeOptions()
-    options.add_argument("--headless")  # Run in headless mode
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument("--start-maximized")
-    options.add_argument('--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+    cassette = get_cassette()
+    if cassette and cassette.replaying:
+        return _replay_products(cassette, query, on_product, max_products, should_stop)
+    with get_driver_pool().lease() as driver:
+        return _get_products_with_driver(driver, query, on_product, max_products, should_stop)
 
-    options.add_argument("--disable-gpu")
-    driver = uc.Chrome(options=options, version_main=142)
 
+def _replay_products(cassette, query, on_product=None, max_products=None, should_stop=None):
+    """Replays a recorded SERP: the same cards, each emitted at its recorded time."""
+    started = time.time()
+    recording = cassette.serp(query)
+    if recording is None:
+        print(f"[Replay] No recorded SERP for '{query}'")
+        return []
+    
+    products = {}
+    for product in run_html_task("parse_serp", recording["html"]):
+        products.setdefault((product["name"], product["price"], product["firm"]), product)
+    products = list(products.values())
+    truncated = max_products is not None and len(products) > max_products
+    if truncated:
+        products = products[:max_products]
+    
+    offsets = recording.get("card_offsets") or []
+    for i, product in enumerate(products):
+        cassette.wait(offsets[i] if i < len(offsets) else recording["seconds"], since=started)
+        if should_stop and should_stop():
+            return products[:i]
+        if on_product:
+            on_product(product)
+    if not truncated and not (should_stop and should_stop()):
+        # The live scrape kept scrolling until the results ran out
+        cassette.wait(recording["seconds"], since=started)
+    return products
+
+
+def _get_products_with_driver(driver, query, on_product=None, max_products=None, should_stop=None):
+    products = {} # Use dict for deduplication by (name, price, firm)
+    cassette = get_cassette()
+    started = time.time()
+    card_offsets = []
+    
+    def enough():
+        if should_stop and should_stop():
+            return True
+        return max_products is not None and len(products) >= max_products
+    
+    def collect_new_cards():
+        fragments = driver.execute_script(_NEW_CARDS_SCRIPT, RESULT_SELECTOR)
+        if not fragments:
+            return
+        for product in run_html_task("parse_serp", "<html><body>" + "".join(fragments) + "</body></html>"):
+            if enough():
+                return
+            product_key = (product["name"], product["price"], product["firm"])
+            if product_key in products:
+                continue
+            products[product_key] = product
+            card_offsets.append(round(time.time() - started, 3))
+            if on_product:
+                on_product(product)
+    
     try:
         # Navigate to Google Shopping
+        apply_lean_profile(driver, "https://shopping.google.com/")
         driver.get("https://shopping.google.com/")
         
         # Handle Cookie Consent (if present)
@@ -41,7 +141,7 @@ def get_products(query):
                 EC.element_to_be_clickable((By.XPATH, "//button[contains(., 'Reject all') or contains(., 'Accept all') or contains(., 'I agree') or contains(., 'Respinge') or contains(., 'Acceptă') or contains(., 'Sunt de acord')]"))
             )
             consent_button.click()
-            time.sleep(0.5) # Wait for dialog to close
+            wait_for_staleness(driver, consent_button) # Wait for dialog to close
         except:
             # If no consent button found, maybe we are already good or it's a different layout
             pass
@@ -55,11 +155,16 @@ def get_products(query):
         search_box.send_keys(query)
         search_box.send_keys(Keys.RETURN)
 
-        # Human-like scrolling to trigger lazy loading and avoid detection
-        # Scroll more to get more results
+        # Wait for the first result containers instead of a fixed delay
+        snapshot = wait_for_page(driver, selector=RESULT_SELECTOR, min_matches=1, max_wait=10, learn=False)
+        result_count = snapshot.get("matches", 0)
+        collect_new_cards()
+
+        # Scroll to trigger lazy loading; each round waits only until new results render
         for i in range(5): 
+            if enough():
+                break
             driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(random.uniform(0.5, 1.0))
             
             # Try to click "More results" button if it exists
             try:
@@ -70,220 +175,274 @@ def get_products(query):
                 for btn in more_btns:
                     if btn.is_displayed():
                         driver.execute_script("arguments[0].click();", btn)
-                        time.sleep(0.3)
             except:
                 pass
 
-        # Scroll back up a bit to ensure elements are in view
-        driver.execute_script("window.scrollTo(0, 0);")
-        time.sleep(0.2)
+            snapshot = wait_for_page(driver, selector=RESULT_SELECTOR, min_matches=result_count + 1, max_wait=config.SERP_SCROLL_WAIT, learn=False)
+            collect_new_cards()
+            # Not "ready" can just mean lazy images and beacons kept the page busy;
+            # only a round without new containers means the results ran out
+            matches = snapshot.get("matches", 0)
+            if matches <= result_count:
+                break
+            result_count = matches
 
-        # Get page source and parse with BeautifulSoup
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        
-        products = {} # Use dict for deduplication by key
-        
-        # Selectors found from debug_page.html
-        # Container classes: rwVHAc, ropLT
-        results = soup.select('.rwVHAc, .ropLT')
-        
-        for result in results:
-            try:
-                # Extract Name
-                name_tag = result.select_one('.bXPcId')
-                if not name_tag:
-                    name_tag = result.select_one('h3')
-                
-                name = name_tag.get_text(strip=True) if name_tag else "N/A"
-                
-                if not name or name == "N/A":
-                    continue
+        # Last pass for cards whose images finished loading after their round
+        collect_new_cards()
 
-                # Extract Price
-                price_tag = result.select_one('.M3sJBb')
-                if not price_tag:
-                    price_tag = result.select_one('span[aria-hidden="true"]') 
+    except Exception as e:
+        print(f"Error scraping Google Shopping: {e}")
 
-                price = price_tag.get_text(strip=True) if price_tag else "N/A"
-                
-                # Fix for sale prices: Google concatenates original and sale price (e.g., "699RON599RON")
-                # Extract only the last price (the actual sale price)
-                if price and price != "N/A":
-                    import re
-                    # Match price patterns like "123 lei", "123,45 RON", "123.45 Lei", etc.
-                    price_pattern = r'(\d+(?:[.,]\d+)?\s*(?:lei|RON|Lei|ron|LEI))'
-                    matches = re.findall(price_pattern, price, re.IGNORECASE)
-                    if matches:
-                        # Take the last match (which is typically the sale/current price)
-                        price = matches[-1].strip()
-
-                # Extract Link
-                link_tag = None
-                
-                # Special handling for rwVHAc (Ads) - Link/Image is in grandparent
-                if 'rwVHAc' in result.get('class', []):
-                    grandparent = result.parent.parent if result.parent else None
-                    if grandparent:
-                        link_tag = grandparent.find('a')
-                        # Also find image in grandparent
-                        img_tag = grandparent.find('img')
+    if cassette and cassette.recording:
+        try:
+            cassette.record_serp(query, driver.page_source, card_offsets, round(time.time() - started, 3))
+        except Exception as e:
+            print(f"[Recorder] Failed to record SERP for '{query}': {e}")
+
+    return list(products.values())
+
+
+def parse_products(html: str, backend: str = None) -> list[dict]:
+    """
+    Extracts deduplicated product cards from a Google Shopping results page.
+    Uses the configured HTML parser backend (see html_parser.parse_html).
+    """
+    root = parse_html(html, backend)
+    
+    products = {} # Use dict for deduplication by key
+    
+    # Selectors found from debug_page.html
+    # Container classes: rwVHAc, ropLT
+    results = root.select(RESULT_SELECTOR)
+    
+    for result in results:
+        try:
+            # Extract Name
+            name_tag = result.select_one('.bXPcId')
+            if not name_tag:
+                name_tag = result.select_one('h3')
+            
+            name = name_tag.get_text(strip=True) if name_tag else "N/A"
+            
+            if not name or name == "N/A":
+                continue
+
+            # Extract Price
+            price_tag = result.select_one('.M3sJBb')
+            if not price_tag:
+                price_tag = result.select_one('span[aria-hidden="true"]') 
+
+            price = price_tag.get_text(strip=True) if price_tag else "N/A"
+            
+            # Fix for sale prices: Google concatenates original and sale price (e.g., "699RON599RON")
+            # Extract only the last price (the actual sale price)
+            if price and price != "N/A":
+                # Match price patterns like "123 lei", "123,45 RON", "123.45 Lei", etc.
+                price_pattern = r'(\d+(?:[.,]\d+)?\s*(?:lei|RON|Lei|ron|LEI))'
+                matches = re.findall(price_pattern, price, re.IGNORECASE)
+                if matches:
+                    # Take the last match (which is typically the sale/current price)
+                    price = matches[-1].strip()
+
+            # Extract Link
+            link_tag = None
+            img_tag = None
+            
+            # Special handling for rwVHAc (Ads) - Link/Image is in grandparent
+            if 'rwVHAc' in result.classes:
+                grandparent = result.parent.parent if result.parent else None
+                if grandparent:
+                    link_tag = grandparent.select_one('a')
+                    # Also find image in grandparent
+                    img_tag = grandparent.select_one('img')
+            
+            # Fallback / Standard handling for ropLT or if above failed
+            if not link_tag:
+                if result.name == 'a':
+                    link_tag = result
+                else:
+                    link_tag = result.select_one('a')
                 
-                # Fallback / Standard handling for ropLT or if above failed
                 if not link_tag:
-                    if result.name == 'a':
-                        link_tag = result
-                    else:
-                        link_tag = result.select_one('a')
-                    
-                    if not link_tag:
-                        curr = result
-                        for _ in range(5):
-                            if curr.name == 'a':
-                                link_tag = curr
-                                break
-                            curr = curr.parent
-                            if not curr: break
-                
-                link = link_tag['href'] if link_tag else ""
-                if link.startswith('/'):
-                    link = "https://www.google.com" + link
-
-                # Extract Image
-                image = ""
-                # If we didn't find img_tag in grandparent logic above
-                if 'rwVHAc' not in result.get('class', []) or not img_tag:
-                    img_tag = result.select_one('img')
-                
-                if img_tag:
-                    # Prioritize data-src/lsrc as they are often higher res or the real image
-                    image = img_tag.get('src')
-                    if not image or image.startswith('data:image/gif'):
-                        image = img_tag.get('data-src') or img_tag.get('data-lsrc') or ""
-                
-                # Extract Firm (Seller)
-                firm_tag = result.select_one('.CsnLnf')
-                firm = firm_tag.get_text(strip=True) if firm_tag else "N/A"
-                
-                # Extract Description
-                description = name 
+                    curr = result
+                    for _ in range(5):
+                        if curr.name == 'a':
+                            link_tag = curr
+                            break
+                        curr = curr.parent
+                        if not curr: break
+            
+            link = (link_tag.get('href') or "") if link_tag else ""
+            if link.startswith('/'):
+                link = "https://www.google.com" + link
 
-                # Deduplication and Merging
-                product_key = (name, price, firm)
-                
-                new_product = {
-                    "name": name,
-                    "price": price,
-                    "link": link,
-                    "image": image,
-                    "firm": firm,
-                    "description": description
-                }
-
-                # STRICT FILTER: User requires BOTH image and link.
-                if not link or not image:
-                    continue
+            # Extract Image
+            image = ""
+            # If we didn't find img_tag in grandparent logic above
+            if 'rwVHAc' not in result.classes or not img_tag:
+                img_tag = result.select_one('img')
+            
+            if img_tag:
+                # Prioritize data-src/lsrc as they are often higher res or the real image
+                image = img_tag.get('src')
+                if not image or image.startswith('data:image/gif'):
+                    image = img_tag.get('data-src') or img_tag.get('data-lsrc') or ""
+            
+            # Extract Firm (Seller)
+            firm_tag = result.select_one('.CsnLnf')
+            firm = firm_tag.get_text(strip=True) if firm_tag else "N/A"
+            
+            # Extract Description
+            description = name 
 
-                if product_key in products:
-                    existing = products[product_key]
-                    if not existing['link'] and link:
-                        products[product_key] = new_product
-                    elif not existing['image'] and image and (link or not existing['link']):
-                        products[product_key] = new_product
-                else:
-                    if name != "N/A":
-                        products[product_key] = new_product
+            # Deduplication and Merging
+            product_key = (name, price, firm)
+            
+            new_product = {
+                "name": name,
+                "price": price,
+                "link": link,
+                "image": image,
+                "firm": firm,
+                "description": description
+            }
 
-            except Exception as e:
+            # STRICT FILTER: User requires BOTH image and link.
+            if not link or not image:
                 continue
 
-        return list(products.values())
+            if product_key in products:
+                existing = products[product_key]
+                if not existing['link'] and link:
+                    products[product_key] = new_product
+                elif not existing['image'] and image and (link or not existing['link']):
+                    products[product_key] = new_product
+            else:
+                if name != "N/A":
+                    products[product_key] = new_product
 
-    except Exception as e:
-        print(f"Error scraping Google Shopping: {e}")
-        return []
+        except Exception as e:
+            continue
+
+    return list(products.values())
+
+@lru_cache()
+def get_serp_cache() -> PersistentCache:
+    """Process-wide cache of parsed Google Shopping result lists."""
+    return PersistentCache("serp", ttl=config.SERP_CACHE_TTL, max_entries=config.SERP_CACHE_MAX_ENTRIES, memory_entries=256)
+
+
+def normalize_query(query: str) -> str:
+    """Cache key form of a query: lowercase, no diacritics or punctuation, single spaces."""
+    text = unicodedata.normalize("NFKD", query.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+_serp_refreshing = set()
+_serp_refresh_lock = threading.Lock()
+
+
+def _refresh_serp(key: str, query: str, max_products: int = None):
+    try:
+        products = get_products(query, max_products=max_products)
+        if products:
+            get_serp_cache().set(key, {"products": products, "max_products": max_products})
+            print(f"[SerpCache] Refreshed '{query}' ({len(products)} products)")
     finally:
-        driver.quit()
+        with _serp_refresh_lock:
+            _serp_refreshing.discard(key)
+
+
+def get_products_cached(query: str, country: str = "US", on_product=None, max_products: int = None, should_stop=None) -> list[dict]:
+    """
+    get_products() behind a persistent SERP cache keyed by normalized query and country.
+    Fresh entries are returned directly. Stale entries are returned immediately too,
+    while a single background refresh re-scrapes the query for next time.
+    on_product/max_products/should_stop behave as in get_products (cached cards are
+    replayed at once). A scrape cut short by should_stop isn't cached, and a search
+    that has already stopped doesn't start a refresh.
+    The cache is bypassed while recording a cassette, so every SERP reaches it.
+    """
+    cassette = get_cassette()
+    if cassette is not None and cassette.recording:
+        return get_products(query, on_product=on_product, max_products=max_products, should_stop=should_stop)
+    
+    key = f"{country.upper()}|{normalize_query(query)}"
+    cache = get_serp_cache()
+    entry, is_stale = cache.get_entry(key)
+    
+    # A scrape that stopped early at a smaller max_products can't answer a bigger request
+    if entry is not MISSING:
+        scraped_limit = entry["max_products"]
+        truncated = scraped_limit is not None and len(entry["products"]) >= scraped_limit
+        if truncated and (max_products is None or max_products > scraped_limit):
+            entry = MISSING
+    
+    if entry is not MISSING:
+        if is_stale and not (should_stop and should_stop()):
+            with _serp_refresh_lock:
+                start_refresh = key not in _serp_refreshing
+                _serp_refreshing.add(key)
+            if start_refresh:
+                threading.Thread(target=_refresh_serp, args=(key, query, entry["max_products"]), daemon=True).start()
+        products = entry["products"][:max_products] if max_products else entry["products"]
+        print(f"[SerpCache] {'Stale' if is_stale else 'Fresh'} hit for '{query}' ({len(products)} products)")
+        if on_product:
+            for product in products:
+                on_product(product)
+        return products
+    
+    products = get_products(query, on_product=on_product, max_products=max_products, should_stop=should_stop)
+    # An empty list is usually a scrape failure (consent wall, layout change); don't pin it
+    if products and not (should_stop and should_stop()):
+        cache.set(key, {"products": products, "max_products": max_products})
+    return products
 
-driver_lock = threading.Lock()
 
-def fetch_details_for_chunk(chunk, html_dir):
+def fetch_details_for_chunk(chunk, archive_query):
     """
-    Worker function to process a chunk of products with a dedicated Selenium driver.
+    Worker function to process a chunk of products with a leased Selenium driver.
     Optimized for speed: Single tab, eager loading, minimal waits.
     """
     detailed_chunk = []
     
-    options = uc.ChromeOptions()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument("--start-maximized")
-    options.add_argument('--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
-    options.page_load_strategy = 'eager' 
-    
-    driver = None
+    pool = get_driver_pool()
     try:
-        with driver_lock:
-            options.add_argument("--disable-gpu")
-            driver = uc.Chrome(options=options, version_main=142)
+        entry = pool.acquire()
     except Exception as e:
-        print(f"Worker failed to start driver: {e}")
+        print(f"Worker failed to lease driver: {e}")
         return []
+    driver = entry.driver
 
     try:
         for product in chunk:
             link = product.get("link")
             if not link:
-                detailed_chunk.append({**product, "html_text": ""})
+                detailed_chunk.append({**product, "details": None})
                 continue
             
             try:
-                driver.get(link)
-                # Eager strategy returns early. Wait for interactive state.
-                try:
-                    WebDriverWait(driver, 10).until(
-                        lambda d: d.execute_script("return document.readyState") == "interactive" or d.execute_script("return document.readyState") == "complete"
-                    )
-                except:
-                    pass
-                
-                # Buffer to ensure content rendering
-                time.sleep(1.5)
+                target = resolve_link(link)
+                started = time.time()
+                apply_lean_profile(driver, target)
+                driver.get(target)
+                # Eager strategy returns early. Wait until the page has rendered and gone quiet.
+                wait_for_page(driver, url=target)
+                page_load_stats.record(driver, time.time() - started)
                 
-                final_url = driver.current_url
-
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-                html_text = str(soup)
-                
-                detailed_chunk.append({
-                    **product,
-                    "link": final_url,
-                    "google_link": link,
-                    "html_text": html_text
-                })
-                
-                safe_name = "".join([c if c.isalnum() else "_" for c in product['name']])[:50]
-                file_name = f"{html_dir}/{safe_name}_{random.randint(1000,9999)}.html"
-                with open(file_name, "w", encoding="utf-8") as f:
-                    f.write(html_text)
+                detailed_chunk.append(_build_detailed_product(product, driver.current_url, driver.page_source, archive_query))
 
             except Exception as e:
                 print(f"Failed to fetch {link}: {e}")
-                detailed_chunk.append({
-                    **product,
-                    "html_text": ""
-                })
+                detailed_chunk.append({**product, "details": None})
     finally:
-        if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+        pool.release(entry)
         
     return detailed_chunk
 
-def scrape_google_products(query: str, max_products: int = 50) -> list[dict]:
+def scrape_google_products(query: str, max_products: int = 50, country: str = "US") -> list[dict]:
     """
     Orchestrates the scraping of Google Shopping for products matching the query.
     1. Gets initial list of products.
@@ -292,19 +451,12 @@ def scrape_google_products(query: str, max_products: int = 50) -> list[dict]:
     """
     print(f"Starting scraping for query: '{query}'")
     
-    # 1. Get initial results (Single Threaded)
-    results = get_products(query)
-    
-    # Limit to max products for the detailed scrape
-    products = results[:max_products]
+    # 1. Get initial results (Single Threaded), limited to max products for the detailed scrape
+    products = get_products_cached(query, country, max_products=max_products)
     
     print(f"\nFound {len(products)} products. Starting parallel detailed fetch...")
     
-    # Create directory for HTML files
     safe_query = "".join([c if c.isalnum() else "_" for c in query])
-    html_dir = f"html_{safe_query}"
-    if not os.path.exists(html_dir):
-        os.makedirs(html_dir)
 
     # 2. Parallel Processing
     # Split products into chunks
@@ -322,7 +474,7 @@ def scrape_google_products(query: str, max_products: int = 50) -> list[dict]:
     try:
         with concurrent.futures.ThreadPoolExecutor(max_workers=NUM_WORKERS) as executor:
             # Submit all chunks
-            future_to_chunk = {executor.submit(fetch_details_for_chunk, chunk, html_dir): chunk for chunk in product_chunks}
+            future_to_chunk = {executor.submit(fetch_details_for_chunk, chunk, query): chunk for chunk in product_chunks}
             
             for future in concurrent.futures.as_completed(future_to_chunk):
                 try:
@@ -341,134 +493,513 @@ def scrape_google_products(query: str, max_products: int = 50) -> list[dict]:
         json.dump(detailed_products, f, indent=2, ensure_ascii=False)
     
     print(f"\nDetailed results saved to {filename}")
-    print(f"HTML files saved to {html_dir}/")
+    print(f"HTML pages archived to {config.HTML_ARCHIVE_DIR}/")
     
     return detailed_products
 
 
-def fetch_single_product_details(product: dict, html_dir: str, driver_lock: threading.Lock) -> dict:
+def fetch_single_product_details(product: dict, archive_query: str) -> dict:
     """
     Fetches details for a single product. Used by streaming scraper.
-    Creates its own driver for isolation.
+    Leases a warm driver from the shared pool.
     """
-    options = uc.ChromeOptions()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument('--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36')
-    options.page_load_strategy = 'eager'
-    options.add_argument("--disable-gpu")
-    
     link = product.get("link")
     if not link:
-        return {**product, "html_text": ""}
+        return {**product, "details": None}
     
-    driver = None
+    cassette = get_cassette()
+    started = time.time()
     try:
-        with driver_lock:
-            driver = uc.Chrome(options=options, version_main=142)
+        if cassette and cassette.replaying:
+            final_url, page_source, reason = _replay_page(cassette, link, "browser", started)
+            if reason:
+                raise RuntimeError(reason)
+        else:
+            with get_driver_pool().lease() as driver:
+                # Go straight to the merchant page when we already know where the Google link leads
+                target = resolve_link(link)
+                apply_lean_profile(driver, target)
+                driver.get(target)
+                wait_for_page(driver, url=target)
+                page_load_stats.record(driver, time.time() - started)
+                
+                final_url = driver.current_url
+                page_source = driver.page_source
+            if cassette and cassette.recording:
+                cassette.record_page(link, "browser", time.time() - started, final_url, page_source)
         
-        driver.get(link)
-        try:
-            WebDriverWait(driver, 8).until(
-                lambda d: d.execute_script("return document.readyState") in ["interactive", "complete"]
-            )
-        except:
-            pass
+        return _build_detailed_product(product, final_url, page_source, archive_query)
+        
+    except Exception as e:
+        print(f"Failed to fetch {link}: {e}")
+        if cassette and cassette.recording:
+            cassette.record_page(link, "browser", time.time() - started)
+        return {**product, "details": None}
+
+
+def _replay_page(cassette, link: str, tier: str, started: float):
+    """A recorded fetch of link by tier, after its recorded latency: (final_url, html, failure reason)."""
+    recording = cassette.page(link, tier)
+    if recording is None:
+        return link, None, "not recorded"
+    cassette.wait(recording["seconds"], since=started)
+    if not recording["html"]:
+        return link, None, "failed when recorded"
+    return recording["final_url"], recording["html"], None
+
+
+def fetch_host_key(product: dict) -> str:
+    """
+    Host a product page will be fetched from, for per-host scheduling: the merchant
+    domain, or the seller name while the link is still an unresolved Google redirect.
+    """
+    host = domain_of(resolve_link(product.get("link") or ""))
+    if ".google." in f".{host}":
+        return f"seller:{product.get('firm') or host}"
+    return host
+
+
+# Fallback reasons that mean the host is pushing back, not that the page needs JS
+_THROTTLE_REASONS = ("blocked", "bot wall", "request failed")
+
+
+def fetch_product_details_http(product: dict, archive_query: str):
+    """
+    HTTP tier of detail fetching: resolves redirects and downloads the page with the
+    pooled keep-alive client. Returns the detailed product, or None when the page
+    looks like a JS shell or bot wall and needs the browser path.
+    """
+    link = product.get("link")
+    if not link:
+        return {**product, "details": None}
+    
+    cassette = get_cassette()
+    started = time.time()
+    final_url, page_source = link, None
+    try:
+        if cassette and cassette.replaying:
+            final_url, page_source, reason = _replay_page(cassette, link, "http", started)
+        else:
+            final_url, page_source, reason = get_http_fetcher().fetch(resolve_link(link))
+    except Exception as e:
+        reason = f"request failed ({type(e).__name__})"
+    
+    if cassette and cassette.recording:
+        cassette.record_page(link, "http", time.time() - started, final_url, None if reason else page_source)
+    
+    if reason:
+        if reason.startswith(_THROTTLE_REASONS):
+            get_fetch_scheduler().penalize(fetch_host_key(product))
+        fetch_tier_stats.record("browser", reason)
+        return None
+    
+    fetch_tier_stats.record("http")
+    return _build_detailed_product(product, final_url, page_source, archive_query)
+
+
+def fetch_product_details(product: dict, archive_query: str) -> dict:
+    """Fetches details for one product, trying plain HTTP before a browser."""
+    if config.HTTP_FIRST_FETCH:
+        detailed_product = fetch_product_details_http(product, archive_query)
+        if detailed_product is not None:
+            return detailed_product
+    else:
+        fetch_tier_stats.record("browser")
+    return fetch_single_product_details(product, archive_query)
+
+
+def _build_detailed_product(product: dict, final_url: str, page_source: str, archive_query: str) -> dict:
+    """
+    Turns a fetched page into the detailed product dict and archives its HTML.
+    The page is distilled into a compact "details" record right here; the raw HTML
+    only goes to the archive and is not carried through ranking, task state or JSON output.
+    """
+    return _finish_detailed_product(product, final_url, _start_detailed_product(product, final_url, page_source, archive_query))
+
+
+def _start_detailed_product(product: dict, final_url: str, page_source: str, archive_query: str) -> concurrent.futures.Future:
+    """Archives the page and starts distilling it (in an HTML worker process for large pages)."""
+    remember_redirect(product.get("link"), final_url)
+    
+    # Archive the raw page source (content-addressed, compressed, written off-thread)
+    if config.HTML_ARCHIVE_ENABLED:
+        get_html_archive().submit(final_url, page_source, query=archive_query, name=product.get('name'))
+    
+    return submit_html_task("distill", page_source, final_url)
+
+
+def _finish_detailed_product(product: dict, final_url: str, distilled: concurrent.futures.Future) -> dict:
+    try:
+        details = distilled.result()
+    except Exception as e:
+        print(f"Failed to distill {final_url}: {e}")
+        details = {}
+    
+    # What the page states about itself (schema.org data) beats the SERP card
+    from_page = set(details.get("from_structured_data") or [])
+    firm = product.get("firm")
+    if "seller" in from_page or (not firm or firm == "N/A") and details.get("seller"):
+        firm = details["seller"]
+    
+    return {
+        **product,
+        "link": final_url,
+        "google_link": product.get("link"),
+        "price": details["price"] if "price" in from_page else product.get("price"),
+        "firm": firm,
+        # Real page text beats the SERP's description = name
+        "description": details.get("description") or product.get("description"),
+        "details": details
+    }
+
+
+# Set on the old document right before navigating a tab; the new document won't have it,
+# so the readiness probe can tell the tab still shows the previous page.
+_TAB_NAVIGATE_SCRIPT = "window.__tabPending = true; window.location.href = arguments[0];"
+
+
+def fetch_details_in_tabs(
+    products,
+    archive_query: str,
+    num_tabs: int = None,
+    on_product_ready=None,
+    stop_event: threading.Event = None
+) -> list[dict]:
+    """
+    Fetches product details using N tabs of a single leased browser.
+    Tabs load concurrently inside Chrome; this thread round-robins over them,
+    collecting current_url and page source as each page becomes ready and then
+    reusing the tab for the next product. One browser replaces the per-product fan-out.
+    Pages are distilled in the HTML worker pool while this thread keeps driving tabs.
+    
+    Args:
+        products: Products to fetch: a list, or a queue.Queue fed while we run and
+            terminated with None (the browser is only leased once work arrives)
+        archive_query: Search query the pages are archived under
+        num_tabs: Tabs to keep loading at once (defaults to config.DETAIL_TABS_PER_BROWSER)
+        on_product_ready: Optional callback(detailed_product) called as each product completes
+        stop_event: Optional event; once set, tabs still loading are abandoned and we return
+    """
+    num_tabs = num_tabs or config.DETAIL_TABS_PER_BROWSER
+    detailed_products = []
+    
+    def stopped():
+        return stop_event is not None and stop_event.is_set()
+    
+    def emit(detailed_product):
+        detailed_products.append(detailed_product)
+        if on_product_ready:
+            on_product_ready(detailed_product)
+    
+    if isinstance(products, queue.Queue):
+        source = products
+    else:
+        source = queue.Queue()
+        for product in products:
+            source.put(product)
+        source.put(None)
+    
+    waiting = deque()
+    source_done = False
+    distilling = []  # one future per page handed to the HTML workers, resolved once emitted
+    
+    def emit_when_distilled(product, final_url, distilled):
+        emitted = concurrent.futures.Future()
+        distilling.append(emitted)
         
-        time.sleep(0.5)  # Reduced for speed
+        def done(_):
+            try:
+                emit(_finish_detailed_product(product, final_url, distilled))
+            finally:
+                emitted.set_result(None)
+        distilled.add_done_callback(done)
+    
+    def pull(block: bool):
+        """Move newly arrived products into `waiting`. Returns False once the source is exhausted."""
+        nonlocal source_done
+        while not source_done:
+            try:
+                product = source.get(timeout=config.READY_POLL_SECONDS) if block else source.get_nowait()
+            except queue.Empty:
+                return True
+            block = False
+            if product is None:
+                source_done = True
+            elif product.get("link"):
+                waiting.append(product)
+            else:
+                emit({**product, "details": None})
+        return not source_done
+    
+    # Don't hold a browser until there's something to load
+    while not waiting and not stopped() and pull(block=True):
+        pass
+    if not waiting or stopped():
+        return detailed_products
+    
+    with get_driver_pool().lease() as driver:
+        tabs = {}  # window handle -> (product, PageWait, host)
+        idle_tabs = []  # opened tabs with nothing to load right now
         
-        final_url = driver.current_url
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        html_text = str(soup)
+        def next_product():
+            """First waiting product whose host isn't already at its limit of loading tabs."""
+            loading = Counter(host for _, _, host in tabs.values())
+            for i, product in enumerate(waiting):
+                if loading[fetch_host_key(product)] < config.FETCH_PER_HOST_LIMIT:
+                    del waiting[i]
+                    return product
+            return None
         
-        # Save HTML file
-        if html_dir:
-            safe_name = "".join([c if c.isalnum() else "_" for c in product['name']])[:50]
-            file_name = f"{html_dir}/{safe_name}_{random.randint(1000,9999)}.html"
-            with open(file_name, "w", encoding="utf-8") as f:
-                f.write(html_text)
+        def start(handle, product):
+            driver.switch_to.window(handle)
+            target = resolve_link(product["link"])
+            apply_lean_profile(driver, target, handle)
+            driver.execute_script(_TAB_NAVIGATE_SCRIPT, target)
+            tabs[handle] = (product, PageWait(url=target), fetch_host_key(product))
         
-        return {
-            **product,
-            "link": final_url,
-            "google_link": link,
-            "html_text": html_text
-        }
+        def fill_tabs():
+            while idle_tabs or len(tabs) < num_tabs:
+                product = next_product()
+                if product is None:
+                    return
+                try:
+                    if idle_tabs:
+                        handle = idle_tabs.pop()
+                    elif not tabs:
+                        handle = driver.current_window_handle
+                    else:
+                        driver.switch_to.new_window('tab')
+                        handle = driver.current_window_handle
+                    start(handle, product)
+                except Exception as e:
+                    print(f"Failed to start tab: {e}")
+                    emit({**product, "details": None})
         
-    except Exception as e:
-        print(f"Failed to fetch {link}: {e}")
-        return {**product, "html_text": ""}
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+        fill_tabs()
+        while (tabs or waiting or not source_done) and not stopped():
+            pull(block=not tabs and not waiting)
+            fill_tabs()
+            
+            for handle in list(tabs):
+                product, page_wait, _ = tabs[handle]
+                try:
+                    driver.switch_to.window(handle)
+                    snapshot = page_wait.poll(driver)
+                except Exception as e:
+                    print(f"Failed to poll tab for {product['link']}: {e}")
+                    snapshot = {}
+                
+                if snapshot is None:
+                    continue
+                
+                cassette = get_cassette()
+                try:
+                    if not snapshot.get("state"):
+                        raise RuntimeError("tab became unresponsive")
+                    final_url, page_source = driver.current_url, driver.page_source
+                    page_load_stats.record(driver, time.time() - page_wait.started_at, handle)
+                    if cassette and cassette.recording:
+                        cassette.record_page(product["link"], "browser", time.time() - page_wait.started_at, final_url, page_source)
+                    emit_when_distilled(product, final_url, _start_detailed_product(product, final_url, page_source, archive_query))
+                except Exception as e:
+                    print(f"Failed to fetch {product['link']}: {e}")
+                    if cassette and cassette.recording:
+                        cassette.record_page(product["link"], "browser", time.time() - page_wait.started_at)
+                    emit({**product, "details": None})
+                
+                del tabs[handle]
+                idle_tabs.append(handle)
+                fill_tabs()
+            
+            if tabs:
+                time.sleep(config.READY_POLL_SECONDS)
+    
+    if not stopped():
+        concurrent.futures.wait(distilling)
+    return detailed_products
 
 
 def scrape_google_products_streaming(
     query: str,
     max_products: int = 20,
-    on_product_ready=None
+    on_product_ready=None,
+    country: str = "US",
+    deadline=None,
+    stop_event: threading.Event = None
 ) -> list[dict]:
     """
     Streaming version of scraper: calls on_product_ready(product) as soon as
     each product's details are fetched, allowing parallel ranking.
     
+    The stages overlap: SERP cards are streamed out of get_products while it is
+    still scrolling, each card goes straight to the HTTP tier, and pages that need
+    a browser are fed to the browser tier as they are found.
+    
+    Near-duplicate cards (same seller, nearly the same name) are collapsed before
+    fetching (see product_dedup.py): only the first card of each cluster is fetched
+    and streamed, carrying the others in its "duplicates" list.
+    
+    Detail fetches that run past the tier's usual latency (config.HEDGE_PERCENTILE)
+    get a hedged duplicate; the first to finish is used. Fetching stops when the
+    deadline runs out or stop_event is set, and whatever arrived by then is returned.
+    
     Args:
         query: Search query
         max_products: Max products to scrape
         on_product_ready: Callback(product_dict) called immediately when each product is ready
+        country: Country code, part of the SERP cache key
+        deadline: Optional deadlines.Deadline for the whole scrape
+        stop_event: Optional event the caller sets once it has enough products
     
     Returns:
         List of all detailed products (for compatibility)
     """
     print(f"[Streaming] Starting scrape for: '{query}'")
     
-    # 1. Get initial results
-    results = get_products(query)
-    products = results[:max_products]
+    safe_query = "".join([c if c.isalnum() else "_" for c in query])
+    # Set by this thread once it stops waiting (done, cut off, or told to stop)
+    halt = threading.Event()
     
-    print(f"[Streaming] Found {len(products)} products. Starting parallel detail fetch...")
+    def stopping() -> bool:
+        return halt.is_set() or (stop_event is not None and stop_event.is_set()) or (deadline is not None and deadline.expired())
     
-    if not products:
-        return []
+    detailed_products = []
+    hedges = []
+    results_lock = threading.Lock()
     
-    # Create HTML directory
-    safe_query = "".join([c if c.isalnum() else "_" for c in query])
-    html_dir = f"html_{safe_query}"
-    if not os.path.exists(html_dir):
-        os.makedirs(html_dir)
+    def on_detail_ready(detailed_product):
+        with results_lock:
+            # Results landing after the cutoff are dropped: the caller has moved on
+            if halt.is_set():
+                return
+            detailed_products.append(detailed_product)
+        # Stream to caller immediately!
+        if on_product_ready and detailed_product.get("details") is not None:
+            on_product_ready(detailed_product)
+        print(f"[Streaming] Product ready: {detailed_product.get('name', 'Unknown')[:40]}")
     
-    detailed_products = []
-    local_driver_lock = threading.Lock()
+    # Tier 2: browser, fed through a queue as the HTTP tier gives up on pages
+    browser_queue = queue.Queue()
     
-    # Use ThreadPoolExecutor to fetch details in parallel
-    NUM_WORKERS = 6
+    def run_browser_tier():
+        cassette = get_cassette()
+        replaying = cassette is not None and cassette.replaying
+        if config.DETAIL_FETCH_MODE == "tabs" and not replaying:
+            # One browser, many tabs: far less memory per search than a browser per worker.
+            # A slow tab isn't hedged here; the readiness budget already caps it.
+            fetch_details_in_tabs(browser_queue, query, on_product_ready=on_detail_ready, stop_event=halt)
+            return
+        # Fetch details in parallel, one pooled browser per worker, interleaving hosts
+        # (a replay only sleeps, so it mimics the live concurrency without any browser)
+        if replaying:
+            NUM_WORKERS = config.DETAIL_TABS_PER_BROWSER if config.DETAIL_FETCH_MODE == "tabs" else config.DRIVER_POOL_SIZE
+        else:
+            NUM_WORKERS = get_driver_pool().size
+        scheduler = HostScheduler(max_workers=NUM_WORKERS, name="browser-fetch")
+        for product in iter(browser_queue.get, None):
+            hedges.append(Hedge(
+                lambda fn, *args, key=fetch_host_key(product): scheduler.submit(key, fn, *args),
+                lambda product=product: fetch_or_fail(fetch_single_product_details, product),
+                fetch_latency["browser"].hedge_after(),
+                on_detail_ready,
+                tracker=fetch_latency["browser"],
+            ))
+        scheduler.shutdown(wait=not stopping(), cancel_pending=stopping())
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=NUM_WORKERS) as executor:
-        # Submit all products for detail fetching
-        future_to_product = {
-            executor.submit(fetch_single_product_details, p, html_dir, local_driver_lock): p
-            for p in products
-        }
-        
-        # As each completes, call the callback immediately
-        for future in concurrent.futures.as_completed(future_to_product):
-            try:
-                detailed_product = future.result()
-                detailed_products.append(detailed_product)
-                
-                # Stream to caller immediately!
-                if on_product_ready and detailed_product.get("html_text"):
-                    on_product_ready(detailed_product)
-                    
-                print(f"[Streaming] Product ready: {detailed_product.get('name', 'Unknown')[:40]}")
-                
-            except Exception as e:
-                print(f"[Streaming] Worker error: {e}")
+    def fetch_or_fail(fetch, product):
+        try:
+            return fetch(product, query)
+        except Exception as e:
+            print(f"[Streaming] Worker error: {e}")
+            return None if fetch is fetch_product_details_http else {**product, "details": None}
+    
+    browser_thread = threading.Thread(target=run_browser_tier, daemon=True)
+    browser_thread.start()
+    
+    # Tier 1: plain HTTP for every card as soon as it comes off the SERP, scheduled
+    # per merchant host; only JS shells and bot walls go on to the browser tier
+    counts = {"http": 0, "browser": 0}
+    
+    def route_http_result(product, detailed_product):
+        if detailed_product is None:
+            counts["browser"] += 1
+            browser_queue.put(product)
+        else:
+            counts["http"] += 1
+            on_detail_ready(detailed_product)
+    
+    dedup = ProductDeduplicator() if config.DEDUP_ENABLED else None
+    
+    def on_card(product):
+        if stopping():
+            return
+        if dedup is not None:
+            product = dedup.add(product)
+            if product is None:
+                return
+        if config.HTTP_FIRST_FETCH:
+            scheduler = get_fetch_scheduler()
+            hedges.append(Hedge(
+                lambda fn, *args, key=fetch_host_key(product): scheduler.submit(key, fn, *args),
+                lambda: fetch_or_fail(fetch_product_details_http, product),
+                fetch_latency["http"].hedge_after(),
+                lambda detailed_product: route_http_result(product, detailed_product),
+                tracker=fetch_latency["http"],
+            ))
+        else:
+            fetch_tier_stats.record("browser")
+            counts["browser"] += 1
+            browser_queue.put(product)
+    
+    def wait_for(done: threading.Event) -> bool:
+        """Wait until done, the deadline passes or stop_event is set. True if done."""
+        while not done.is_set():
+            if stopping():
+                return False
+            done.wait(timeout=min(0.2, deadline.remaining()) if deadline else 0.2)
+        return True
+    
+    # 1. Stream SERP cards (served from the SERP cache when possible)
+    products = []
+    try:
+        products = get_products_cached(query, country, on_product=on_card, max_products=max_products, should_stop=stopping)
+        print(f"[Streaming] Found {len(products)} products")
+    finally:
+        # 2. Let the HTTP tier finish (it may still hand pages to the browser tier)
+        for hedge in list(hedges):
+            if not wait_for(hedge.done):
+                break
+        browser_queue.put(None)
+    
+    if config.HTTP_FIRST_FETCH:
+        print(f"[Streaming] {counts['http']} fetched over HTTP, {counts['browser']} need a browser")
+    
+    # 3. Then the browser tier
+    browser_done = threading.Event()
+    threading.Thread(target=lambda: (browser_thread.join(), browser_done.set()), daemon=True).start()
+    wait_for(browser_done)
+    if stopping():
+        print(f"[Streaming] Cut off with {len(detailed_products)} products "
+              f"({'deadline' if deadline and deadline.expired() else 'enough products'})")
+    
+    # Anything still running or queued is abandoned
+    with results_lock:
+        halt.set()
+        detailed_products = list(detailed_products)
+    for hedge in hedges:
+        hedge.cancel()
+    
+    print(f"[Streaming] Fetch tiers so far: {fetch_tier_stats.snapshot()}")
+    print(f"[Streaming] Redirect cache: {get_redirect_cache().stats()}")
+    print(f"[Streaming] SERP cache: {get_serp_cache().stats()}")
+    print(f"[Streaming] Page loads: {page_load_stats.snapshot()}")
+    print(f"[Streaming] HTML workers: {html_worker_stats.snapshot()}")
+    print(f"[Streaming] HTTP fetch scheduler: {get_fetch_scheduler().stats()}")
+    print(f"[Streaming] Hedged fetches: {hedge_stats.snapshot()}")
+    print(f"[Streaming] Near-duplicate cards: {dedup_stats.snapshot()}")
+    
+    if not products:
+        return []
     
     # Save results file
     filename = f"products_{safe_query}.json"
@@ -0,0 +1,266 @@
+import html as html_lib
+import json
+import re
+
+# Everything here works on the raw HTML with regexes: no DOM is built, so pages that
+# carry schema.org data can skip the distiller's parse entirely.
+
+_JSON_LD_RE = re.compile(
+    r'<script[^>]*type\s*=\s*["\']?application/ld\+json["\']?[^>]*>(.*?)</script\s*>',
+    re.IGNORECASE | re.DOTALL,
+)
+_META_RE = re.compile(r'<meta\b[^>]*>', re.IGNORECASE)
+_ATTR_RE = re.compile(r'([a-zA-Z_:][-a-zA-Z0-9_:.]*)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+_TAG_RE = re.compile(r'<[^>]+>')
+
+# schema.org availability -> the labels product_distiller uses
+_AVAILABILITY = {
+    "instock": "in_stock",
+    "instoreonly": "in_stock",
+    "onlineonly": "in_stock",
+    "limitedavailability": "limited",
+    "preorder": "preorder",
+    "presale": "preorder",
+    "backorder": "preorder",
+    "outofstock": "out_of_stock",
+    "soldout": "out_of_stock",
+    "discontinued": "out_of_stock",
+}
+
+_OG_FIELDS = {
+    "og:title": "title",
+    "og:description": "description",
+    "og:site_name": "site_name",
+    "product:price:amount": "price",
+    "og:price:amount": "price",
+    "product:price:currency": "currency",
+    "og:price:currency": "currency",
+    "product:availability": "availability",
+    "og:availability": "availability",
+    "product:brand": "brand",
+}
+
+_MICRODATA_FIELDS = {
+    "price": "price",
+    "pricecurrency": "currency",
+    "availability": "availability",
+    "brand": "brand",
+    "sku": "sku",
+    "gtin13": "gtin",
+    "gtin": "gtin",
+}
+
+
+def _attrs(tag: str) -> dict:
+    return {m.group(1).lower(): html_lib.unescape(m.group(2) or m.group(3) or m.group(4) or "") for m in _ATTR_RE.finditer(tag)}
+
+
+def _text(value) -> str:
+    """Plain text from a JSON-LD string value, which may carry HTML and entities."""
+    if isinstance(value, dict):
+        value = value.get("name") or value.get("@value") or ""
+    if isinstance(value, list):
+        value = value[0] if value else ""
+    if value is None:
+        return ""
+    text = html_lib.unescape(_TAG_RE.sub(" ", str(value)))
+    return " ".join(text.split())
+
+
+def _types(node: dict) -> set[str]:
+    types = node.get("@type") or []
+    if isinstance(types, str):
+        types = [types]
+    return {str(t).rsplit("/", 1)[-1] for t in types}
+
+
+def _walk(data):
+    """Every JSON-LD object, including those nested in @graph, lists and mainEntity."""
+    if isinstance(data, list):
+        for item in data:
+            yield from _walk(item)
+    elif isinstance(data, dict):
+        yield data
+        for key in ("@graph", "mainEntity", "itemListElement"):
+            if key in data:
+                yield from _walk(data[key])
+
+
+def normalize_availability(value: str) -> str:
+    key = re.sub(r'[^a-z]', '', str(value or "").rsplit("/", 1)[-1].lower())
+    return _AVAILABILITY.get(key, "")
+
+
+def normalize_price(value) -> str:
+    """'1.299,99', '1299.99' or 1299.99 -> '1299.99'."""
+    text = re.sub(r'[^\d.,]', '', str(value if value is not None else ""))
+    if not text:
+        return ""
+    if "," in text and "." in text:
+        # Whichever separator comes last is the decimal one
+        text = text.replace(".", "").replace(",", ".") if text.rfind(",") > text.rfind(".") else text.replace(",", "")
+    elif "," in text:
+        whole, _, decimals = text.rpartition(",")
+        text = f"{whole.replace(',', '')}.{decimals}" if len(decimals) != 3 else text.replace(",", "")
+    elif text.count(".") > 1 or (text.count(".") == 1 and len(text.rpartition(".")[2]) == 3):
+        # "1.299" is a thousands separator in Romanian prices
+        text = text.replace(".", "")
+    try:
+        return f"{float(text):.2f}"
+    except ValueError:
+        return ""
+
+
+def _first_offer(offers):
+    if isinstance(offers, list):
+        offers = next((o for o in offers if isinstance(o, dict)), None)
+    if not isinstance(offers, dict):
+        return {}
+    # AggregateOffer may hold the individual offers
+    if "AggregateOffer" in _types(offers) and not (offers.get("price") or offers.get("lowPrice")) and offers.get("offers"):
+        return _first_offer(offers["offers"])
+    return offers
+
+
+def _from_json_ld(blocks: list) -> dict:
+    products = []
+    crumbs = []
+    for block in blocks:
+        for node in _walk(block):
+            types = _types(node)
+            if "Product" in types or "ProductGroup" in types:
+                products.append(node)
+            elif "BreadcrumbList" in types and not crumbs:
+                for element in node.get("itemListElement") or []:
+                    if isinstance(element, dict):
+                        crumb = _text(element.get("name") or element.get("item"))
+                        if not crumb.startswith(("http://", "https://", "/")):
+                            crumbs.append(crumb)
+    if not products and not crumbs:
+        return {}
+
+    result = {"breadcrumbs": [c for c in crumbs if c][:8]}
+    if not products:
+        return result
+    # The page's own product is the one with an offer (related products usually have none)
+    product = next((p for p in products if p.get("offers")), products[0])
+    offer = _first_offer(product.get("offers"))
+    spec = offer.get("priceSpecification") or {}
+    if isinstance(spec, list):
+        spec = spec[0] if spec else {}
+    rating = product.get("aggregateRating") or {}
+    seller = offer.get("seller") or {}
+
+    result.update({
+        "title": _text(product.get("name")),
+        "description": _text(product.get("description")),
+        "price": normalize_price(offer.get("price") or offer.get("lowPrice") or (spec.get("price") if isinstance(spec, dict) else "")),
+        "currency": _text(offer.get("priceCurrency") or (spec.get("priceCurrency") if isinstance(spec, dict) else "")),
+        "availability": normalize_availability(offer.get("availability")),
+        "brand": _text(product.get("brand")),
+        "seller": _text(seller) if isinstance(seller, (dict, str)) else "",
+        "sku": _text(product.get("sku")),
+        "gtin": _text(product.get("gtin13") or product.get("gtin") or product.get("gtin14") or product.get("gtin8")),
+        "rating": _text(rating.get("ratingValue")) if isinstance(rating, dict) else "",
+        "review_count": _text(rating.get("reviewCount") or rating.get("ratingCount")) if isinstance(rating, dict) else "",
+    })
+    return result
+
+
+def _json_ld_blocks(html: str) -> list:
+    blocks = []
+    for raw in _JSON_LD_RE.findall(html):
+        raw = raw.strip()
+        if raw.startswith("<!--"):
+            raw = raw[4:].rsplit("-->", 1)[0]
+        try:
+            # strict=False: shops often leave raw newlines/tabs inside strings
+            blocks.append(json.loads(raw, strict=False))
+        except ValueError:
+            continue
+    return blocks
+
+
+def _from_meta(html: str) -> dict:
+    result = {}
+    for tag in _META_RE.findall(html):
+        attrs = _attrs(tag)
+        key = (attrs.get("property") or attrs.get("name") or "").lower()
+        field = _OG_FIELDS.get(key)
+        if field and attrs.get("content") and field not in result:
+            result[field] = " ".join(attrs["content"].split())
+    if "price" in result:
+        result["price"] = normalize_price(result["price"])
+    if "availability" in result:
+        result["availability"] = normalize_availability(result["availability"]) or _loose_availability(result["availability"])
+    return result
+
+
+def _loose_availability(value: str) -> str:
+    value = value.lower().replace(" ", "")
+    return "in_stock" if value in ("instock", "in_stock") else "out_of_stock" if value in ("oos", "outofstock", "out_of_stock") else ""
+
+
+def _itemprop_tags(html: str):
+    """Tags carrying an itemprop attribute. A plain substring scan: a tag regex backtracks badly on 400KB pages."""
+    pos = html.find("itemprop")
+    while pos != -1:
+        start = html.rfind("<", 0, pos)
+        end = html.find(">", pos)
+        if end == -1:
+            return
+        if start != -1:
+            yield html[start:end + 1]
+        pos = html.find("itemprop", end)
+
+
+def _from_microdata(html: str) -> dict:
+    """Microdata carried in attributes (content= / href=). Values only present as element text need a DOM."""
+    result = {}
+    for tag in _itemprop_tags(html):
+        attrs = _attrs(tag)
+        field = _MICRODATA_FIELDS.get(attrs.get("itemprop", "").lower())
+        value = attrs.get("content") or attrs.get("href") or ""
+        if field and value and field not in result:
+            result[field] = value.strip()
+    if "price" in result:
+        result["price"] = normalize_price(result["price"])
+    if "availability" in result:
+        result["availability"] = normalize_availability(result["availability"])
+    return result
+
+
+def extract_structured_data(html: str) -> dict:
+    """
+    Product facts a page states about itself, from JSON-LD first, then OpenGraph /
+    product meta tags, then attribute-based microdata. Keys (only when found):
+    title, description, price ("1299.99"), currency, availability, brand, seller,
+    site_name, sku, gtin, rating, review_count, breadcrumbs; plus "sources".
+    """
+    if not html:
+        return {}
+    result = {}
+    sources = []
+    for name, extract in (
+        ("json-ld", lambda: _from_json_ld(_json_ld_blocks(html))),
+        ("opengraph", lambda: _from_meta(html)),
+        ("microdata", lambda: _from_microdata(html)),
+    ):
+        if name == "microdata" and result.get("price") and result.get("availability"):
+            break  # microdata only ever adds offer fields we already have
+        data = extract()
+        added = False
+        for key, value in data.items():
+            if value and not result.get(key):
+                result[key] = value
+                added = True
+        if added:
+            sources.append(name)
+    if result:
+        result["sources"] = sources
+    return result
+
+
+def is_complete(data: dict) -> bool:
+    """Enough to describe the product without looking at the rest of the page."""
+    return bool(data.get("title") and data.get("price") and len(data.get("description") or "") >= 40)
@@ -0,0 +1,43 @@
+"""Known-firm lookup: python -m unittest test_firm_index (or pytest) from backend/."""
+import unittest
+
+from firm_index import get_firm_index
+
+
+class FirmIndexLookupTest(unittest.TestCase):
+    def setUp(self):
+        self.index = get_firm_index()
+
+    def matched_name(self, seller, link=None):
+        firm = self.index.lookup(seller, link)
+        return firm and firm["name"]
+
+    def test_name_with_legal_form_or_alias(self):
+        self.assertEqual(self.matched_name("EMAG S.R.L."), "eMAG")
+        self.assertEqual(self.matched_name("Altex Romania"), "Altex")
+
+    def test_chain_store_named_after_its_location(self):
+        self.assertEqual(self.matched_name("Leroy Merlin Pipera"), "Leroy Merlin")
+        self.assertEqual(self.matched_name("Dedeman Cluj Napoca 2"), "Dedeman")
+
+    def test_small_shop_sharing_a_chain_name_is_not_matched(self):
+        self.assertIsNone(self.matched_name("Mango Boutique Cluj"))
+        self.assertIsNone(self.matched_name("Noriel Toys"))
+        self.assertIsNone(self.matched_name("Elefant Handmade"))
+
+    def test_marketplace_domain_only_without_a_seller_name(self):
+        self.assertEqual(self.matched_name("N/A", "https://www.emag.ro/set-lego/pd/D1"), "eMAG")
+        self.assertEqual(self.matched_name(None, "https://www.amazon.de/dp/B0"), "Amazon")
+        self.assertEqual(self.matched_name("eMAG", "https://www.emag.ro/set-lego/pd/D1"), "eMAG")
+        # A third-party seller on the marketplace is not the marketplace
+        self.assertIsNone(self.matched_name("Atelierul de Jucarii", "https://www.emag.ro/set-lego/pd/D1"))
+
+    def test_fuzzy_match_only_for_long_names(self):
+        self.assertEqual(self.matched_name("Leroy Merlinn"), "Leroy Merlin")
+        self.assertIsNone(self.matched_name("Mangox"))
+        self.assertIsNone(self.matched_name("Altexx"))
+        self.assertIsNone(self.matched_name("Dedemann"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+HTTP tier against a local stand-in server: python -m unittest test_http_fetcher
+(or pytest) from backend/.
+"""
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from http_fetcher import HttpPageFetcher, needs_browser
+
+_DESCRIPTION = "Set de construcție LEGO Star Wars cu 1267 de piese, pentru copii de peste 18 ani. " * 12
+
+# A real shop page: reCAPTCHA for its newsletter form, Cloudflare's bot-management script, product JSON-LD
+PRODUCT_WITH_RECAPTCHA = f"""<html><head><title>LEGO Star Wars - AT-AT (75313) | Magazin</title>
+<script src="https://www.gstatic.com/recaptcha/releases/abc/recaptcha__en.js"></script>
+<script id="captcha-bootstrap">window.captchaKeys = {{}};</script>
+<script src="/cdn-cgi/challenge-platform/scripts/jsd/main.js"></script>
+<script type="application/ld+json">{{"@type": "Product", "name": "AT-AT"}}</script>
+</head><body><h1>LEGO Star Wars - AT-AT (75313)</h1><p>{_DESCRIPTION}</p>
+<form><div class="g-recaptcha" data-sitekey="x"></div></form></body></html>"""
+
+CLOUDFLARE_CHALLENGE = """<html><head><title>Just a moment...</title></head><body>
+<script>window._cf_chl_opt = {cvId: '3'};</script>
+<script src="/cdn-cgi/challenge-platform/h/b/orchestrate/chl_page/v1"></script></body></html>"""
+
+CAPTCHA_ONLY = f"""<html><head><title>Verificare</title></head><body>
+<p>{"Confirmați că nu sunteți un robot pentru a continua. " * 10}</p>
+<div class="g-recaptcha" data-sitekey="x"></div></body></html>"""
+
+ACCESS_DENIED = f"""<html><head><title>Access Denied</title></head><body><p>{"You don't have permission. " * 30}</p></body></html>"""
+
+JS_SHELL = """<html><head><title>Shop</title></head><body><div id="root"></div><script src="/app.js"></script></body></html>"""
+
+REDIRECT = """<html><head><meta http-equiv="refresh" content="0; url=/product"></head></html>"""
+
+PAGES = {
+    "/product": (200, PRODUCT_WITH_RECAPTCHA),
+    "/challenge": (503, CLOUDFLARE_CHALLENGE),
+    "/challenge-200": (200, CLOUDFLARE_CHALLENGE),
+    "/captcha": (200, CAPTCHA_ONLY),
+    "/denied": (200, ACCESS_DENIED),
+    "/shell": (200, JS_SHELL),
+    "/redirect": (200, REDIRECT),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, body = PAGES.get(self.path, (404, "not found"))
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpFetcherTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        cls.fetcher = HttpPageFetcher()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fetcher.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def fetch(self, path):
+        return self.fetcher.fetch(self.base + path)
+
+    def test_product_page_embedding_recaptcha_is_usable(self):
+        final_url, html, reason = self.fetch("/product")
+        self.assertIsNone(reason)
+        self.assertIn("AT-AT", html)
+
+    def test_meta_refresh_is_followed(self):
+        final_url, html, reason = self.fetch("/redirect")
+        self.assertEqual(final_url, self.base + "/product")
+        self.assertIsNone(reason)
+
+    def test_cloudflare_challenge_is_a_bot_wall(self):
+        self.assertEqual(self.fetch("/challenge")[2], "blocked (503)")
+        self.assertTrue(self.fetch("/challenge-200")[2].startswith("bot wall"))
+
+    def test_access_denied_title_is_a_bot_wall(self):
+        self.assertTrue(self.fetch("/denied")[2].startswith("bot wall"))
+
+    def test_captcha_only_page_needs_browser_but_is_not_a_bot_wall(self):
+        # Not a "bot wall", so the scraper doesn't penalize the host for it
+        self.assertTrue(self.fetch("/captcha")[2].startswith("captcha page"))
+
+    def test_js_shell_needs_browser(self):
+        self.assertTrue(self.fetch("/shell")[2].startswith("js shell"))
+
+    def test_needs_browser_on_unresolved_google_redirect(self):
+        self.assertEqual(needs_browser(200, "https://www.google.com/url?q=x", PRODUCT_WITH_RECAPTCHA), "unresolved google redirect")
+
+
+if __name__ == "__main__":
+    unittest.main()
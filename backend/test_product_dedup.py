@@ -0,0 +1,55 @@
+"""Near-duplicate card clustering: python -m unittest test_product_dedup (or pytest) from backend/."""
+import unittest
+
+from product_dedup import ProductDeduplicator, _price_value, expand_duplicates
+
+
+def card(name, price, firm="Noriel", link=None):
+    return {"name": name, "price": price, "firm": firm, "link": link or f"https://shop.ro/{name}/{price}"}
+
+
+class PriceValueTest(unittest.TestCase):
+    def test_romanian_thousands_separators(self):
+        self.assertEqual(_price_value("1.299,99 lei"), 1299.99)
+        self.assertEqual(_price_value("1299,99 lei"), 1299.99)
+        self.assertEqual(_price_value("1 299,99 lei"), 1299.99)
+        self.assertEqual(_price_value("1.299 lei"), 1299.0)
+        self.assertEqual(_price_value("1299.99 RON"), 1299.99)
+
+    def test_missing_price(self):
+        self.assertIsNone(_price_value("N/A"))
+        self.assertIsNone(_price_value(None))
+
+
+class ProductDeduplicatorTest(unittest.TestCase):
+    def test_same_listing_written_differently_is_collapsed(self):
+        dedup = ProductDeduplicator()
+        first = dedup.add(card("LEGO® Star Wars - Tie Bomber (75347)", "1.299,99 lei"))
+        self.assertIsNotNone(first)
+        self.assertIsNone(dedup.add(card("LEGO Star Wars - Tie Bomber  (75347)", "1299,99 lei")))
+        self.assertEqual(len(first["duplicates"]), 1)
+
+    def test_price_gap_with_thousands_separators_is_kept(self):
+        # 1299.99 vs 1399.99: about 7% apart, more than DEDUP_MAX_PRICE_DIFF
+        dedup = ProductDeduplicator()
+        dedup.add(card("LEGO Star Wars - Tie Bomber (75347)", "1.299,99 lei"))
+        self.assertIsNotNone(dedup.add(card("LEGO Star Wars - Tie Bomber (75347)", "1.399,99 lei")))
+
+    def test_different_set_number_or_seller_is_kept(self):
+        dedup = ProductDeduplicator()
+        dedup.add(card("LEGO Star Wars - AT-AT (75313)", "3.999 lei"))
+        self.assertIsNotNone(dedup.add(card("LEGO Star Wars - AT-AT (75288)", "3.999 lei")))
+        self.assertIsNotNone(dedup.add(card("LEGO Star Wars - AT-AT (75313)", "3.999 lei", firm="Atelier Mic")))
+
+    def test_duplicates_take_the_representative_scores(self):
+        dedup = ProductDeduplicator()
+        first = dedup.add(card("Figurine Lego Star Wars - 73 piese", "319,99 lei"))
+        dedup.add(card("Figurine Lego Star Wars - 73piese", "319,99 lei"))
+        expanded = expand_duplicates({**first, "scores": {"final_score": 80}})
+        self.assertEqual([p["scores"]["final_score"] for p in expanded], [80, 80])
+        self.assertNotIn("duplicates", expanded[0])
+        self.assertEqual(expanded[1]["duplicate_of"], first["link"])
+
+
+if __name__ == "__main__":
+    unittest.main()
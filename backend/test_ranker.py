@@ -0,0 +1,55 @@
+"""BatchScorer batching, without calling the LLM: python -m unittest test_ranker (or pytest) from backend/."""
+import concurrent.futures
+import unittest
+from unittest import mock
+
+import config
+import ranker
+
+
+def product(name, prerank_score=None):
+    card = {"name": name, "price": "100 lei", "firm": "Atelier Mic", "link": f"https://atelier-mic.ro/{name}"}
+    if prerank_score is not None:
+        card["prerank_score"] = prerank_score
+    return card
+
+
+class BatchScorerOrderTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+
+        def submit_on_llm_loop(batch):
+            self.sent.append([product["name"] for product, _ in batch])
+            return concurrent.futures.Future()
+
+        # Every product costs 100 tokens: a fourth one overflows a 350-token request
+        patches = [
+            mock.patch.object(ranker.BatchScorer, "_run", lambda self, batch: batch),
+            mock.patch.object(ranker, "submit_on_llm_loop", submit_on_llm_loop),
+            mock.patch.object(ranker, "known_firm", lambda product: None),
+            mock.patch.object(ranker, "product_tokens", lambda product: 100),
+            mock.patch.object(config, "RANK_BATCH_SIZE", 8),
+            mock.patch.object(config, "RANK_BATCH_TOKEN_BUDGET", 350),
+            mock.patch.object(config, "RANK_BATCH_WAIT_SECONDS", 60.0),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def score(self, products):
+        scorer = ranker.BatchScorer("lego star wars")
+        for card in products:
+            scorer.submit(card)
+        scorer.close()
+        return self.sent
+
+    def test_best_candidates_go_out_first(self):
+        sent = self.score([product("a", 1.0), product("b", 7.5), product("c", 0.2), product("d", 3.0)])
+        self.assertEqual(sent, [["b", "d", "a"], ["c"]])
+
+    def test_arrival_order_without_prerank_scores(self):
+        self.assertEqual(self.score([product(name) for name in "abcd"]), [["a", "b", "c"], ["d"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""SERP scroll loop against a stand-in browser: python -m unittest test_scraper (or pytest) from backend/."""
+import unittest
+from unittest import mock
+
+import scraper
+
+
+class _FakeElement:
+    def click(self):
+        pass
+
+    def clear(self):
+        pass
+
+    def send_keys(self, *keys):
+        pass
+
+    def is_displayed(self):
+        return False
+
+
+class _FakeWait:
+    def __init__(self, driver, timeout, **kwargs):
+        pass
+
+    def until(self, condition):
+        return _FakeElement()
+
+
+class _FakeDriver:
+    """Renders `batches[i]` new cards after the i-th scroll round."""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.rendered = 0
+        self.shipped = 0
+        self.scrolls = 0
+        self.page_source = "<html></html>"
+        self.current_window_handle = "tab"
+
+    def get(self, url):
+        pass
+
+    def execute_cdp_cmd(self, cmd, args):
+        return {}
+
+    def find_elements(self, by, value):
+        return []
+
+    def execute_script(self, script, *args):
+        if script == scraper._NEW_CARDS_SCRIPT:
+            fragments = [f"<card {i}>" for i in range(self.shipped, self.rendered)]
+            self.shipped = self.rendered
+            return fragments
+        if "scrollTo" in script:
+            self.scrolls += 1
+        return None
+
+    def wait_for_page(self, driver, **kwargs):
+        # Cards render, but the page never goes quiet: "ready" stays False
+        if self.batches:
+            self.rendered += self.batches.pop(0)
+        return {"ready": False, "matches": self.rendered}
+
+
+class SerpScrollTest(unittest.TestCase):
+    def scrape(self, batches, **kwargs):
+        driver = _FakeDriver(batches)
+        parsed = []
+
+        def parse(task, html):
+            products = [{"name": f"card {len(parsed) + i}", "price": "1 lei", "firm": "Shop"} for i in range(html.count("<card "))]
+            parsed.extend(products)
+            return products
+
+        with mock.patch.object(scraper, "wait_for_page", driver.wait_for_page), \
+                mock.patch.object(scraper, "WebDriverWait", _FakeWait), \
+                mock.patch.object(scraper, "wait_for_staleness", lambda *args, **kwargs: True), \
+                mock.patch.object(scraper, "run_html_task", parse), \
+                mock.patch.object(scraper, "get_cassette", lambda: None):
+            products = scraper._get_products_with_driver(driver, "lego star wars", **kwargs)
+        return driver, products
+
+    def test_keeps_scrolling_while_cards_render_on_a_busy_page(self):
+        driver, products = self.scrape([10, 10, 10, 10, 10, 10])
+        self.assertEqual(len(products), 60)
+        self.assertEqual(driver.scrolls, 5)
+
+    def test_stops_when_a_round_adds_no_cards(self):
+        driver, products = self.scrape([10, 10, 0, 10, 10, 10])
+        self.assertEqual(len(products), 20)
+        self.assertEqual(driver.scrolls, 2)
+
+    def test_stops_scrolling_once_the_search_stops(self):
+        stopped = []
+        driver, products = self.scrape([10, 10, 10, 10, 10, 10], on_product=stopped.append, should_stop=lambda: len(stopped) >= 15)
+        self.assertEqual(len(products), 15)
+        self.assertEqual(driver.scrolls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,20 +10,20 @@ def verify_json(filepath):
         total = len(data)
         missing_link = 0
         missing_image = 0
-        missing_html = 0
+        missing_details = 0
         
         for item in data:
             if not item.get('link'):
                 missing_link += 1
             if not item.get('image'):
                 missing_image += 1
-            if not item.get('html_text'):
-                missing_html += 1
+            if not item.get('details'):
+                missing_details += 1
                 
         print(f"Total Products: {total}")
         print(f"Missing Link: {missing_link}")
         print(f"Missing Image: {missing_image}")
-        print(f"Missing HTML text: {missing_html}")
+        print(f"Missing page details: {missing_details}")
         
     except Exception as e:
         print(f"Error: {e}")